@@ -11,9 +11,12 @@
 
 
 import os
+import requests
 from darksky.api import DarkSky
 from darksky.types import languages, units, weather
 from dotenv import load_dotenv
+from providers import wind_direction, hourlyColumns, MAX_HOURS, HTTP_TIMEOUT
+from records import Current, DayForecast
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -26,92 +29,125 @@ DARKSKY_LONGITUDE = os.environ.get('DARKSKY_LONGITUDE')
 DARKSKY_LATITUDE = os.environ.get('DARKSKY_LATITUDE')
 DARKSKY_LANGUAGE = os.environ.get('DARKSKY_LANGUAGE')
 DARKSKY_UNITS = os.environ.get('DARKSKY_UNITS')
+# another API endpoint, e.g. a local stand-in for testing
+DARKSKY_HOST = os.environ.get('DARKSKY_HOST')
 
 MAX_DAYS = 4
-MAX_HOURS = 24
-
-
-def wind_direction(degrees):
-    """ Convert wind degrees to direction """
-    try:
-        degrees = int(degrees)
-    except ValueError:
-        return ''
-
-    if degrees < 23 or degrees >= 338:
-        return 'N'
-    elif degrees < 68:
-        return 'NE'
-    elif degrees < 113:
-        return 'E'
-    elif degrees < 158:
-        return 'SE'
-    elif degrees < 203:
-        return 'S'
-    elif degrees < 248:
-        return 'SW'
-    elif degrees < 293:
-        return 'W'
-    elif degrees < 338:
-        return 'NW'
 
-
-def fetchDarkSkyWeather():
-    dark_sky = DarkSky(DARKSKY_API_KEY)
-
-    forecast = dark_sky.get_forecast(
-        DARKSKY_LATITUDE, DARKSKY_LONGITUDE,
+dark_sky = None
+
+
+class TimeoutSession(requests.Session):
+    """ The client's session, with the timeouts it does not set itself """
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault('timeout', HTTP_TIMEOUT)
+        return super().request(*args, **kwargs)
+
+
+def darkSkyClient():
+    # one client (and HTTP session) for the life of the process
+    global dark_sky
+    if dark_sky is None:
+        dark_sky = DarkSky(DARKSKY_API_KEY)
+        # without a timeout a hung request would keep its acquire thread for good
+        session = TimeoutSession()
+        session.headers = dark_sky.request_manager.headers
+        dark_sky.request_manager.session = session
+        if DARKSKY_HOST:
+            dark_sky.HOST = DARKSKY_HOST
+    return dark_sky
+
+
+def requestDarkSkyWeather(blocks, location=None):
+    """
+    Fetch and normalize the given blocks ('currently', 'daily', 'hourly') from
+    DarkSky for `location` (latitude, longitude), by default the configured one
+    """
+    latitude, longitude = location or (DARKSKY_LATITUDE, DARKSKY_LONGITUDE)
+    exclude = [weather.MINUTELY, weather.ALERTS]
+    if 'currently' not in blocks:
+        exclude.append(weather.CURRENTLY)
+    if 'hourly' not in blocks:
+        exclude.append(weather.HOURLY)
+
+    forecast = darkSkyClient().get_forecast(
+        latitude, longitude,
         extend=False,
         lang=getattr(languages, DARKSKY_LANGUAGE, 'ENGLISH'),
         units=getattr(units, DARKSKY_UNITS, 'SU'),
-        exclude=[weather.MINUTELY, weather.ALERTS, weather.HOURLY]
+        exclude=exclude
     )
 
-    cur_weather = forecast.currently
-    # hourly_weather = forecast.hourly.data
     daily_weather = forecast.daily.data[0:MAX_DAYS+1]
 
+    result = {'daily': normalizeDaily(daily_weather)}
+    if 'currently' in blocks:
+        result['currently'] = normalizeCurrent(forecast.currently, daily_weather, forecast.flags.units)
+    if 'hourly' in blocks:
+        result['hourly'] = normalizeHourly(forecast.hourly.data[0:MAX_HOURS])
+    return result
+
+
+def normalizeCurrent(cur_weather, daily_weather, unit_type):
     # CURRENT
-    CURRENT = {
-        'summary':              cur_weather.summary,
-        'icon':                 cur_weather.icon,
-        'precip_probability':   round(int(daily_weather[0].precip_probability * 100), -1),
-        'precip_type':          cur_weather.precip_type,
-        'temperature':          round(cur_weather.temperature, 1),
-        'humidity':             int(cur_weather.humidity * 100),
-        'wind_speed':           cur_weather.wind_speed,
-        'wind_bearing':         cur_weather.wind_bearing,
-        'pressure':             round(cur_weather.pressure),
-        'wind_direction':       wind_direction(cur_weather.wind_bearing),
-        'cloud_cover':          int(cur_weather.cloud_cover * 100),
-        'units':                forecast.flags.units
-    }
+    CURRENT = Current(
+        summary=cur_weather.summary,
+        icon=cur_weather.icon,
+        precip_probability=round(int(daily_weather[0].precip_probability * 100), -1),
+        precip_type=cur_weather.precip_type,
+        temperature=round(cur_weather.temperature, 1),
+        humidity=int(cur_weather.humidity * 100),
+        wind_speed=cur_weather.wind_speed,
+        wind_bearing=cur_weather.wind_bearing,
+        pressure=round(cur_weather.pressure),
+        wind_direction=wind_direction(cur_weather.wind_bearing),
+        cloud_cover=int(cur_weather.cloud_cover * 100),
+        units=unit_type
+    )
+    return CURRENT
+
 
+def normalizeHourly(hourly_weather):
+    # HOURLY
+    return hourlyColumns(
+        (int(h.time.timestamp()), h.temperature, int(round((h.precip_probability or 0) * 100)), h.wind_speed,
+         h.wind_bearing)
+        for h in hourly_weather
+    )
+
+
+def normalizeDaily(daily_weather):
     # DAILY
     DAILY = []
     for i, d in enumerate(daily_weather):
-        DAILY.append({
-            'date': str(d.time.date()),
-            'summary':              d.summary,
-            'icon':                 d.icon,
-            'sunrise_time':         d.sunrise_time.time().strftime('%H:%M'),
-            'sunset_time':          d.sunset_time.time().strftime('%H:%M'),
-            'moon_phase':           d.moon_phase,
-            'precip_intensity':     d.precip_intensity,
-            'precip_probability':   round(int(d.precip_probability * 100), -1),
-            'precip_type':          d.precip_type,
-            'humidity':             int(d.humidity * 100),
-            'pressure':             round(d.pressure),
-            'wind_speed':           d.wind_speed,
-            'wind_bearing':         d.wind_bearing,
-            'wind_direction':       wind_direction(d.wind_bearing),
-            'cloud_cover':          int(d.cloud_cover * 100),
-            'uv_index':             d.uv_index,
-            'temperature_min':      round(d.temperature_min),
-            'temperature_max':      round(d.temperature_max)
-        })
-
-    return CURRENT, DAILY
+        DAILY.append(DayForecast(
+            date=str(d.time.date()),
+            summary=d.summary,
+            icon=d.icon,
+            sunrise_time=d.sunrise_time.time().strftime('%H:%M'),
+            sunset_time=d.sunset_time.time().strftime('%H:%M'),
+            moon_phase=d.moon_phase,
+            precip_intensity=d.precip_intensity,
+            precip_probability=round(int(d.precip_probability * 100), -1),
+            precip_type=d.precip_type,
+            humidity=int(d.humidity * 100),
+            pressure=round(d.pressure),
+            wind_speed=d.wind_speed,
+            wind_bearing=d.wind_bearing,
+            wind_direction=wind_direction(d.wind_bearing),
+            cloud_cover=int(d.cloud_cover * 100),
+            uv_index=d.uv_index,
+            temperature_min=round(d.temperature_min),
+            temperature_max=round(d.temperature_max)
+        ))
+    return tuple(DAILY)
+
+
+def fetchDarkSkyWeather():
+    """ Current and DayForecasts straight from DarkSky, without the cache """
+    result = requestDarkSkyWeather(['currently', 'daily'])
+    return result['currently'], result['daily']
 
 
 if __name__ == '__main__':
@@ -10,9 +10,15 @@
 #
 
 import os
+import time
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry, RequestHistory
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from dotenv import load_dotenv
+from sensorstore import SensorStore, parseTime, number
+from records import SensorReading
+import metrics
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
 dotenv_path = os.path.join(base_dir, '.env')
@@ -20,26 +26,191 @@ load_dotenv(dotenv_path)
 
 TS_READ_API_KEY = os.environ.get('TS_READ_API_KEY')
 TS_CHANNEL_ID = os.environ.get('TS_CHANNEL_ID')
-TS_READ_URL = 'https://api.thingspeak.com/channels/{}/feeds.json?api_key={}&results=1'.format(TS_CHANNEL_ID, TS_READ_API_KEY)
+# another API endpoint, e.g. a local stand-in for testing
+TS_HOST = os.environ.get('TS_HOST') or 'https://api.thingspeak.com'
+TS_READ_URL = '{}/channels/{}/feeds.json?api_key={}&results=1'.format(TS_HOST, TS_CHANNEL_ID, TS_READ_API_KEY)
+TS_FEED_URL = '{}/channels/{}/feeds.json'.format(TS_HOST, TS_CHANNEL_ID)
+# most entries ThingSpeak returns for one request (the newest ones of the range)
+TS_MAX_RESULTS = 8000
+
+# local copy of the channel; on the first run the last TS_BACKFILL_DAYS are
+# fetched, readings older than TS_RAW_DAYS are kept as hourly averages for
+# TS_HOURLY_DAYS
+TS_STORE = os.environ.get('TS_STORE') or os.path.join(base_dir, 'cache', 'sensor.db')
+TS_BACKFILL_DAYS = float(os.environ.get('TS_BACKFILL_DAYS') or 7)
+TS_RAW_DAYS = float(os.environ.get('TS_RAW_DAYS') or 7)
+TS_HOURLY_DAYS = float(os.environ.get('TS_HOURLY_DAYS') or 365)
+
+# seconds the refresh loop waits for a fetch (its TS_DEADLINE)
+TS_DEADLINE = float(os.environ.get('TS_DEADLINE') or 10)
+
+# transient errors are retried once, a read timeout not at all: a hung
+# upstream is not going to answer the next time either
+TS_RETRY = Retry(
+    total=1,
+    read=0,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    raise_on_status=False,
+)
+
+
+def retryAttempts(retry):
+    return retry.total + 1
+
+
+def retryBackoff(retry):
+    """ Seconds slept between the attempts of a request that uses up `retry` """
+    return sum(
+        retry.new(history=(RequestHistory('GET', None, None, None, None),) * n).get_backoff_time()
+        for n in range(1, retryAttempts(retry))
+    )
+
+
+# seconds to open the connection (TCP + TLS) and to wait for the answer. A
+# request may take up to attempts x (connect + read) + backoff; by default the
+# read timeout is what keeps that within TS_DEADLINE (less a second for
+# storing the readings), so a fetch gives up before the refresh loop does and
+# its thread is not left running
+TS_CONNECT_TIMEOUT = float(os.environ.get('TS_CONNECT_TIMEOUT') or 1.5)
+TS_READ_TIMEOUT = float(os.environ.get('TS_READ_TIMEOUT') or 0) or max(
+    (TS_DEADLINE - 1 - retryBackoff(TS_RETRY)) / retryAttempts(TS_RETRY) - TS_CONNECT_TIMEOUT, 1)
+TS_WORST_CASE = retryAttempts(TS_RETRY) * (TS_CONNECT_TIMEOUT + TS_READ_TIMEOUT) + retryBackoff(TS_RETRY)
+if TS_WORST_CASE > TS_DEADLINE:
+    print('ThingSpeak requests may take {:g} s, longer than TS_DEADLINE ({:g} s)'.format(TS_WORST_CASE, TS_DEADLINE))
+
+ts_session = None
+ts_store = None
+
+# 'requests': fetches made, 'connections': TCP/TLS connections opened for them,
+# 'connect': seconds the last connection took to open (TCP + TLS handshake),
+# 'request': seconds the last fetch took on top of opening a connection,
+# 'pages': feed requests of the last fetch, 'added': new readings it stored
+ts_stats = {'requests': 0, 'connections': 0, 'connect': None, 'request': None, 'pages': 0, 'added': 0}
+
+
+def timedConnection(cls):
+    """ Connection class counting and timing every connect, reconnects included """
+    class TimedConnection(cls):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            ts_stats['connections'] += 1
+            ts_stats['connect'] = time.perf_counter() - start
+    return TimedConnection
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = timedConnection(HTTPConnectionPool.ConnectionCls)
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = timedConnection(HTTPSConnectionPool.ConnectionCls)
+
+
+class TimedAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
+
+def thingSpeakSession():
+    # one session for the life of the process, the connection is kept alive between cycles
+    global ts_session
+    if ts_session is None:
+        ts_session = requests.Session()
+        ts_session.mount(TS_HOST, TimedAdapter(pool_connections=1, pool_maxsize=2, max_retries=TS_RETRY))
+    return ts_session
+
+
+def sensorStore():
+    global ts_store
+    if ts_store is None:
+        ts_store = SensorStore(TS_STORE, raw_days=TS_RAW_DAYS, hourly_days=TS_HOURLY_DAYS)
+    return ts_store
+
+
+def parseThingSpeak(ts_result):
+    """ The first entry of a feeds.json answer as a SensorReading, None if there is none """
+    if not ts_result or not ts_result.get('feeds'):
+        return None
+
+    feed = ts_result['feeds'][0]
+    return SensorReading(parseTime(feed['created_at']), number(feed['field1']), number(feed['field2']))
+
+
+def feedTime(seconds):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(seconds))
+
+
+def requestFeed(session, start, end=None):
+    """ Entries of the channel created between `start` and `end` (unix seconds, inclusive) """
+    params = {'api_key': TS_READ_API_KEY, 'results': TS_MAX_RESULTS, 'timezone': 'Etc/UTC', 'start': feedTime(start)}
+    if end is not None:
+        params['end'] = feedTime(end)
+    r = session.get(TS_FEED_URL, params=params, timeout=(TS_CONNECT_TIMEOUT, TS_READ_TIMEOUT))
+    r.raise_for_status()
+    return r.json().get('feeds') or []
+
+
+def syncStore(session, store):
+    """
+    Store the entries newer than the last stored one. After an outage (or on
+    the first run) there may be more than TS_MAX_RESULTS of them: ThingSpeak
+    returns the newest ones, so the range is walked backwards page by page
+    until a short page or the start of the range.
+    """
+    last = store.last()
+    # the last stored entry is asked for again, so an empty answer means no data at all
+    start = last[1] if last else int(time.time() - TS_BACKFILL_DAYS * 86400)
+    end = None
+    ts_stats['pages'] = ts_stats['added'] = 0
+    while True:
+        feeds = requestFeed(session, start, end)
+        ts_stats['pages'] += 1
+        ts_stats['added'] += store.add(feeds)
+        if len(feeds) < TS_MAX_RESULTS:
+            break
+        oldest = min(parseTime(feed['created_at']) for feed in feeds)
+        if oldest <= start:
+            break
+        end = oldest - 1
+    store.maintain()
 
 
 def fetchThingSpeak():
-    TS_DATA = {}
+    """
+    The newest reading as a SensorReading, None if it could not be fetched
+    (or the channel is empty), so the frames show missing data instead of zeros
+    """
+    session = thingSpeakSession()
+    store = sensorStore()
+    connections = ts_stats['connections']
+    start = time.perf_counter()
     try:
-        r = requests.get(TS_READ_URL)
+        syncStore(session, store)
+        latest = store.latest()
     except Exception as e:
         print(e)
-        return {'TEMP': 0, 'VOLT': 0, 'UPDATED': 0}
-
-    ts_result = json.loads(r.content)
-    if not ts_result:
-        return {'TEMP': 0, 'VOLT': 0, 'UPDATED': 0}
-
-    TS_DATA['TEMP'] = ts_result['feeds'][0]['field1']
-    TS_DATA['VOLT'] = ts_result['feeds'][0]['field2']
-    TS_DATA['UPDATED'] = ts_result['feeds'][0]['created_at']
+        metrics.inc('upstream_errors_total', source='thingspeak')
+        return None
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe('upstream_seconds', elapsed, source='thingspeak')
+        if ts_stats['connections'] > connections:
+            elapsed -= ts_stats['connect']
+            metrics.observe('connect_seconds', ts_stats['connect'], source='thingspeak')
+        ts_stats['requests'] += 1
+        ts_stats['request'] = elapsed
 
-    return TS_DATA
+    if latest is None:
+        print('no data in channel')
+        return None
+    return SensorReading(*latest)
 
 
 if __name__ == '__main__':
@@ -47,3 +218,4 @@ if __name__ == '__main__':
 
     ts_data = fetchThingSpeak()
     pprint(ts_data)
+    pprint(ts_stats)
@@ -0,0 +1,97 @@
+# coding: utf-8
+#
+# Weather station display for Raspberry and Waveshare 2.7" e-Paper display
+# (concurrent data acquisition)
+#
+# Copyright by Antal Rutz
+#
+# Documentation and full source code:
+# https://github.com/arutz12/Raspberry-Weather-EPD
+#
+# All data sources of a cycle run concurrently on one event loop, each with
+# its own deadline. A source that fails or runs out of time is reported as
+# such instead of failing the whole cycle.
+#
+# A blocking call cannot be cancelled: past its deadline it is abandoned and
+# runs on until its own HTTP timeouts end it. Each one therefore gets a thread
+# of its own instead of a slot in a shared pool, so abandoned calls never hold
+# up the sources of later cycles.
+#
+# The sources are not aiohttp clients: the forecast providers and TSfetch
+# keep requests sessions with their own retry and timeout handling, and the
+# loop only waits on them.
+#
+
+import time
+import asyncio
+import threading
+from collections import namedtuple
+
+# value: what the source returned (None on failure), error: the exception
+# (None on success), elapsed: seconds it took
+SourceResult = namedtuple('SourceResult', ['value', 'error', 'elapsed'])
+
+
+def blocking(func, *args):
+    """ Source factory for a blocking call, run on a daemon thread of its own """
+    def source():
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def settle(value, error):
+            # on the loop; an abandoned source's future is already cancelled
+            if future.done():
+                return
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)
+
+        def run():
+            value = error = None
+            try:
+                value = func(*args)
+            except Exception as e:
+                error = e
+            try:
+                loop.call_soon_threadsafe(settle, value, error)
+            except RuntimeError:
+                # the cycle is over and its loop closed
+                pass
+
+        threading.Thread(target=run, name='acquire', daemon=True).start()
+        return future
+    return source
+
+
+async def runSource(source, deadline):
+    start = time.perf_counter()
+    try:
+        value = await asyncio.wait_for(source(), deadline)
+    except asyncio.TimeoutError:
+        return SourceResult(None, TimeoutError('no answer in %g s' % deadline), time.perf_counter() - start)
+    except Exception as e:
+        return SourceResult(None, e, time.perf_counter() - start)
+    return SourceResult(value, None, time.perf_counter() - start)
+
+
+async def acquire(sources):
+    """
+    Run `sources`, a dict of name -> (source, deadline), concurrently and
+    return a dict of name -> SourceResult. A source is called without
+    arguments and must return an awaitable.
+    """
+    names = list(sources)
+    results = await asyncio.gather(*[
+        runSource(sources[name][0], sources[name][1]) for name in names
+    ])
+    return dict(zip(names, results))
+
+
+def acquireAll(sources):
+    """ Blocking wrapper around acquire() for the synchronous main loop """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(acquire(sources))
+    finally:
+        loop.close()
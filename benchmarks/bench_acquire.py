@@ -0,0 +1,81 @@
+# coding: utf-8
+#
+# Concurrent data acquisition against local stand-ins
+#
+# DarkSky and ThingSpeak stand-ins answer after a delay; one cycle of
+# getWeatherData should take about as long as the slower of the two, and a
+# ThingSpeak that never answers in time should still leave a rendered forecast.
+# Then checks that blocking calls abandoned past their deadline do not keep
+# later sources from running:
+#
+#     python benchmarks/bench_acquire.py
+#
+
+import os
+import sys
+import time
+import tempfile
+
+from common import loadMain, thingSpeakBody
+from standin import StandIn
+from acquire import acquireAll, blocking
+
+DARKSKY_DELAY = 0.5
+TS_DELAY = 0.3
+
+darksky = StandIn('darksky', delay=DARKSKY_DELAY)
+thingspeak = StandIn('thingspeak', delay=TS_DELAY)
+thingspeak.body = thingSpeakBody()
+os.environ.update({
+    'DARKSKY_HOST': darksky.url + '/forecast',
+    'DARKSKY_API_KEY': 'key',
+    'DARKSKY_LATITUDE': '47.4979',
+    'DARKSKY_LONGITUDE': '19.0402',
+    'DARKSKY_LANGUAGE': 'ENGLISH',
+    'DARKSKY_UNITS': 'SI',
+    'TS_HOST': thingspeak.url,
+    'TS_STORE': ':memory:',
+    'TS_DEADLINE': '1',
+    'SENSOR': '1',
+})
+
+import forecast  # noqa: E402
+
+app = loadMain()
+
+
+def cycle(label):
+    # cold forecast cache every time, so both sources really go upstream
+    forecast.CACHE_FILE = os.path.join(tempfile.mkdtemp(), 'weather.json')
+    start = time.perf_counter()
+    weather = app.getWeatherData()
+    elapsed = time.perf_counter() - start
+    app.updateFrame1(weather)
+    print('{:28s} {:6.0f} ms  temperature {:>5s}  battery {}'.format(
+        label, elapsed * 1000, str(weather.temperature), weather.battery))
+
+
+def main():
+    print('upstream delays: DarkSky {:.0f} ms, ThingSpeak {:.0f} ms (sum {:.0f} ms)'.format(
+        DARKSKY_DELAY * 1000, TS_DELAY * 1000, (DARKSKY_DELAY + TS_DELAY) * 1000))
+    cycle('both sources')
+    thingspeak.delay = 30
+    cycle('ThingSpeak hanging')
+    thingspeak.delay = 0
+    thingspeak.status = 500
+    cycle('ThingSpeak failing')
+
+    # more hung calls than there used to be worker threads, then a quick one
+    for _ in range(8):
+        acquireAll({'hung': (blocking(time.sleep, 30), 0.05)})
+    result = acquireAll({'quick': (blocking(time.sleep, 0), 1)})['quick']
+    print('after 8 abandoned calls      {:6.0f} ms  {}'.format(
+        result.elapsed * 1000, result.error or 'answered'))
+    if result.error:
+        print('\nFAILED:\n  abandoned calls hold up later sources')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
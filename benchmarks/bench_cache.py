@@ -0,0 +1,85 @@
+# coding: utf-8
+#
+# Forecast response cache against a local stand-in
+#
+# Runs forecast.fetchWeather through a cold cache, a warm cache, an
+# expired cache (served stale, refreshed in the background) and an expired
+# cache with the upstream down, counting the upstream requests and timing
+# each call:
+#
+#     python benchmarks/bench_cache.py
+#
+
+import os
+import sys
+import json
+import time
+import tempfile
+
+from common import base_dir  # noqa: F401 (puts the project on sys.path)
+from standin import StandIn
+
+UPSTREAM_DELAY = 0.3
+
+standin = StandIn('darksky', delay=UPSTREAM_DELAY)
+os.environ.update({
+    'DARKSKY_HOST': standin.url + '/forecast',
+    'DARKSKY_API_KEY': 'key',
+    'DARKSKY_LATITUDE': '47.4979',
+    'DARKSKY_LONGITUDE': '19.0402',
+    'DARKSKY_LANGUAGE': 'ENGLISH',
+    'DARKSKY_UNITS': 'SI',
+})
+
+import forecast  # noqa: E402
+
+forecast.CACHE_FILE = os.path.join(tempfile.mkdtemp(), 'weather.json')
+
+
+def timed(label):
+    hits = standin.hits
+    start = time.perf_counter()
+    current, daily, hourly = forecast.fetchWeather()
+    elapsed = time.perf_counter() - start
+    print('{:32s} {:8.1f} ms  upstream requests: {}'.format(label, elapsed * 1000, standin.hits - hits))
+    return current, daily, hourly
+
+
+def age(seconds):
+    """ Pretend the cached blocks were fetched `seconds` ago """
+    cache = forecast.loadCache()
+    for block in cache.values():
+        block['fetched'] -= seconds
+    with open(forecast.CACHE_FILE, 'w') as f:
+        json.dump(cache, f)
+
+
+def main():
+    cold = timed('cold cache')
+    warm = timed('warm cache')
+    if warm != cold:
+        print('MISMATCH: cached data differs from the fetched one')
+        return 1
+
+    age(forecast.CACHE_TTL['currently'])
+    timed('expired, served stale')
+    forecast.refresh_threads[None].join()
+    print('{:32s} {:>11s}  upstream requests: 1'.format('  background refresh done', ''))
+
+    age(forecast.CACHE_TTL['daily'])
+    standin.status = 503
+    timed('expired, upstream down')
+    forecast.refresh_threads[None].join()
+
+    age(forecast.CACHE_MAX_STALE)
+    try:
+        timed('too old, upstream down')
+    except Exception as e:
+        print('{:32s} raised {}'.format('too old, upstream down', e.__class__.__name__))
+
+    standin.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+# coding: utf-8
+#
+# Display worker under button mashing, on the fake panel backend
+#
+# Presses the frame buttons many times while a slow refresh is in progress,
+# once with every press run in turn (as a plain queue would) and once through
+# the display worker, and checks the worker ends on the frame pressed last.
+# Then checks a periodic refresh coming in behind a press does not replace it:
+#
+#     python benchmarks/bench_display.py
+#
+
+import os
+import sys
+import time
+
+os.environ['EPD_BACKEND'] = 'fake'
+
+from common import loadMain, loadWeather  # noqa: E402
+from display import DisplayWorker  # noqa: E402
+
+PRESSES = 20
+# seconds between presses and of one panel refresh (about 6 s on the real panel)
+PRESS_GAP = 0.02
+REFRESH = 0.3
+
+app = loadMain()
+app.test_mode = False
+
+
+def slowDisplay(frame_name):
+    app.displayFrame(frame_name)
+    time.sleep(REFRESH)
+
+
+def mash(request):
+    start = time.perf_counter()
+    for press in range(PRESSES):
+        request(slowDisplay, 'frame' + str(press % 3 + 1))
+        time.sleep(PRESS_GAP)
+    return start
+
+
+def main():
+    weather = loadWeather()
+    for frame in (app.updateFrame1, app.updateFrame2, app.updateFrame3):
+        frame(weather)
+    last = 'frame' + str((PRESSES - 1) % 3 + 1)
+
+    queued = []
+    start = mash(lambda func, *args: queued.append((func, args)))
+    for func, args in queued:
+        func(*args)
+    print('every press in turn  {:2d} refreshes  {:5.2f} s'.format(len(queued), time.perf_counter() - start))
+
+    worker = DisplayWorker()
+    start = mash(worker.request)
+    worker.drain()
+    elapsed = time.perf_counter() - start
+    stats = worker.stats
+    print('display worker       {:2d} refreshes  {:5.2f} s  ({} dropped, longest wait {:.2f} s)'.format(
+        stats['done'], elapsed, stats['dropped'], stats['max_wait']))
+
+    shown = app.displayed_digest == app.frames.get(last).digest
+    print('last pressed frame on the panel: {}'.format('yes' if shown else 'NO'))
+    # the first press is drawn, everything pressed during it collapses into one more
+    refreshes = int(PRESSES * PRESS_GAP / REFRESH) + 2
+    if not shown or stats['done'] > refreshes:
+        return 1
+
+    # a press waiting behind a refresh, then the periodic refresh of frame1
+    worker = DisplayWorker()
+    worker.request(slowDisplay, 'frame1')
+    worker.request(slowDisplay, 'frame2')
+    job = worker.request(slowDisplay, 'frame1', periodic=True)
+    worker.drain()
+    kept = app.displayed_digest == app.frames.get('frame2').digest
+    print('press kept over a periodic refresh: {}'.format('yes' if kept else 'NO'))
+    if not kept or not job.cancelled():
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+# coding: utf-8
+#
+# Multi-location, multi-panel fan-out on the fake panel backend
+#
+# Serves the forecast fixture (its hours moved to now) from a stand-in and
+# drives TARGETS panels spread over LOCATIONS locations. Checks that every
+# location is fetched once per cycle, that each fake panel got the frame its
+# target renders in-process, that an unchanged forecast is not rendered
+# again, that a killed render worker does not stop the service and that
+# frames the service cannot draw are refused or skipped, then times a cycle
+# with every target rendered in one process and on pools of growing size:
+#
+#     python benchmarks/bench_fanout.py
+#
+
+import os
+import sys
+import json
+import time
+import signal
+import tempfile
+from dataclasses import replace
+
+os.environ['EPD_BACKEND'] = 'fake'
+
+from common import loadFixture  # noqa: E402
+from standin import StandIn  # noqa: E402
+
+LOCATIONS = 8
+TARGETS = 32
+ROUNDS = 3
+FRAMES = ('frame1', 'frame2', 'frame3', 'frame5')
+
+standin = StandIn('forecast')
+os.environ.update({
+    'WEATHER_PROVIDER': 'fixture',
+    'FIXTURE_URL': standin.url + '/forecast.json',
+    'FORECAST_TITLE': '4-day forecast',
+})
+
+import forecast  # noqa: E402
+import fanout  # noqa: E402
+from sinks import EPDSink  # noqa: E402
+
+forecast.CACHE_FILE = os.path.join(tempfile.mkdtemp(), 'weather.json')
+
+
+def fixture():
+    # the hourly forecast starting this hour, so the next 24 hours frame has bars
+    blocks = loadFixture('forecast')
+    shift = int(time.time()) // 3600 * 3600 - blocks['hourly']['time'][0]
+    blocks['hourly']['time'] = [t + shift for t in blocks['hourly']['time']]
+    return json.dumps(blocks).encode()
+
+
+def makeTargets():
+    return [
+        fanout.Target('panel%d' % i, (47.0 + i % LOCATIONS, 19.0), '2in7', FRAMES[i % len(FRAMES)], 'epd')
+        for i in range(TARGETS)
+    ]
+
+
+def makeFanOut(targets, workers):
+    # one fake panel per target; EPD_BACKEND=fake allows any number of them
+    service = fanout.FanOut(targets, workers, sinks=dict((t.name, EPDSink()) for t in targets))
+    service.start()
+    return service
+
+
+def timedCycle(service):
+    # everything rendered and shown again, as if the weather changed everywhere
+    service.rendered.clear()
+    service.shown.clear()
+    start = time.perf_counter()
+    service.cycle()
+    service.drain()
+    return time.perf_counter() - start
+
+
+def inProcess(service):
+    """ The fan-out cycle with the targets rendered one after the other, without the pool """
+    weather = service.fetch()
+    start = time.perf_counter()
+    for target in service.targets:
+        w = weather[target.location]
+        temp_unit, speed_unit = fanout.unitNames(w.current.units)
+        fanout.renderTarget(target.layout, target.frame, fanout.packWeather(w), temp_unit, speed_unit)
+    return time.perf_counter() - start
+
+
+def main():
+    failed = []
+    standin.body = fixture()
+    targets = makeTargets()
+
+    service = makeFanOut(targets, 2)
+    service.cycle()
+    service.drain()
+    print('{} targets, {} locations: {} upstream requests on a cold cache'.format(
+        TARGETS, LOCATIONS, standin.hits))
+    if standin.hits != LOCATIONS:
+        failed.append('{} upstream requests for {} locations'.format(standin.hits, LOCATIONS))
+    if service.stats['rendered'] != TARGETS or service.stats['render_errors']:
+        failed.append('rendered {} of {} targets'.format(service.stats['rendered'], TARGETS))
+
+    weather = service.fetch()
+    for target in targets:
+        w = weather[target.location]
+        temp_unit, speed_unit = fanout.unitNames(w.current.units)
+        expected, _ = fanout.renderTarget(target.layout, target.frame, fanout.packWeather(w), temp_unit, speed_unit)
+        if service.sinks[target.name].epd.last_buffer != expected:
+            failed.append(target.name + ' shows another frame than its own')
+            break
+
+    service.cycle()
+    service.drain()
+    if service.stats['render_skipped'] != TARGETS:
+        failed.append('an unchanged forecast was rendered again')
+
+    # a render worker killed between cycles breaks the pool: the next cycle starts a new one
+    os.kill(next(iter(service.pool._processes)), signal.SIGKILL)
+    time.sleep(0.5)
+    rendered = service.stats['rendered']
+    service.rendered.clear()
+    service.cycle()
+    service.drain()
+    print('killed render worker: pool started again {} time(s), {} targets rendered'.format(
+        service.stats['pool_restarts'], service.stats['rendered'] - rendered))
+    if service.stats['rendered'] - rendered != TARGETS:
+        failed.append('a dead render worker stopped the rendering')
+
+    # no hourly forecast: the frame5 targets are skipped, the rest rendered
+    weather = service.fetch()
+    service.fetch = lambda: dict((location, replace(w, hourly=None)) for location, w in weather.items())
+    errors = service.stats['render_errors']
+    service.rendered.clear()
+    service.cycle()
+    service.drain()
+    del service.fetch
+    if service.stats['render_errors'] != errors:
+        failed.append('targets without an hourly forecast failed to render')
+    service.stop()
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+        json.dump([{'name': 'trend', 'frame': 'frame4', 'sink': 'epd'}], f)
+        f.flush()
+        try:
+            fanout.loadTargets(f.name)
+            failed.append('a target showing frame4 was accepted')
+        except ValueError as e:
+            print('frame4 target rejected: {}'.format(e))
+
+    print('{} cores\n'.format(os.cpu_count()))
+    t_single = min(inProcess(service) for _ in range(ROUNDS))
+    print('in one process      {:7.0f} ms  {:6.1f} targets/s'.format(t_single * 1000, TARGETS / t_single))
+    base = None
+    for workers in sorted(set((1, 2, 4, os.cpu_count()))):
+        service = makeFanOut(targets, workers)
+        timedCycle(service)
+        elapsed = min(timedCycle(service) for _ in range(ROUNDS))
+        service.stop()
+        base = base or elapsed
+        print('pool of {:2d}          {:7.0f} ms  {:6.1f} targets/s  x{:.1f}'.format(
+            workers, elapsed * 1000, TARGETS / elapsed, base / elapsed))
+
+    standin.stop()
+    if failed:
+        print('\nFAILED:\n  ' + '\n  '.join(failed))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+# coding: utf-8
+#
+# HTTP server of the rendered frames
+#
+# Renders the fixture weather, serves the frames and checks the raw buffer is
+# the one sent to the panel, the PNG decodes to the frame, If-None-Match gets
+# a 304 until the frame changes and unknown frames a 404. Then polls with
+# CLIENTS keep-alive clients at once, conditionally and not, and compares
+# serving the cached PNG with encoding it for every request:
+#
+#     python benchmarks/bench_frameserver.py
+#
+
+import io
+import sys
+import time
+import threading
+from dataclasses import replace
+import requests
+from PIL import Image
+
+from common import loadMain, loadWeather
+from frameserver import FrameServer
+
+CLIENTS = 100
+POLLS = 20
+
+
+def poll(url, etag=None):
+    """ Requests per second of CLIENTS clients polling `url` POLLS times each, and the statuses seen """
+    statuses = {}
+    lock = threading.Lock()
+    headers = {'If-None-Match': etag} if etag else {}
+
+    def client():
+        with requests.Session() as session:
+            for _ in range(POLLS):
+                status = session.get(url, headers=headers).status_code
+                with lock:
+                    statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=client) for _ in range(CLIENTS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return CLIENTS * POLLS / (time.perf_counter() - start), statuses
+
+
+def encoded(image):
+    out = io.BytesIO()
+    image.save(out, 'PNG')
+    return out.getvalue()
+
+
+def main():
+    failed = []
+    app = loadMain()
+    weather = loadWeather()
+    for update in (app.updateFrame1, app.updateFrame2, app.updateFrame3):
+        update(weather)
+
+    server = FrameServer(app.frames, port=0)
+    server.start()
+    url = 'http://127.0.0.1:{}/frames'.format(server.port)
+    frame = app.frames.get('frame1')
+
+    index = requests.get(url).json()
+    if index != dict((name, app.frames.get(name).digest) for name in ('frame1', 'frame2', 'frame3')):
+        failed.append('the index does not list the rendered frames')
+    r = requests.get(url + '/frame1.bin')
+    if r.content != frame.buffer or r.headers['Content-Type'] != 'application/octet-stream':
+        failed.append('the raw frame is not the panel buffer')
+    etag = r.headers['ETag']
+    r = requests.get(url + '/frame1.png')
+    if Image.open(io.BytesIO(r.content)).convert('1').tobytes() != frame.image.tobytes():
+        failed.append('the PNG is not the frame')
+    png_etag = r.headers['ETag']
+    if png_etag == etag:
+        failed.append('the PNG and the raw buffer share an ETag')
+    r = requests.get(url + '/frame1.bin', headers={'If-None-Match': etag})
+    if r.status_code != 304 or r.content:
+        failed.append('an unchanged frame was sent again')
+    if requests.get(url + '/frame9.bin').status_code != 404 or requests.get(url + '/frame1.gif').status_code != 404:
+        failed.append('unknown frames are not 404')
+
+    # a new sensor reading changes the temperature on frame1
+    app.updateFrame1(replace(weather, sensor=replace(weather.sensor, temp=weather.sensor.temp + 1)))
+    r = requests.get(url + '/frame1.bin', headers={'If-None-Match': etag})
+    if r.status_code != 200 or r.headers['ETag'] == etag or r.content != app.frames.buffer('frame1'):
+        failed.append('a changed frame was not sent')
+    r = requests.get(url + '/frame1.png', headers={'If-None-Match': png_etag})
+    if r.status_code != 200:
+        failed.append('the PNG of a changed frame was not sent')
+
+    etag = requests.get(url + '/frame1.bin').headers['ETag']
+    png_etag = requests.get(url + '/frame1.png').headers['ETag']
+    print('{} clients polling {} times each'.format(CLIENTS, POLLS))
+    for label, path, tag in (('raw, If-None-Match', '/frame1.bin', etag), ('raw', '/frame1.bin', None),
+                             ('PNG, If-None-Match', '/frame1.png', png_etag), ('PNG', '/frame1.png', None)):
+        rate, statuses = poll(url + path, tag)
+        print('  {:20s} {:7.0f} requests/s  {}'.format(label, rate, statuses))
+        if set(statuses) != {304 if tag else 200}:
+            failed.append(label + ': unexpected statuses')
+
+    image = app.frames.get('frame1').image
+    start = time.perf_counter()
+    for _ in range(100):
+        app.frames.png('frame1')
+    t_cached = (time.perf_counter() - start) / 100
+    start = time.perf_counter()
+    for _ in range(100):
+        encoded(image)
+    t_encode = (time.perf_counter() - start) / 100
+    print('\nPNG body  cached {:6.1f} us  encoded per request {:6.1f} us'.format(t_cached * 1e6, t_encode * 1e6))
+
+    server.stop()
+    if failed:
+        print('\nFAILED:\n  ' + '\n  '.join(failed))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
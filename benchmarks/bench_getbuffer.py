@@ -0,0 +1,86 @@
+# coding: utf-8
+#
+# Microbenchmark for EPD.getbuffer: the old per-pixel loop vs packing.pack_image
+#
+# Checks that both produce byte-identical buffers for portrait and landscape
+# frames, then times them. Runs without the panel or the SPI/GPIO libraries:
+#
+#     python benchmarks/bench_getbuffer.py
+#
+
+import os
+import sys
+import random
+import timeit
+from PIL import Image
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, base_dir)
+
+from waveshare_epd.packing import pack_image  # noqa: E402
+
+EPD_WIDTH = 176
+EPD_HEIGHT = 264
+ROUNDS = 5
+
+
+def getbuffer_loop(image, width, height):
+    """ The original Waveshare per-pixel getbuffer, kept as the reference """
+    buf = [0xFF] * (int(width/8) * height)
+    image_monocolor = image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+    if(imwidth == width and imheight == height):
+        for y in range(imheight):
+            for x in range(imwidth):
+                if pixels[x, y] == 0:
+                    buf[int((x + y * width) / 8)] &= ~(0x80 >> (x % 8))
+    elif(imwidth == height and imheight == width):
+        for y in range(imheight):
+            for x in range(imwidth):
+                newx = y
+                newy = height - x - 1
+                if pixels[x, y] == 0:
+                    buf[int((newx + newy*width) / 8)] &= ~(0x80 >> (y % 8))
+    return buf
+
+
+def noise(size, seed):
+    rnd = random.Random(seed)
+    image = Image.new('L', size)
+    image.putdata([rnd.randrange(256) for _ in range(size[0] * size[1])])
+    return image
+
+
+def samples():
+    yield 'portrait', noise((EPD_WIDTH, EPD_HEIGHT), 1)
+    yield 'landscape', noise((EPD_HEIGHT, EPD_WIDTH), 2)
+    yield 'landscape-1bit', noise((EPD_HEIGHT, EPD_WIDTH), 3).convert('1')
+    yield 'blank', Image.new('1', (EPD_HEIGHT, EPD_WIDTH), 255)
+    yield 'wrong-size', Image.new('1', (100, 100), 0)
+    for name in ('frame1', 'frame2', 'frame3'):
+        path = os.path.join(base_dir, name + '.bmp')
+        if os.path.exists(path):
+            yield name, Image.open(path)
+
+
+def main():
+    failed = False
+    for name, image in samples():
+        expected = bytes(getbuffer_loop(image, EPD_WIDTH, EPD_HEIGHT))
+        packed = bytes(pack_image(image, EPD_WIDTH, EPD_HEIGHT))
+        if packed != expected:
+            print('{:15s} MISMATCH'.format(name))
+            failed = True
+            continue
+
+        t_loop = min(timeit.repeat(lambda: getbuffer_loop(image, EPD_WIDTH, EPD_HEIGHT), number=1, repeat=ROUNDS))
+        t_pack = min(timeit.repeat(lambda: pack_image(image, EPD_WIDTH, EPD_HEIGHT), number=1, repeat=ROUNDS))
+        print('{:15s} identical  loop {:8.2f} ms  pack {:6.3f} ms  x{:.0f}'.format(
+            name, t_loop * 1000, t_pack * 1000, t_loop / t_pack))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
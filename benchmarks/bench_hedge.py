@@ -0,0 +1,68 @@
+# coding: utf-8
+#
+# Hedged weather requests against local stand-ins
+#
+# The primary provider (OpenWeatherMap stand-in) answers quickly except for
+# one request in 25, the secondary (fixture provider) a bit slower but
+# steadily. Compares the fetch latency percentiles of the primary alone and of
+# the hedged pair, and how many extra requests the hedging cost:
+#
+#     python benchmarks/bench_hedge.py
+#
+
+import os
+import sys
+import time
+
+from standin import StandIn
+
+ROUNDS = 100
+FAST = 0.03
+SLOW = 0.8
+SECONDARY = 0.1
+
+primary = StandIn('openweathermap')
+secondary = StandIn('forecast', delay=SECONDARY)
+os.environ.update({
+    'OWM_HOST': primary.url + '/onecall',
+    'FIXTURE_URL': secondary.url + '/forecast.json',
+    'DARKSKY_LATITUDE': '47.4979',
+    'DARKSKY_LONGITUDE': '19.0402',
+})
+
+import providers  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def run(label, provider):
+    latencies = []
+    for i in range(ROUNDS):
+        primary.delay = SLOW if i % 25 == 12 else FAST
+        start = time.perf_counter()
+        result = provider.fetch(['currently', 'daily'])
+        latencies.append(time.perf_counter() - start)
+        assert result['currently'].units == 'si'
+    print('{:10s} p50 {:6.0f} ms  p95 {:6.0f} ms  p99 {:6.0f} ms  total {:5.1f} s'.format(
+        label, percentile(latencies, 0.5) * 1000, percentile(latencies, 0.95) * 1000,
+        percentile(latencies, 0.99) * 1000, sum(latencies)))
+    return latencies
+
+
+def main():
+    run('primary', providers.OpenWeatherMapProvider())
+
+    hits = secondary.hits
+    hedged = providers.HedgedProvider(providers.OpenWeatherMapProvider(), providers.FixtureProvider())
+    run('hedged', hedged)
+    print('hedged requests: {hedged} of {requests}, secondary answer used: {secondary}'.format(**hedged.stats))
+    print('secondary upstream requests: {}  ({:.0f}% extra)'.format(
+        secondary.hits - hits, (secondary.hits - hits) * 100.0 / ROUNDS))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
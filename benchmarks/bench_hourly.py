@@ -0,0 +1,132 @@
+# coding: utf-8
+#
+# Hourly forecast model and frame
+#
+# Normalizes the hourly block of the DarkSky and OpenWeatherMap fixtures
+# (which describe the same 48 hours) and checks both come out the same,
+# compares the size of the array columns with the 48 hourly objects and with
+# a list of dicts, checks the bar scaling and times it against drawing every
+# bar, then renders frame5 and checks missing hours are left out of it:
+#
+#     python benchmarks/bench_hourly.py
+#     python benchmarks/bench_hourly.py --save    # also writes frame5.bmp
+#
+
+import sys
+import math
+import time
+from array import array
+from dataclasses import replace
+from PIL import Image
+from PIL import ImageDraw
+
+from common import loadMain, loadFixture, loadWeather
+from darksky.forecast import Forecast
+import DSweather
+import providers
+import records
+import trend
+
+ROUNDS = 50
+WIDTH, HEIGHT = 264, 67
+
+
+def deepSize(value, seen=None):
+    """ Bytes held by `value` and everything it refers to """
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deepSize(k, seen) + deepSize(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(deepSize(v, seen) for v in value)
+    elif hasattr(value, '__dict__'):
+        size += deepSize(vars(value), seen)
+    return size
+
+
+def rectangles(values, low, high):
+    image = Image.new('1', (WIDTH, HEIGHT), 255)
+    draw = ImageDraw.Draw(image)
+    slot = WIDTH // len(values)
+    for i, value in enumerate(values):
+        height = round((value - low) / (high - low) * (HEIGHT - 1)) + 1
+        draw.rectangle((i * slot, HEIGHT - height, i * slot + slot - 2, HEIGHT - 1), fill=0)
+    return image
+
+
+def timed(func):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func()
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+
+def main():
+    failed = []
+
+    darksky = Forecast(**loadFixture('darksky'))
+    ds_hourly = DSweather.normalizeHourly(darksky.hourly.data[0:providers.MAX_HOURS])
+    owm_hourly = providers.OpenWeatherMapProvider.normalizeHourly(
+        None, loadFixture('openweathermap')['hourly'][0:providers.MAX_HOURS])
+    if ds_hourly != owm_hourly:
+        failed.append('DarkSky and OpenWeatherMap hourly blocks differ')
+    if ds_hourly != loadFixture('forecast')['hourly']:
+        failed.append('the normalized fixture is out of date')
+
+    hourly = records.hourlyArrays(ds_hourly)
+    rows = [dict(zip(records.HOURLY_FIELDS, row)) for row in zip(*(ds_hourly[f] for f in records.HOURLY_FIELDS))]
+    print('{} hours'.format(len(hourly.time)))
+    print('  darksky objects  {:7d} bytes'.format(deepSize(darksky.hourly.data)))
+    print('  list of dicts    {:7d} bytes'.format(deepSize(rows)))
+    print('  array columns    {:7d} bytes'.format(sum(sys.getsizeof(column) for column in hourly)))
+    print('  parse columns    {:7.3f} ms'.format(timed(lambda: records.hourlyArrays(ds_hourly))))
+
+    temps = hourly.temperature[0:24]
+    low, high = min(temps), max(temps)
+    bars = trend.barMask(temps, (WIDTH, HEIGHT), slots=24, span=4)
+    heights = bars.sum(axis=0)
+    if heights.max() != HEIGHT or heights[heights > 0].min() != 1:
+        failed.append('bars are not scaled from 1 pixel to the full height')
+    if (Image.fromarray(~bars).tobytes() != rectangles(temps, low, high).tobytes()):
+        failed.append('bars differ from the ones drawn one by one')
+    mask = Image.new('1', (WIDTH, HEIGHT), 255)
+    print('\nbars               {:7.3f} ms'.format(
+        timed(lambda: trend.pasteBars(mask, (0, 0, WIDTH - 1, HEIGHT - 1), temps, 24, 4))))
+    print('rectangles         {:7.3f} ms'.format(timed(lambda: rectangles(temps, low, high))))
+
+    app = loadMain()
+    app.DEBUG = False
+    # the fixture hours starting now
+    shift = int(time.time()) // 3600 * 3600 - hourly.time[0]
+    hourly = hourly._replace(time=array('q', (t + shift for t in hourly.time)))
+    if len(app.hourlyValues(hourly).get('hourlyTemp', ())) != 24:
+        failed.append('hourlyValues did not select the next 24 hours')
+    weather = replace(loadWeather(), hourly=hourly)
+    app.updateFrame5(weather)
+    print('\nframe5 render      {:7.3f} ms'.format(timed(lambda: app.updateFrame5(weather))))
+    if '--save' in sys.argv:
+        app.frames.get('frame5').image.save('frame5.bmp')
+        print('saved frame5.bmp')
+
+    # a missing temperature (NaN) at the start of the window, then none at all
+    gap = array('f', hourly.temperature)
+    gap[0] = math.nan
+    values = app.hourlyValues(hourly._replace(temperature=gap))
+    present = gap[1:24]
+    if values.get('hourlyTempMin') != str(round(min(present))) or values.get('hourlyTempMax') != str(round(max(present))):
+        failed.append('a missing hour broke the hourly labels')
+    app.updateFrame5(replace(weather, hourly=hourly._replace(temperature=gap)))
+    if app.hourlyValues(hourly._replace(temperature=array('f', [math.nan] * len(gap)))) != {}:
+        failed.append('an hourly forecast without temperatures was drawn')
+
+    if failed:
+        print('\nFAILED:\n  ' + '\n  '.join(failed))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
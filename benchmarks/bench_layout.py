@@ -0,0 +1,164 @@
+# coding: utf-8
+#
+# Benchmark of the compiled layout ops against the hand-coded frame functions
+# they replaced
+#
+# Renders the fixture weather with both (the hand-coded ones from the old
+# flattened dict), checks the frames are pixel-identical and times them:
+#
+#     python benchmarks/bench_layout.py
+#
+
+import os
+import sys
+import time
+import timeit
+from textwrap import wrap
+from datetime import datetime
+from datetime import timedelta
+from PIL import Image
+from PIL import ImageDraw
+
+from common import loadMain, loadWeather, flatWeather
+
+ROUNDS = 20
+
+app = loadMain()
+layout = app.frameLayout()
+folder_img = app.folder_img
+fonts = layout.fonts
+EPD_WIDTH = layout.height
+EPD_HEIGHT = layout.width
+
+
+def icon(name, size):
+    return Image.open(os.path.join(folder_img, name + '.png')).resize(size)
+
+
+temperature = icon('temperature', (25, 25))
+humidity = icon('humidity', (25, 25))
+pressure = icon('pressure', (25, 25))
+direction = icon('direction', (25, 25))
+sunrise = icon('sunrise', (25, 25))
+sunset = icon('sunset', (25, 25))
+precip = icon('Rain', (35, 35))
+
+
+def legacyFrame1(weather, sensor):
+    mask = Image.new('1', (EPD_HEIGHT, EPD_WIDTH), 255)
+    draw = ImageDraw.Draw(mask)
+    condition = icon(weather['condition'], (100, 100))
+    mask.paste(condition, (0, 0), condition)
+    draw.text((110, 0), str(weather['currTemp']) + '°' + app.TEMP_UNIT, font=fonts['extraBig'], fill=0)
+    condRows = wrap(weather['conditiontxt'], width=14)[:2]
+    draw.text((110, 47), condRows[0], font=fonts['big'], fill=0)
+    if len(condRows) == 2:
+        draw.text((110, 72), condRows[1], font=fonts['big'], fill=0)
+    mask.paste(temperature, (15, 115), temperature)
+    draw.text((45, 108), str(weather['tempMinDay1']) + '°' + app.TEMP_UNIT, font=fonts['medium'], fill=0)
+    draw.text((45, 124), str(weather['tempMaxDay1']) + '°' + app.TEMP_UNIT, font=fonts['medium'], fill=0)
+    mask.paste(precip, (115, 115), precip)
+    draw.text((150, 117), str(weather['precip']) + '%', font=fonts['medium'], fill=0)
+    wind_dir = direction.rotate(float(weather['windDir']))
+    mask.paste(wind_dir, (200, 115), wind_dir)
+    draw.text((235, 117), weather['windDirTxt'], font=fonts['medium'], fill=0)
+    draw.text((200, 140), str(int(weather['windSpeed'])) + app.SPEED_UNIT, font=fonts['medium'], fill=0)
+    draw.line((100, 50, EPD_HEIGHT, 50), fill=0)
+    draw.line((0, 100, EPD_HEIGHT, 100), fill=0)
+    draw.line((0, 160, EPD_HEIGHT, 160), fill=0)
+    draw.line((100, 0, 100, 100), fill=0)
+    legacyStatus(draw, weather, sensor)
+    return mask
+
+
+def legacyFrame2(weather, sensor):
+    mask = Image.new('1', (EPD_HEIGHT, EPD_WIDTH), 255)
+    draw = ImageDraw.Draw(mask)
+    condition = icon(weather['condition'], (100, 100))
+    mask.paste(condition, (0, 0), condition)
+    draw.text((110, 2), time.strftime("%Y-%m-%d") + "  " + time.strftime("%H:%M"), font=fonts['medium'], fill=0)
+    condRows = wrap(weather['conditiontxt'], width=14)[:2]
+    draw.text((110, 20), condRows[0], font=fonts['big'], fill=0)
+    if len(condRows) == 2:
+        draw.text((110, 40), condRows[1], font=fonts['big'], fill=0)
+    mask.paste(sunrise, (105, 70), sunrise)
+    mask.paste(sunset, (190, 70), sunset)
+    draw.text((140, 80), weather['sunRise'], font=fonts['small'], fill=0)
+    draw.text((220, 80), weather['sunSet'], font=fonts['small'], fill=0)
+    wind_dir = direction.rotate(float(weather['windDir']))
+    mask.paste(temperature, (5, 110), temperature)
+    mask.paste(humidity, (70, 110), humidity)
+    mask.paste(pressure, (132, 110), pressure)
+    mask.paste(wind_dir, (198, 110), wind_dir)
+    draw.text((5, 138), str(weather['currTemp']) + '°' + app.TEMP_UNIT, font=fonts['medium'], fill=0)
+    draw.text((70, 138), str(weather['humidity']) + '%', font=fonts['medium'], fill=0)
+    draw.text((132, 138), str(weather['pressure']) + 'kPa', font=fonts['medium'], fill=0)
+    draw.text((233, 110), weather['windDirTxt'], font=fonts['medium'], fill=0)
+    draw.text((198, 138), str(int(weather['windSpeed'])) + app.SPEED_UNIT, font=fonts['medium'], fill=0)
+    draw.line((0, 100, EPD_HEIGHT, 100), fill=0)
+    draw.line((0, 160, EPD_HEIGHT, 160), fill=0)
+    draw.line((100, 0, 100, 100), fill=0)
+    legacyStatus(draw, weather, sensor)
+    return mask
+
+
+def legacyFrame3(weather, sensor):
+    mask = Image.new('1', (EPD_HEIGHT, EPD_WIDTH), 255)
+    draw = ImageDraw.Draw(mask)
+    draw.text((5, 0), app.FORECAST_TITLE, font=fonts['big'], fill=0)
+    draw.line((0, 28, EPD_HEIGHT, 28), fill=0)
+    draw.line((70, 28, 70, EPD_WIDTH - 15), fill=0)
+    draw.line((132, 28, 132, EPD_WIDTH - 20), fill=0)
+    draw.line((198, 28, 198, EPD_WIDTH - 20), fill=0)
+    draw.line((0, EPD_WIDTH - 15, EPD_HEIGHT, EPD_WIDTH - 15), fill=0)
+    for day, x in enumerate((5, 75, 137, 203)):
+        n = str(day + 1)
+        date = datetime.now() + timedelta(days=day)
+        draw.text((x, 33), date.strftime("%A"), font=fonts['small'], fill=0)
+        c1 = icon(weather['conditionDay' + n], (50, 50))
+        mask.paste(c1, (x, 43), c1)
+        condTxt = wrap(weather['condDay' + n + 'Txt'], 10)[:2]
+        if len(condTxt) > 1:
+            draw.text((x, 83), condTxt[0], font=fonts['extraSmall'], fill=0)
+            draw.text((x, 98), condTxt[1], font=fonts['extraSmall'], fill=0)
+        else:
+            draw.text((x, 99), condTxt[0], font=fonts['extraSmall'], fill=0)
+        draw.text((x, 113), str(weather['tempMinDay' + n]) + '°' + app.TEMP_UNIT, font=fonts['medium'], fill=0)
+        draw.text((x, 130), str(weather['tempMaxDay' + n]) + '°' + app.TEMP_UNIT, font=fonts['medium'], fill=0)
+    legacyStatus(draw, weather, sensor)
+    return mask
+
+
+def legacyStatus(draw, weather, sensor):
+    draw.text((5, EPD_WIDTH - 18), time.strftime("%Y-%m-%d") + ' ' + time.strftime("%H:%M"), font=fonts['small'], fill=0)
+    if sensor:
+        draw.text((188, EPD_WIDTH - 18), 'BAT: ' + weather['battery'] + 'V', font=fonts['small'], fill=0)
+
+
+def layoutFrame(name, weather):
+    return layout.render(name, app.frameValues(weather), app.assets)
+
+
+def main():
+    weather = loadWeather()
+    sensor = 'sensor' in layout.flags
+    failed = False
+    legacy = {'frame1': legacyFrame1, 'frame2': legacyFrame2, 'frame3': legacyFrame3}
+    for name, func in legacy.items():
+        expected = func(flatWeather(weather), sensor).tobytes()
+        if layoutFrame(name, weather).tobytes() != expected:
+            print('{:8s} MISMATCH'.format(name))
+            failed = True
+            continue
+
+        t_legacy = min(timeit.repeat(lambda: func(flatWeather(weather), sensor), number=1, repeat=ROUNDS))
+        t_layout = min(timeit.repeat(lambda: layoutFrame(name, weather), number=1, repeat=ROUNDS))
+        frame = layout.frames[name]
+        print('{:8s} identical  hand-coded {:7.2f} ms  layout ops {:7.2f} ms  ({} static ops cached, {} dynamic)'.format(
+            name, t_legacy * 1000, t_layout * 1000, len(frame.static), len(frame.dynamic)))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# coding: utf-8
+#
+# Metrics export of one refresh cycle, and its overhead
+#
+# Runs a refresh cycle against a fixture provider on the fake panel backend
+# with the metrics written to temporary files, prints the JSON line and part
+# of the Prometheus textfile, then times the instrumentation calls enabled and
+# disabled:
+#
+#     python benchmarks/bench_metrics.py
+#
+
+import os
+import re
+import sys
+import json
+import timeit
+import tempfile
+
+from standin import StandIn
+
+ROUNDS = 100000
+
+tmp_dir = tempfile.mkdtemp()
+standin = StandIn('forecast')
+os.environ.update({
+    'EPD_BACKEND': 'fake',
+    'WEATHER_PROVIDER': 'fixture',
+    'FIXTURE_URL': standin.url + '/forecast.json',
+    'METRICS_TEXTFILE': os.path.join(tmp_dir, 'weather.prom'),
+    'METRICS_JSON': os.path.join(tmp_dir, 'weather.jsonl'),
+})
+
+from common import loadMain  # noqa: E402
+import forecast  # noqa: E402
+import metrics  # noqa: E402
+
+forecast.CACHE_FILE = os.path.join(tmp_dir, 'weather.json')
+app = loadMain()
+app.test_mode = False
+
+# name{label="value",...} value
+PROM_LINE = re.compile(r'^[a-z_]+(\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\})? [0-9.e+-]+$')
+
+
+def perCall(stmt):
+    return min(timeit.repeat(stmt, number=ROUNDS, repeat=3)) / ROUNDS * 1e9
+
+
+def main():
+    app.refreshCycle()
+    app.display.drain()
+
+    with open(metrics.METRICS_JSON) as f:
+        record = json.loads(f.readlines()[-1])
+    print('JSON line of the cycle:')
+    for group in ('observed', 'counted'):
+        for name, value in sorted(record[group].items()):
+            print('  {:52s} {}'.format(name, value))
+
+    with open(metrics.METRICS_TEXTFILE) as f:
+        lines = f.read().splitlines()
+    bad = [line for line in lines if not line.startswith('#') and not PROM_LINE.match(line)]
+    print('\ntextfile: {} lines, {} malformed'.format(len(lines), len(bad)))
+    for line in lines:
+        if line.startswith('weather_spi_bytes') or line.startswith('weather_refreshes'):
+            print('  ' + line)
+
+    enabled = perCall(lambda: metrics.observe('render_seconds', 0.004, frame='frame1'))
+    enabled_timer = perCall(lambda: metrics.timer('render_seconds', frame='frame1').__enter__())
+    metrics.disable()
+    disabled = perCall(lambda: metrics.observe('render_seconds', 0.004, frame='frame1'))
+    disabled_timer = perCall(lambda: metrics.timer('render_seconds', frame='frame1').__enter__())
+    print('\nobserve()  enabled {:6.0f} ns  disabled {:4.0f} ns per call'.format(enabled, disabled))
+    print('timer()    enabled {:6.0f} ns  disabled {:4.0f} ns per call'.format(enabled_timer, disabled_timer))
+
+    standin.stop()
+    return 1 if bad else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+# coding: utf-8
+#
+# Partial refresh check on the fake epdconfig backend
+#
+# Pushes a frame, changes the clock and temperature areas, then lets
+# EPD.display_partial refresh it. The recorded command stream is replayed onto
+# the previous buffer to make sure the panel ends up with the new frame, and
+# the SPI bytes of a full and a partial refresh are compared:
+#
+#     python benchmarks/bench_partial.py
+#
+
+import os
+import sys
+from PIL import Image
+from PIL import ImageDraw
+
+os.environ['EPD_BACKEND'] = 'fake'
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, base_dir)
+
+from waveshare_epd import epdconfig  # noqa: E402
+from waveshare_epd import epd2in7  # noqa: E402
+
+
+def frame(temp, clock):
+    mask = Image.new('1', (epd2in7.EPD_HEIGHT, epd2in7.EPD_WIDTH), 255)
+    draw = ImageDraw.Draw(mask)
+    draw.line((0, 100, epd2in7.EPD_HEIGHT, 100), fill=0)
+    draw.text((110, 0), temp, fill=0)
+    draw.text((5, 158), clock, fill=0)
+    return mask
+
+
+def replay(buf, width, stream):
+    """ Apply the 0x15 window writes of a command stream onto `buf` """
+    buf = bytearray(buf)
+    stride = int(width / 8)
+    for command, data in stream:
+        if command != 0x15:
+            continue
+        x, y, w, l = [(data[i] << 8) | data[i + 1] for i in range(0, 8, 2)]
+        window = data[8:]
+        cols = int(w / 8)
+        for row in range(l):
+            start = (y + row) * stride + int(x / 8)
+            buf[start:start + cols] = window[row * cols:(row + 1) * cols]
+    return bytes(buf)
+
+
+def sent_bytes(stream):
+    return sum(1 + len(data) for command, data in stream)
+
+
+def main():
+    backend = epdconfig.implementation
+    epd = epd2in7.EPD()
+    epd.init()
+
+    old = epd.getbuffer(frame('21.5', '2020-04-01 10:00'))
+    new = epd.getbuffer(frame('21.7', '2020-04-01 10:05'))
+
+    backend.reset_stream()
+    epd.display(old)
+    full = backend.commands()
+
+    backend.reset_stream()
+    regions = epd.display_partial(new)
+    partial = backend.commands()
+
+    print('windows:', regions)
+    print('commands:', ' '.join('0x{:02X}'.format(command) for command, data in partial))
+    print('full refresh    {:6d} bytes'.format(sent_bytes(full)))
+    print('partial refresh {:6d} bytes'.format(sent_bytes(partial)))
+
+    if replay(old, epd.width, partial) != bytes(new):
+        print('MISMATCH: replayed windows do not reproduce the new frame')
+        return 1
+    print('replayed windows reproduce the new frame')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+# coding: utf-8
+#
+# Benchmark suite for the render -> pack -> transfer pipeline
+#
+# Times every stage on the fixture weather: rendering the three frames,
+# EPD.getbuffer in both orientations and EPD.init/display/display_partial/Clear
+# on the fake epdconfig backend, which also counts the SPI bytes and calls,
+# GPIO level changes and reset/busy delays of each panel operation. Runs on
+# any PC, without spidev or RPi.GPIO.
+#
+# The results are compared with benchmarks/baseline.json: a stage fails if
+# it moves more SPI bytes, toggles more GPIOs or waits longer than before.
+# The times are printed next to the baseline, but the stages take well under
+# a millisecond and the same machine measures them up to twice as slow from
+# one run to the next, so they only fail the run with --times (and only on
+# the platform the baseline was recorded on): then a stage fails if it got
+# slower than the tolerance allows and by more than MIN_MS.
+#
+#     python benchmarks/bench_pipeline.py                # compare
+#     python benchmarks/bench_pipeline.py --save         # record a new baseline
+#     python benchmarks/bench_pipeline.py --times --tolerance 1 --repeat 200
+#
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+from PIL import Image
+from PIL import ImageDraw
+
+os.environ['EPD_BACKEND'] = 'fake'
+
+from common import bench_dir, loadMain, loadWeather  # noqa: E402
+from waveshare_epd import epdconfig  # noqa: E402
+from waveshare_epd import epd2in7  # noqa: E402
+
+BASELINE = os.path.join(bench_dir, 'baseline.json')
+COUNTERS = ('spi_bytes', 'spi_calls', 'gpio_toggles', 'delay_ms')
+# slowdowns smaller than this are timer noise, whatever the percentage
+MIN_MS = 0.1
+
+app = loadMain()
+fake = epdconfig.implementation
+
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def panelStage(func, repeat):
+    """ Time a panel operation and count what the last run of it sent """
+    def run():
+        fake.reset_stream()
+        func()
+    result = {'ms': timed(run, repeat)}
+    result.update({
+        'spi_bytes': fake.spi_bytes(),
+        'spi_calls': len(fake.transfers),
+        'gpio_toggles': fake.toggles,
+        'delay_ms': fake.delayed_ms,
+    })
+    return result
+
+
+def changed(image):
+    """ `image` with a new temperature, small enough for a partial refresh """
+    image = image.copy()
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((110, 0, 263, 40), fill=255)
+    draw.text((110, 0), '15.1', fill=0)
+    return image
+
+
+def runStages(repeat):
+    weather = loadWeather()
+    stages = {}
+    for name, update in (('frame1', app.updateFrame1), ('frame2', app.updateFrame2), ('frame3', app.updateFrame3)):
+        update(weather)  # warm the asset cache and the static backgrounds
+        stages['render.' + name] = {'ms': timed(lambda: update(weather), repeat)}
+
+    epd = epd2in7.EPD()
+    landscape = app.frames.get('frame1').image
+    portrait = landscape.transpose(Image.ROTATE_270)
+    stages['getbuffer.landscape'] = {'ms': timed(lambda: epd.getbuffer(landscape), repeat)}
+    stages['getbuffer.portrait'] = {'ms': timed(lambda: epd.getbuffer(portrait), repeat)}
+
+    old = bytes(epd.getbuffer(landscape))
+    new = bytes(epd.getbuffer(changed(landscape)))
+
+    def partial():
+        epd.last_buffer = old
+        epd.partials = 0
+        epd.display_partial(new)
+
+    stages['epd.init'] = panelStage(epd.init, repeat)
+    stages['epd.display'] = panelStage(lambda: epd.display(new), repeat)
+    stages['epd.display_partial'] = panelStage(partial, repeat)
+    stages['epd.Clear'] = panelStage(lambda: epd.Clear(0xFF), repeat)
+    return stages
+
+
+def compare(stages, baseline, tolerance, times=False):
+    """ Regressions of `stages` against `baseline`: the counters, and with `times` the timings """
+    if times and baseline.get('platform') != platform.platform():
+        print('baseline recorded on {}, comparing counts only\n'.format(baseline.get('platform')))
+        times = False
+
+    regressions = []
+    print('{:22s} {:>9s} {:>9s} {:>7s}  {}'.format('stage', 'ms', 'baseline', 'change', 'counters'))
+    for name, result in stages.items():
+        base = baseline['stages'].get(name)
+        if base is None:
+            print('{:22s} {:9.3f} {:>9s}'.format(name, result['ms'], 'new'))
+            continue
+        change = result['ms'] / base['ms'] - 1 if base['ms'] else 0
+        counters = ' '.join('{}={}'.format(key, result[key]) for key in COUNTERS if key in result)
+        print('{:22s} {:9.3f} {:9.3f} {:+6.0%}  {}'.format(name, result['ms'], base['ms'], change, counters))
+        if times and change > tolerance and result['ms'] - base['ms'] > MIN_MS:
+            regressions.append('{}: {:.3f} ms, baseline {:.3f} ms'.format(name, result['ms'], base['ms']))
+        for key in COUNTERS:
+            if key in base and result[key] > base[key]:
+                regressions.append('{}: {} {}, baseline {}'.format(name, key, result[key], base[key]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the render -> pack -> transfer pipeline')
+    parser.add_argument('--save', action='store_true', help='record the results as the new baseline')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file (default: %(default)s)')
+    parser.add_argument('--times', action='store_true', help='fail on slower stages too, not just on the counters')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed slowdown with --times, 0.5 = 50%% (default)')
+    parser.add_argument('--repeat', type=int, default=20, help='runs per stage, the median is kept')
+    args = parser.parse_args()
+
+    stages = runStages(args.repeat)
+
+    if args.save or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w') as f:
+            json.dump({'platform': platform.platform(), 'stages': stages}, f, indent=4, sort_keys=True)
+            f.write('\n')
+        for name, result in stages.items():
+            print('{:22s} {:9.3f} ms'.format(name, result['ms']))
+        print('\nbaseline saved to ' + args.baseline)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(stages, baseline, args.tolerance, args.times)
+    if regressions:
+        print('\nREGRESSIONS:\n  ' + '\n  '.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
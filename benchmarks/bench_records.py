@@ -0,0 +1,122 @@
+# coding: utf-8
+#
+# Typed weather records against the flattened weather dict
+#
+# Checks packWeather()/unpackWeather() round-trip the fixture weather (with
+# and without the optional parts), compares the packed size with the JSON
+# cache blocks and pickle, times the change detection hash against the one of
+# the flattened dict and compares the memory both hold and allocate per cycle:
+#
+#     python benchmarks/bench_records.py
+#
+
+import sys
+import json
+import time
+import pickle
+import hashlib
+import tracemalloc
+from dataclasses import replace
+from datetime import datetime, timedelta
+
+from common import loadMain, loadWeather, flatWeather
+from records import packWeather, unpackWeather, toBlock
+
+ROUNDS = 2000
+
+
+def deepSize(value, seen=None):
+    """ Bytes held by `value` and everything it refers to """
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deepSize(k, seen) + deepSize(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(deepSize(v, seen) for v in value)
+    elif hasattr(value, '__slots__'):
+        size += sum(deepSize(getattr(value, name), seen) for name in value.__slots__)
+    return size
+
+
+def timed(func, rounds=ROUNDS):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1000000
+
+
+def allocated(func):
+    """ Bytes allocated by one call of `func` """
+    tracemalloc.start()
+    func()
+    size = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size
+
+
+def main():
+    failed = []
+    app = loadMain()
+    weather = loadWeather()
+
+    def flatHash():
+        # the hash of the flattened dict, as weatherHash() used to compute it
+        record = flatWeather(weather)
+        record.update(app.hourlyValues(weather.hourly))
+        record = dict((key, str(value)) for key, value in record.items())
+        record['units'] = app.TEMP_UNIT + app.SPEED_UNIT
+        record['date'] = time.strftime("%Y-%m-%d")
+        return hashlib.sha1(json.dumps(record, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def flatValues():
+        # the frame values built from the flattened dict, as frameValues() used to
+        values = dict(flatWeather(weather))
+        values['TEMP_UNIT'] = app.TEMP_UNIT
+        values['SPEED_UNIT'] = app.SPEED_UNIT
+        values['date'] = time.strftime("%Y-%m-%d")
+        values['time'] = time.strftime("%H:%M")
+        now = datetime.now()
+        for day in range(4):
+            values['day' + str(day)] = (now + timedelta(days=day)).strftime("%A")
+        return values
+
+    for label, variant in (('full', weather), ('no sensor', replace(weather, sensor=None)),
+                           ('no hourly', replace(weather, hourly=None))):
+        data = packWeather(variant)
+        copy = unpackWeather(data)
+        if packWeather(copy) != data or copy.current != variant.current or copy.days != variant.days \
+                or copy.sensor != variant.sensor:
+            failed.append('{}: unpacked weather differs'.format(label))
+
+    blocks = dict((name, toBlock(name, getattr(weather, field)))
+                  for name, field in (('currently', 'current'), ('daily', 'days')))
+    blocks['hourly'] = dict((field, column.tolist()) for field, column in weather.hourly._asdict().items())
+    print('serialized weather   ({} days, {} hours)'.format(len(weather.days), len(weather.hourly.time)))
+    print('  packWeather        {:6d} bytes'.format(len(packWeather(weather))))
+    print('  JSON blocks        {:6d} bytes'.format(len(json.dumps(blocks))))
+    print('  pickle             {:6d} bytes'.format(len(pickle.dumps(weather, protocol=pickle.HIGHEST_PROTOCOL))))
+    print('  pack               {:6.1f} us'.format(timed(lambda: packWeather(weather))))
+    print('  pack + unpack      {:6.1f} us'.format(timed(lambda: unpackWeather(packWeather(weather)))))
+
+    print('\nchange detection hash')
+    print('  packed records     {:6.1f} us'.format(timed(lambda: app.weatherHash(weather))))
+    print('  flattened dict     {:6.1f} us'.format(timed(flatHash)))
+
+    print('\nmemory held          records {:6d} bytes  flattened dict {:6d} bytes  (without hourly)'.format(
+        deepSize(replace(weather, hourly=None)), deepSize(flatWeather(weather))))
+    print('allocated per cycle  records {:6d} bytes  flattened dict {:6d} bytes  (frame values)'.format(
+        allocated(lambda: app.frameValues(weather)), allocated(flatValues)))
+    print('frame values         records {:6.1f} us     flattened dict {:6.1f} us'.format(
+        timed(lambda: app.frameValues(weather)), timed(flatValues)))
+
+    if failed:
+        print('\nFAILED:\n  ' + '\n  '.join(failed))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
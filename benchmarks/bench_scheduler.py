@@ -0,0 +1,104 @@
+# coding: utf-8
+#
+# Refresh scheduler on the fake panel backend
+#
+# Runs the refresh cycle of the main script against a fixture provider, first
+# in a plain `cycle; time.sleep(period)` loop and then on the scheduler, with
+# a short period, and prints how far each cycle started from the wall-clock
+# boundary. Then checks that SIGHUP forces a refresh and SIGTERM puts the
+# panel to deep sleep:
+#
+#     python benchmarks/bench_scheduler.py
+#
+
+import os
+import sys
+import time
+import signal
+import tempfile
+import threading
+
+os.environ['EPD_BACKEND'] = 'fake'
+
+from common import loadMain  # noqa: E402
+from standin import StandIn  # noqa: E402
+
+PERIOD = 1.0
+CYCLES = 5
+# extra time each cycle takes, standing in for a slow fetch and panel refresh
+WORK = 0.3
+
+standin = StandIn('forecast')
+os.environ.update({
+    'WEATHER_PROVIDER': 'fixture',
+    'FIXTURE_URL': standin.url + '/forecast.json',
+})
+
+import forecast  # noqa: E402
+from scheduler import Scheduler, nextBoundary  # noqa: E402
+from waveshare_epd import epdconfig  # noqa: E402
+
+forecast.CACHE_FILE = os.path.join(tempfile.mkdtemp(), 'weather.json')
+app = loadMain()
+app.test_mode = False
+app.DEBUG = False
+starts = []
+
+
+def cycle():
+    starts.append(time.time())
+    app.refreshCycle()
+    time.sleep(WORK)
+
+
+def offsets(boundaries):
+    return ' '.join('{:+5.0f}'.format((start - boundary) * 1000) for start, boundary in zip(starts, boundaries))
+
+
+def main():
+    failed = False
+
+    time.sleep(nextBoundary(time.time(), PERIOD) - time.time())
+    first = time.time()
+    for _ in range(CYCLES):
+        cycle()
+        time.sleep(PERIOD)
+    print('sleep loop  start vs boundary (ms): ' + offsets(first + i * PERIOD for i in range(CYCLES)))
+
+    del starts[:]
+    scheduler = Scheduler()
+    scheduler.every(PERIOD, cycle)
+    signalled = {}
+
+    def signals():
+        # the scheduler runs the cycle once at start, then on the boundaries
+        while len(starts) < CYCLES + 1:
+            time.sleep(0.01)
+        time.sleep(PERIOD / 2)
+        signalled['hup'] = time.time()
+        os.kill(os.getpid(), signal.SIGHUP)
+        while starts[-1] < signalled['hup']:
+            time.sleep(0.01)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    threading.Thread(target=signals, daemon=True).start()
+    scheduler.run(on_stop=app.shutdown)
+    forced = [start for start in starts if start > signalled['hup']][0]
+    del starts[0]
+    del starts[CYCLES:]
+    print('scheduler   start vs boundary (ms): ' + offsets(round(start / PERIOD) * PERIOD for start in starts))
+    print('SIGHUP      forced cycle {:.0f} ms after the signal, {} forced'.format(
+        (forced - signalled['hup']) * 1000, scheduler.stats['forced']))
+
+    stream = epdconfig.implementation.commands()
+    slept = stream[-2:] == [(0x02, b''), (0x07, b'\xa5')]
+    print('SIGTERM     panel put to deep sleep: {}'.format('yes' if slept else 'NO'))
+    if not slept or scheduler.stats['forced'] != 1:
+        failed = True
+
+    standin.stop()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+# coding: utf-8
+#
+# Local store of the ThingSpeak readings
+#
+# Serves a synthetic channel (a reading every 5 minutes) from a stand-in that
+# honours the start/end/results parameters like ThingSpeak, then checks the
+# first run backfills TS_BACKFILL_DAYS in pages, a cycle only asks for the new
+# entries, an outage is caught up without gaps, a restart fetches no history
+# again, and downsampling keeps the hourly averages. Times the range queries,
+# then checks a sensor silent for longer than TS_RAW_DAYS (everything folded)
+# starts neither a backfill nor a second count of the folded readings:
+#
+#     python benchmarks/bench_sensorstore.py
+#
+
+import os
+import sys
+import json
+import time
+import math
+import tempfile
+from urllib.parse import urlsplit, parse_qs
+from datetime import datetime, timezone
+
+from standin import StandIn
+
+STEP = 300
+PAGE = 1000
+
+standin = StandIn('thingspeak')
+store_dir = tempfile.TemporaryDirectory()
+os.environ['TS_HOST'] = standin.url
+os.environ['TS_STORE'] = os.path.join(store_dir.name, 'sensor.db')
+os.environ['TS_BACKFILL_DAYS'] = '7'
+os.environ['TS_RAW_DAYS'] = '7'
+
+import TSfetch  # noqa: E402
+
+TSfetch.TS_MAX_RESULTS = PAGE
+channel = []
+
+
+def addEntries(count, start=None):
+    t = channel[-1][1] + STEP if start is None else start
+    for _ in range(count):
+        temp = 10 + 8 * math.sin(2 * math.pi * t / 86400)
+        channel.append((len(channel) + 1, t, '{:.2f}'.format(temp), '3.05'))
+        t += STEP
+
+
+def respond(path):
+    query = parse_qs(urlsplit(path).query)
+
+    def seconds(name, default):
+        if name not in query:
+            return default
+        return datetime.strptime(query[name][0], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+
+    start, end = seconds('start', 0), seconds('end', float('inf'))
+    results = int(query.get('results', ['100'])[0])
+    entries = [e for e in channel if start <= e[1] <= end][-results:]
+    feeds = [
+        {'entry_id': e[0], 'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(e[1])),
+         'field1': e[2], 'field2': e[3]} for e in entries
+    ]
+    standin.bodies.append(len(json.dumps({'feeds': feeds})))
+    return json.dumps({'channel': {'id': 456466}, 'feeds': feeds}).encode()
+
+
+def fetch(label):
+    hits = standin.hits
+    standin.bodies = []
+    start = time.perf_counter()
+    ts_data = TSfetch.fetchThingSpeak()
+    elapsed = time.perf_counter() - start
+    stats = TSfetch.ts_stats
+    print('{:22s} {:7.1f} ms  {} requests  {:7d} bytes  {:5d} added  TEMP {}'.format(
+        label, elapsed * 1000, standin.hits - hits, sum(standin.bodies), stats['added'], ts_data.temp))
+    return ts_data
+
+
+def main():
+    failed = []
+    standin.respond = respond
+    now = int(time.time()) // STEP * STEP
+    # 10 days of history, the last reading just now
+    addEntries(10 * 86400 // STEP, start=now - 10 * 86400 + STEP)
+
+    ts_data = fetch('first run (backfill)')
+    store = TSfetch.ts_store
+    expected = sum(1 for e in channel if e[1] >= now - 7 * 86400)
+    stored = len(store.readings(0).time)
+    if TSfetch.ts_stats['pages'] < 2 or abs(stored - expected) > 1:
+        failed.append('backfill stored {} of {} readings in {} pages'.format(stored, expected, TSfetch.ts_stats['pages']))
+    if ts_data.temp != float(channel[-1][2]):
+        failed.append('latest reading is not the newest entry')
+
+    addEntries(2)
+    fetch('next cycle')
+    if TSfetch.ts_stats['added'] != 2 or TSfetch.ts_stats['pages'] != 1:
+        failed.append('a cycle did not fetch just the new entries')
+    fetch('no new entries')
+
+    addEntries(2500)
+    fetch('after an outage')
+    times = store.readings(0).time
+    if any(b - a != STEP for a, b in zip(times, times[1:])):
+        failed.append('gaps after catching up an outage')
+    if times[-1] != channel[-1][1]:
+        failed.append('outage not caught up to the newest entry')
+
+    store.close()
+    TSfetch.ts_store = None
+    fetch('restart')
+    if TSfetch.ts_stats['added'] or TSfetch.ts_stats['pages'] != 1:
+        failed.append('a restart fetched history again')
+    store = TSfetch.ts_store
+
+    # a week later everything older than 7 days is folded into hourly rows
+    raw = store.readings(0)
+    store.prune(now + 7 * 86400)
+    cutoff = int(now) // 3600 * 3600
+    hourly = store.hourly(0)
+    remaining = store.readings(0)
+    if remaining.time[0] < cutoff or len(remaining.time) != sum(1 for t in raw.time if t >= cutoff):
+        failed.append('raw readings older than the cutoff were kept')
+    worst = 0
+    for hour, temp in zip(hourly.time, hourly.temp):
+        values = [v for t, v in zip(raw.time, raw.temp) if hour <= t < hour + 3600]
+        worst = max(worst, abs(temp - sum(values) / len(values)))
+    print('downsampled            {} readings -> {} hourly rows + {} raw, max error {:.1e}'.format(
+        len(raw.time), len(hourly.time), len(remaining.time), worst))
+    if worst > 1e-9:
+        failed.append('hourly averages differ from the raw readings')
+
+    start = time.perf_counter()
+    for _ in range(100):
+        day = store.readings(remaining.time[-1] - 86400)
+    t_day = (time.perf_counter() - start) / 100
+    start = time.perf_counter()
+    for _ in range(100):
+        year = store.hourly(0)
+    t_year = (time.perf_counter() - start) / 100
+    print('last 24 h raw          {:7.2f} ms  {} readings, {} bytes of arrays'.format(
+        t_day * 1000, len(day.time), sum(c.itemsize * len(c) for c in day[:3])))
+    print('all hourly             {:7.2f} ms  {} hours'.format(t_year * 1000, len(year.time)))
+
+    # nothing new for a month: every reading is folded, then a backfill longer than TS_RAW_DAYS
+    store.prune(now + 30 * 86400)
+    counted = store.db.execute('SELECT sum(count) FROM hourly').fetchone()[0]
+    TSfetch.TS_BACKFILL_DAYS = 14
+    hits = standin.hits
+    TSfetch.fetchThingSpeak()
+    store.prune(now + 30 * 86400)
+    recounted = store.db.execute('SELECT sum(count) FROM hourly').fetchone()[0]
+    print('silent sensor          {} requests  {} readings folded, {} after the next sync'.format(
+        standin.hits - hits, counted, recounted))
+    if store.last() != tuple(channel[-1][:2]) or TSfetch.ts_stats['pages'] != 1:
+        failed.append('a silent sensor started a backfill')
+    if recounted != counted:
+        failed.append('folded readings were counted again')
+
+    standin.stop()
+    if failed:
+        print('\nFAILED:\n  ' + '\n  '.join(failed))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+# coding: utf-8
+#
+# Startup time of the refresh script
+#
+# Imports weather-refresh-2in7.py in a fresh interpreter under
+# `python -X importtime`, renders the fixture weather and reports how long
+# the import took, what loading the layout on first use cost, the time to the
+# first rendered frame and the slowest imports:
+#
+#     python benchmarks/bench_startup.py
+#
+
+import os
+import sys
+import json
+import subprocess
+
+from common import bench_dir
+
+TOP = 12
+
+CHILD = '''
+import sys, time, json
+start = time.perf_counter()
+from common import loadMain, loadWeather
+app = loadMain()
+imported = time.perf_counter()
+app.startup()
+app.frameLayout()
+layout = time.perf_counter()
+app.updateFrame1(loadWeather())
+sys.stdout.write(json.dumps({
+    'import': imported - start,
+    'layout': layout - imported,
+    'first_frame': app.startup_stats['first_frame'],
+}))
+'''
+
+
+def main():
+    env = dict(os.environ, RUN_ENV='test', PYTHONDONTWRITEBYTECODE='1')
+    child = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD],
+        cwd=bench_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+    )
+    if child.returncode:
+        print(child.stderr)
+        return 1
+    stats = json.loads(child.stdout)
+
+    imports = []
+    seen_common = False
+    for line in child.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # top-level imports only (nested ones are indented), and only those of
+        # the script, not of the interpreter startup or this benchmark
+        if name.startswith('  '):
+            continue
+        if seen_common:
+            imports.append((int(cumulative_us), name.strip()))
+        seen_common = seen_common or name.strip() == 'common'
+
+    print('import weather-refresh-2in7.py  {:7.1f} ms'.format(stats['import'] * 1000))
+    print('layout and fonts, on first use  {:7.1f} ms'.format(stats['layout'] * 1000))
+    print('time to first frame             {:7.1f} ms  (from the start of the script)'.format(stats['first_frame'] * 1000))
+    print('\nslowest imports (cumulative):')
+    for cumulative_us, name in sorted(imports, reverse=True)[:TOP]:
+        print('  {:7.1f} ms  {}'.format(cumulative_us / 1000.0, name))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+# coding: utf-8
+#
+# Rendered-text cache of the layouts
+#
+# Renders frame1-3 from the fixture weather with every string drawn through
+# FreeType (draw.text) and through the layout's TextCache, checks both give
+# the same pixels, and shows how much of each frame's render time goes to the
+# texts, uncached and cached. Then runs a day of cycles (a new time string
+# every one) against a small cache to check it stays bounded:
+#
+#     python benchmarks/bench_text.py
+#
+
+import sys
+import timeit
+from PIL import Image
+
+from common import loadMain, loadWeather
+from layout import TEXT, WRAP, TextCache, runOps
+
+ROUNDS = 50
+FRAMES = ('frame1', 'frame2', 'frame3')
+
+
+def best(func):
+    return min(timeit.repeat(func, number=1, repeat=ROUNDS)) * 1000
+
+
+def main():
+    failed = []
+    app = loadMain()
+    layout = app.frameLayout()
+    values = app.frameValues(loadWeather())
+    blank = Image.new('1', (layout.width, layout.height), 255)
+
+    print('{:8s} {:>22s} {:>22s}'.format('', 'draw.text', 'TextCache'))
+    print('{:8s} {:>10s} {:>11s} {:>10s} {:>11s}'.format('', 'render ms', 'texts ms', 'render ms', 'texts ms'))
+    for name in FRAMES:
+        texts = [op for op in layout.frames[name].dynamic if op[0] in (TEXT, WRAP)]
+        cache = layout.texts
+
+        layout.texts = None
+        uncached = layout.render(name, values, app.assets).tobytes()
+        t_render = best(lambda: layout.render(name, values, app.assets))
+        t_texts = best(lambda: runOps(texts, blank.copy(), values, app.assets))
+
+        layout.texts = cache
+        if layout.render(name, values, app.assets).tobytes() != uncached:
+            failed.append(name + ' differs with the text cache')
+        t_render_cached = best(lambda: layout.render(name, values, app.assets))
+        t_texts_cached = best(lambda: runOps(texts, blank.copy(), values, app.assets, cache))
+
+        print('{:8s} {:10.2f} {:6.2f} {:3.0f}% {:10.2f} {:6.2f} {:3.0f}%'.format(
+            name, t_render, t_texts, t_texts / t_render * 100,
+            t_render_cached, t_texts_cached, t_texts_cached / t_render_cached * 100))
+
+    # a day of 5 minute cycles: the time string is new every cycle
+    texts = TextCache(maxsize=64)
+    layout.texts = texts
+    for minute in range(0, 24 * 60, 5):
+        values['time'] = '{:02d}:{:02d}'.format(minute // 60, minute % 60)
+        for name in FRAMES:
+            layout.render(name, values, app.assets)
+    print('\na day of cycles: {} strings cached (max {}), {} hits, {} misses'.format(
+        len(texts.items), texts.maxsize, texts.hits, texts.misses))
+    if len(texts.items) > texts.maxsize:
+        failed.append('the text cache outgrew its bound')
+
+    if failed:
+        print('\nFAILED:\n  ' + '\n  '.join(failed))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
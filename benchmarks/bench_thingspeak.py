@@ -0,0 +1,81 @@
+# coding: utf-8
+#
+# Pooled ThingSpeak session against a one-off request per fetch
+#
+# Fetches from a local ThingSpeak stand-in with a new connection every time
+# (the old requests.get) and through the keep-alive session of TSfetch, then
+# checks a failing upstream is retried and ends in an error state, and that a
+# hung one is given up on within TS_DEADLINE:
+#
+#     python benchmarks/bench_thingspeak.py
+#
+
+import os
+import sys
+import time
+import requests
+
+from common import thingSpeakBody
+from standin import StandIn
+
+ROUNDS = 50
+
+standin = StandIn('thingspeak')
+standin.body = thingSpeakBody()
+os.environ['TS_HOST'] = standin.url
+os.environ['TS_STORE'] = ':memory:'
+
+import TSfetch  # noqa: E402
+
+
+def oneOff():
+    return TSfetch.parseThingSpeak(requests.get(TSfetch.TS_READ_URL).json())
+
+
+def main():
+    failed = False
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        oneOff()
+    t_oneoff = (time.perf_counter() - start) / ROUNDS
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        ts_data = TSfetch.fetchThingSpeak()
+    t_pooled = (time.perf_counter() - start) / ROUNDS
+    stats = TSfetch.ts_stats
+
+    print('one-off requests  {:6.2f} ms/fetch  {} connections'.format(t_oneoff * 1000, ROUNDS))
+    print('pooled session    {:6.2f} ms/fetch  {} connections  (last connect {:.2f} ms, request {:.2f} ms)'.format(
+        t_pooled * 1000, stats['connections'], stats['connect'] * 1000, stats['request'] * 1000))
+    if ts_data is None or stats['connections'] != 1:
+        print('pooled session did not reuse its connection')
+        failed = True
+
+    standin.status = 503
+    hits = standin.hits
+    start = time.perf_counter()
+    ts_data = TSfetch.fetchThingSpeak()
+    print('upstream 503      {} attempts in {:.1f} s  reading: {}'.format(
+        standin.hits - hits, time.perf_counter() - start, ts_data))
+    if ts_data is not None:
+        print('failure did not end in an error state')
+        failed = True
+
+    standin.status = 200
+    standin.delay = 60
+    start = time.perf_counter()
+    ts_data = TSfetch.fetchThingSpeak()
+    elapsed = time.perf_counter() - start
+    print('upstream hung     given up after {:.1f} s (TS_DEADLINE {:g} s)  reading: {}'.format(
+        elapsed, TSfetch.TS_DEADLINE, ts_data))
+    if elapsed > TSfetch.TS_DEADLINE:
+        print('a hung upstream kept the fetch past TS_DEADLINE')
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+# coding: utf-8
+#
+# Sensor trend frame
+#
+# Checks the per-column min/max reduction of trend.py against a plain Python
+# one, times it with the plot for series of growing length against drawing
+# every point as a polyline, checks a gap in the readings leaves its columns
+# empty, then renders frame4 from a sensor store filled with a day of readings:
+#
+#     python benchmarks/bench_trend.py
+#     python benchmarks/bench_trend.py --save    # also writes frame4.bmp
+#
+
+import os
+import sys
+import math
+import time
+from array import array
+import numpy as np
+from PIL import Image
+from PIL import ImageDraw
+
+os.environ['TS_STORE'] = ':memory:'
+os.environ['SENSOR'] = '1'
+
+from common import loadMain, loadWeather  # noqa: E402
+import trend  # noqa: E402
+import TSfetch  # noqa: E402
+
+WIDTH, HEIGHT = 264, 77
+ROUNDS = 20
+
+
+def series(count, span=86400, end=None):
+    end = time.time() if end is None else end
+    times = array('q', (int(end - span + span * i / count) for i in range(count)))
+    temps = array('d', (12 + 6 * math.sin(2 * math.pi * t / 86400) + (3 if i % 997 == 0 else 0)
+                        for i, t in enumerate(times)))
+    return times, temps, end - span, end
+
+
+def slowRanges(times, values, start, end, width):
+    mins, maxs = [None] * width, [None] * width
+    for t, v in zip(times, values):
+        if start <= t <= end:
+            column = min(int((t - start) / (end - start) * width), width - 1)
+            mins[column] = v if mins[column] is None else min(mins[column], v)
+            maxs[column] = v if maxs[column] is None else max(maxs[column], v)
+    return mins, maxs
+
+
+def polyline(times, values, start, end):
+    image = Image.new('1', (WIDTH, HEIGHT), 255)
+    low, high = min(values), max(values)
+    points = [((t - start) / (end - start) * (WIDTH - 1), (high - v) / (high - low) * (HEIGHT - 1))
+              for t, v in zip(times, values)]
+    ImageDraw.Draw(image).line(points, fill=0)
+    return image
+
+
+def timed(func):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func()
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+
+def main():
+    failed = []
+
+    times, temps, start, end = series(5000)
+    temps[100] = math.nan
+    mins, maxs = trend.columnRanges(times, temps, start, end, WIDTH)
+    slow_mins, slow_maxs = slowRanges(times, temps, start, end, WIDTH)
+    for fast, slow in ((mins, slow_mins), (maxs, slow_maxs)):
+        for a, b in zip(fast, slow):
+            if not (b is None and math.isnan(a) or b is not None and math.isnan(b) or a == b):
+                failed.append('column ranges differ from the plain Python ones')
+                break
+
+    print('{:>8s} {:>12s} {:>12s}'.format('points', 'min/max ms', 'polyline ms'))
+    for count in (288, 2016, 10080, 100000):
+        times, temps, start, end = series(count)
+        mask = Image.new('1', (WIDTH, HEIGHT), 255)
+        t_plot = timed(lambda: trend.pastePlot(mask, (0, 0, WIDTH - 1, HEIGHT - 1), times, temps, start, end))
+        t_line = timed(lambda: polyline(times, temps, start, end))
+        print('{:8d} {:12.2f} {:12.2f}'.format(count, t_plot, t_line))
+
+    # the spikes must survive the reduction
+    times, temps, start, end = series(100000)
+    plot = trend.plotMask(times, temps, start, end, (WIDTH, HEIGHT))
+    if not plot[0].any():
+        failed.append('the highest reading is not on the plot')
+
+    # a flat day with the sensor off for a few hours: the columns of the gap stay empty
+    times, temps, start, end = series(288)
+    kept = [i for i, t in enumerate(times) if not start + 36000 <= t < start + 50400]
+    times, temps = array('q', (times[i] for i in kept)), array('d', (15.0 for _ in kept))
+    plot = trend.plotMask(times, temps, start, end, (WIDTH, HEIGHT))
+    empty = np.isnan(trend.columnRanges(times, temps, start, end, WIDTH)[0])
+    if plot[:, empty].any():
+        failed.append('columns without readings are drawn')
+
+    app = loadMain()
+    app.DEBUG = False
+    store = TSfetch.sensorStore()
+    times, temps, start, end = series(288)
+    store.add({'entry_id': i, 'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(t)),
+               'field1': temps[i], 'field2': 3.0 - i / 2880} for i, t in enumerate(times))
+    weather = loadWeather()
+    app.updateFrame4(weather)
+    t_frame = timed(lambda: app.updateFrame4(weather))
+    print('\nframe4 render {:.2f} ms from {} readings'.format(t_frame, len(times)))
+    if '--save' in sys.argv:
+        app.frames.get('frame4').image.save('frame4.bmp')
+        print('saved frame4.bmp')
+
+    if failed:
+        print('\nFAILED:\n  ' + '\n  '.join(failed))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+# coding: utf-8
+#
+# Shared helpers for the benchmark scripts
+#
+
+import os
+import sys
+import json
+import importlib.util
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, base_dir)
+
+
+def loadMain():
+    """ Import weather-refresh-2in7.py in test mode (no panel, no GPIO) """
+    os.environ['RUN_ENV'] = 'test'
+    os.environ.setdefault('FORECAST_TITLE', '4-day forecast')
+    spec = importlib.util.spec_from_file_location('weather_refresh', os.path.join(base_dir, 'weather-refresh-2in7.py'))
+    main = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(main)
+    main.DEBUG = False
+    main.SAVE_FRAMES = False
+    return main
+
+
+def loadFixture(name):
+    with open(os.path.join(bench_dir, 'fixtures', name + '.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def thingSpeakBody(at=None):
+    """
+    The ThingSpeak fixture as served, its entry created at `at` (unix seconds,
+    default now): the sensor store folds away readings older than TS_RAW_DAYS
+    """
+    import time
+    body = loadFixture('thingspeak')
+    at = time.time() if at is None else at
+    body['feeds'][-1]['created_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(at))
+    return json.dumps(body).encode()
+
+
+def loadWeather(sensor=True):
+    """ The Weather of the forecast fixture, with the reading of the ThingSpeak one """
+    from records import Weather, SensorReading, fromBlock, hourlyArrays
+    from sensorstore import parseTime
+    blocks = loadFixture('forecast')
+    reading = None
+    if sensor:
+        feed = loadFixture('thingspeak')['feeds'][-1]
+        reading = SensorReading(parseTime(feed['created_at']), float(feed['field1']), float(feed['field2']))
+    return Weather(fromBlock('currently', blocks['currently']), fromBlock('daily', blocks['daily']),
+                   reading, hourlyArrays(blocks['hourly']))
+
+
+def flatWeather(weather):
+    """ The flattened dict getWeatherData() used to build from the same data, for comparisons """
+    current, daily = weather.current, weather.days
+    flat = {
+        'conditiontxt': current.summary,
+        'condition': current.condition,
+        'sunRise': daily[0].sunrise_time,
+        'sunSet': daily[0].sunset_time,
+        'pressure': current.pressure,
+        'humidity': current.humidity,
+        'precip': current.precip_probability,
+        'tempMin': str(daily[0].temperature_min),
+        'tempMax': str(daily[0].temperature_max),
+        'windSpeed': current.wind_speed,
+        'windDir': str(current.wind_bearing),
+        'windDirTxt': str(current.wind_direction)
+    }
+    for i, day in enumerate(daily[0:4]):
+        n = str(i + 1)
+        flat['conditionDay' + n] = day.condition
+        flat['condDay' + n + 'Txt'] = day.summary
+        flat['tempMinDay' + n] = str(day.temperature_min)
+        flat['tempMaxDay' + n] = str(day.temperature_max)
+    if weather.sensor is not None:
+        flat['currTemp'] = str(weather.sensor.temp)
+        flat['battery'] = str(weather.sensor.volt)
+    else:
+        flat['currTemp'] = current.temperature
+        flat['battery'] = '--'
+    return flat
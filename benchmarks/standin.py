@@ -0,0 +1,66 @@
+# coding: utf-8
+#
+# Local HTTP stand-in for the weather APIs
+#
+# Serves a fixture JSON for every GET (or whatever respond(path) returns, if
+# set), optionally after a delay or with an error status, and counts the
+# requests it got. Used by the benchmark scripts
+# instead of the real upstream.
+#
+
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from common import bench_dir
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StandIn:
+
+    def __init__(self, fixture, delay=0):
+        with open(os.path.join(bench_dir, 'fixtures', fixture + '.json'), 'rb') as f:
+            self.body = f.read()
+        self.delay = delay
+        self.status = 200
+        self.respond = None
+        self.hits = 0
+        self.paths = []
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, like the real APIs
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                standin.hits += 1
+                standin.paths.append(self.path)
+                if standin.delay:
+                    threading.Event().wait(standin.delay)
+                if standin.status != 200:
+                    body = b'{"code": %d, "error": "stand-in failure"}' % standin.status
+                elif standin.respond is not None:
+                    body = standin.respond(self.path)
+                else:
+                    body = standin.body
+                self.send_response(standin.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
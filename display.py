@@ -0,0 +1,116 @@
+# coding: utf-8
+#
+# Weather station display for Raspberry and Waveshare 2.7" e-Paper display
+# (display worker)
+#
+# Copyright by Antal Rutz
+#
+# Documentation and full source code:
+# https://github.com/arutz12/Raspberry-Weather-EPD
+#
+# Everything that talks to the panel goes through one worker thread, so SPI
+# transfers of two requests never interleave. Only one request can wait behind
+# the one being drawn: a newer request replaces it, since whatever it would
+# have shown is overwritten right after anyway. Periodic requests (the refresh
+# cycle) are the exception: one never replaces a waiting button press, it is
+# dropped instead, so the frame the user asked for is the one shown.
+#
+
+import time
+import threading
+from concurrent.futures import Future
+
+
+class DisplayWorker:
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.pending = None
+        self.busy = False
+        self.stopping = False
+        self.thread = None
+        # 'requests': received, 'done': run, 'dropped': replaced by a newer one
+        # (or, periodic, given way to a waiting one) before they ran,
+        # 'wait'/'max_wait': seconds from request to start
+        self.stats = {'requests': 0, 'done': 0, 'dropped': 0, 'wait': None, 'max_wait': 0.0}
+
+    def depth(self):
+        """ Requests in the worker: the one being drawn plus the one waiting """
+        with self.cond:
+            return int(self.busy) + int(self.pending is not None)
+
+    def request(self, func, *args, periodic=False):
+        """
+        Run func(*args) on the worker thread; safe to call from any thread.
+        A `periodic` request is dropped rather than replace a waiting one that
+        is not periodic. Returns a Future done once the request ran (with
+        what func returned) or cancelled if it was dropped, None once stopping.
+        """
+        with self.cond:
+            if self.stopping:
+                return None
+            self.stats['requests'] += 1
+            return self.put(func, args, periodic)
+
+    def put(self, func, args, periodic=False):
+        future = Future()
+        if self.pending is not None:
+            self.stats['dropped'] += 1
+            if periodic and not self.pending[3]:
+                future.cancel()
+                return future
+            self.pending[4].cancel()
+        self.pending = (func, args, time.monotonic(), periodic, future)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='display', daemon=True)
+            self.thread.start()
+        self.cond.notify_all()
+        return future
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.pending is None and not self.stopping:
+                    self.cond.wait()
+                if self.pending is None:
+                    return
+                func, args, requested, periodic, future = self.pending
+                self.pending = None
+                self.busy = True
+                wait = time.monotonic() - requested
+                self.stats['wait'] = wait
+                self.stats['max_wait'] = max(self.stats['max_wait'], wait)
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                print(e)
+                future.set_exception(e)
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.stats['done'] += 1
+                    self.cond.notify_all()
+
+    def drain(self):
+        """ Wait until nothing is being drawn or waiting """
+        with self.cond:
+            while self.busy or self.pending is not None:
+                self.cond.wait()
+
+    def stop(self, last=None):
+        """
+        Drop the waiting request, let the one being drawn finish, then run
+        `last` (e.g. putting the panel to sleep) as the final job
+        """
+        with self.cond:
+            if last is not None:
+                self.put(last, ())
+            elif self.pending is not None:
+                self.stats['dropped'] += 1
+                self.pending[4].cancel()
+                self.pending = None
+            self.stopping = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,292 @@
+# coding: utf-8
+#
+# Weather station display for Raspberry and Waveshare 2.7" e-Paper display
+# (one service for several panels)
+#
+# Copyright by Antal Rutz
+#
+# Documentation and full source code:
+# https://github.com/arutz12/Raspberry-Weather-EPD
+#
+# Every target in TARGETS (see targets.sample.json) names a location, a
+# layout, the frame to show and a sink (sinks.py). Each cycle every distinct
+# location is fetched once, the frames of all targets are rendered in
+# parallel on a pool of processes and the packed buffers go to the sinks,
+# each on its own display worker. The layouts (fonts, static backgrounds)
+# are loaded before the pool is started, so the forked workers share them
+# instead of loading their own; the weather goes to them packed
+# (records.packWeather), a couple of KB per target.
+#
+
+import os
+import sys
+import json
+import time
+import locale
+import hashlib
+import multiprocessing
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+from display import DisplayWorker
+from layout import AssetCache, loadLayout
+from records import Weather, packWeather, unpackWeather
+from framevalues import unitNames, hourlyValues, frameValues, weatherHash
+from sinks import makeSink
+from waveshare_epd.packing import pack_image
+import metrics
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+dotenv_path = os.path.join(base_dir, '.env')
+load_dotenv(dotenv_path)
+
+LOCALE = os.environ.get('LOCALE')
+FORECAST_TITLE = os.environ.get('FORECAST_TITLE')
+TARGETS = os.environ.get('TARGETS') or os.path.join(base_dir, 'targets.json')
+LAYOUT = os.environ.get('LAYOUT') or '2in7'
+# render processes, one per core by default
+FANOUT_WORKERS = int(os.environ.get('FANOUT_WORKERS') or 0) or os.cpu_count()
+# seconds the forecast of a location may take before the cycle goes on without it
+WEATHER_DEADLINE = float(os.environ.get('WEATHER_DEADLINE') or 20)
+# refresh a panel after this many seconds even if nothing changed
+MAX_REFRESH_AGE = int(os.environ.get('MAX_REFRESH_AGE') or 3600)
+SLEEPTIME = 300
+
+folder_img = os.path.join(base_dir, 'icons')
+
+# location: (latitude, longitude), None for the configured one; sink: see sinks.makeSink()
+Target = namedtuple('Target', ['name', 'location', 'layout', 'frame', 'sink'])
+# the frames drawn from the forecast alone; frame4 needs the sensor history
+# of the refresh script. The hourly ones are skipped while a location has no
+# hourly forecast for the next hours.
+FRAMES = ('frame1', 'frame2', 'frame3', 'frame5')
+HOURLY_FRAMES = ('frame5',)
+
+# The compiled layouts and the icons of this process. Filled by preload()
+# before the pool is started: the forked workers get them as they are.
+layouts = {}
+assets = AssetCache(folder_img)
+
+
+def loadTargets(path=TARGETS):
+    """ The targets of the JSON list in `path` """
+    with open(path, encoding='utf-8') as f:
+        spec = json.load(f)
+    targets = [
+        Target(
+            name=t['name'],
+            location=tuple(t['location']) if t.get('location') else None,
+            layout=t.get('layout') or LAYOUT,
+            frame=t.get('frame') or 'frame1',
+            sink=t['sink']
+        ) for t in spec
+    ]
+    if len(set(t.name for t in targets)) != len(targets):
+        raise ValueError('Target names must be unique')
+    for t in targets:
+        if t.frame not in FRAMES:
+            raise ValueError('{}: {} cannot be shown by the fan-out service, only {}'.format(
+                t.name, t.frame, ', '.join(FRAMES)))
+    if sum(1 for t in targets if t.sink == 'epd') > 1:
+        raise ValueError('Only one target can show on the epd sink')
+    return targets
+
+
+def preload(layout_names):
+    """ Compile the layouts and draw their backgrounds in this process, unless already done """
+    for name in layout_names:
+        if name not in layouts:
+            layout = loadLayout(
+                os.path.join(base_dir, 'layouts', name + '.json'), folder_img,
+                constants={'FORECAST_TITLE': FORECAST_TITLE}
+            )
+            for frame_name in layout.frames:
+                layout.background(frame_name, assets)
+            layouts[name] = layout
+
+
+def renderTarget(layout_name, frame_name, data, temp_unit, speed_unit):
+    """
+    Render a frame from the packed weather `data`, in a pool worker. Returns
+    the packed panel buffer and the seconds it took.
+    """
+    start = time.perf_counter()
+    weather = unpackWeather(data)
+    values = frameValues(weather, temp_unit, speed_unit)
+    if frame_name in HOURLY_FRAMES:
+        values.update(hourlyValues(weather.hourly))
+    mask = layouts[layout_name].render(frame_name, values, assets)
+    # the panels are portrait, the driver turns landscape frames
+    buffer = bytes(pack_image(mask, *sorted(mask.size)))
+    return buffer, time.perf_counter() - start
+
+
+class FanOut:
+
+    def __init__(self, targets, workers=FANOUT_WORKERS, sinks=None):
+        self.targets = targets
+        self.workers = workers
+        self.sinks = sinks or dict((t.name, makeSink(t.sink)) for t in targets)
+        self.displays = dict((t.name, DisplayWorker()) for t in targets)
+        self.pool = None
+        # per target: hash of the weather it was last shown with, digest of
+        # the buffer on its panel and when it was last refreshed (time.monotonic())
+        self.rendered = {}
+        self.shown = {}
+        self.refreshed_at = {}
+        self.stats = {'locations': 0, 'fetch_errors': 0, 'rendered': 0, 'render_skipped': 0,
+                      'render_errors': 0, 'shown': 0, 'show_skipped': 0, 'pool_restarts': 0}
+
+    def start(self):
+        """ Load the layouts, then start the render processes """
+        preload(self.layoutNames())
+        self.startPool()
+
+    def layoutNames(self):
+        return sorted(set(t.layout for t in self.targets))
+
+    def startPool(self):
+        layout_names = self.layoutNames()
+        # fork shares what preload() loaded; elsewhere each worker loads its own
+        context = None
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=context,
+                                        initializer=preload, initargs=(layout_names,))
+        # forked now, before the fetches and the display workers start any threads
+        self.pool.submit(preload, layout_names).result()
+
+    def restartPool(self):
+        """ A render worker died: the pool refuses any more jobs, so it is replaced """
+        print('render pool broken, starting it again')
+        self.pool.shutdown(wait=False)
+        self.stats['pool_restarts'] += 1
+        metrics.inc('pool_restarts_total')
+        self.startPool()
+
+    def submit(self, *args):
+        try:
+            return self.pool.submit(*args)
+        except BrokenProcessPool:
+            self.restartPool()
+            return self.pool.submit(*args)
+
+    def stop(self):
+        """ Let the refreshes in progress finish, then close the sinks """
+        if self.pool is not None:
+            self.pool.shutdown()
+        for name, display in self.displays.items():
+            display.stop(last=self.sinks[name].close)
+
+    def fetch(self):
+        """ The Weather of every distinct location, all fetched at the same time; failed ones are left out """
+        from forecast import fetchWeather
+        from acquire import acquireAll, blocking
+
+        locations = list(OrderedDict.fromkeys(t.location for t in self.targets))
+        # every location on a thread of its own, so each deadline starts with its fetch
+        results = acquireAll(dict(
+            (str(i), (blocking(fetchWeather, location), WEATHER_DEADLINE)) for i, location in enumerate(locations)
+        ))
+        self.stats['locations'] = len(locations)
+        weather = {}
+        for i, location in enumerate(locations):
+            result = results[str(i)]
+            metrics.observe('fetch_seconds', result.elapsed, source='forecast')
+            if result.error:
+                print('{}: {}'.format(location or 'default location', result.error))
+                metrics.inc('fetch_errors_total', source='forecast')
+                self.stats['fetch_errors'] += 1
+                continue
+            current, daily, hourly = result.value
+            weather[location] = Weather(current, daily, None, hourly)
+        return weather
+
+    def cycle(self):
+        """ Fetch every location, render the targets whose weather changed and show what looks different """
+        start = time.perf_counter()
+        weather = self.fetch()
+        # what each location is sent to the workers as, packed once
+        packed = {}
+        for location, w in weather.items():
+            temp_unit, speed_unit = unitNames(w.current.units)
+            packed[location] = (packWeather(w), temp_unit, speed_unit, weatherHash(w, temp_unit, speed_unit))
+        # locations with an hourly forecast for the next hours
+        hourly = set(location for location, w in weather.items()
+                     if w.hourly is not None and hourlyValues(w.hourly))
+
+        jobs = {}
+        for target in self.targets:
+            if target.location not in packed:
+                continue
+            if target.frame in HOURLY_FRAMES and target.location not in hourly:
+                print('{}: no hourly forecast for the next hours, {} skipped'.format(target.name, target.frame))
+                self.stats['render_skipped'] += 1
+                continue
+            data, temp_unit, speed_unit, weather_hash = packed[target.location]
+            refreshed_at = self.refreshed_at.get(target.name)
+            # past MAX_REFRESH_AGE the frame is redone so the timestamp stays honest
+            expired = refreshed_at is None or time.monotonic() - refreshed_at >= MAX_REFRESH_AGE
+            if weather_hash == self.rendered.get(target.name) and not expired:
+                self.stats['render_skipped'] += 1
+                continue
+            job = self.submit(renderTarget, target.layout, target.frame, data, temp_unit, speed_unit)
+            jobs[job] = (target, weather_hash)
+
+        broken = False
+        for job in as_completed(jobs):
+            target, weather_hash = jobs[job]
+            try:
+                buffer, elapsed = job.result()
+            except Exception as e:
+                # not marked as rendered, so it is tried again next cycle
+                print('{}: {}'.format(target.name, e))
+                self.stats['render_errors'] += 1
+                broken = broken or isinstance(e, BrokenProcessPool)
+                continue
+            self.stats['rendered'] += 1
+            metrics.observe('render_seconds', elapsed, frame=target.frame)
+            digest = hashlib.sha1(buffer).hexdigest()
+            if digest != self.shown.get(target.name):
+                self.stats['shown'] += 1
+                self.displays[target.name].request(self.show, target, buffer, digest, weather_hash)
+            else:
+                self.stats['show_skipped'] += 1
+                self.rendered[target.name] = weather_hash
+                self.refreshed_at[target.name] = time.monotonic()
+        if broken:
+            self.restartPool()
+        metrics.observe('cycle_seconds', time.perf_counter() - start)
+
+    def show(self, target, buffer, digest, weather_hash):
+        # on the target's display worker; a failed show is rendered again next cycle
+        self.sinks[target.name].show(buffer)
+        self.shown[target.name] = digest
+        self.rendered[target.name] = weather_hash
+        self.refreshed_at[target.name] = time.monotonic()
+
+    def drain(self):
+        """ Wait until every sink is done with what it was given """
+        for display in self.displays.values():
+            display.drain()
+
+    def refreshCycle(self):
+        # the metrics line of the cycle is written once the panels are done
+        self.cycle()
+        self.drain()
+        metrics.flush()
+
+
+if __name__ == "__main__":
+    locale.setlocale(locale.LC_TIME, LOCALE)
+    fanout = FanOut(loadTargets())
+    fanout.start()
+
+    from scheduler import Scheduler
+
+    scheduler = Scheduler()
+    # every SLEEPTIME seconds on the clock, SIGHUP (systemctl reload) refreshes right away
+    scheduler.every(SLEEPTIME, fanout.refreshCycle)
+    scheduler.run(on_stop=fanout.stop)
+    sys.exit(0)
@@ -0,0 +1,148 @@
+# coding: utf-8
+#
+# Weather station display for Raspberry and Waveshare 2.7" e-Paper display
+# (cached forecast from the configured weather provider)
+#
+# Copyright by Antal Rutz
+#
+# Documentation and full source code:
+# https://github.com/arutz12/Raspberry-Weather-EPD
+#
+
+import os
+import json
+import time
+import threading
+from dotenv import load_dotenv
+from providers import makeProvider
+from records import fromBlock, toBlock, hourlyArrays
+import metrics
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+# .env
+dotenv_path = os.path.join(base_dir, '.env')
+load_dotenv(dotenv_path)
+
+# Response cache: the normalized CURRENT/DAILY/HOURLY blocks with their fetch
+# time; other locations than the configured one have their own file next to it
+CACHE_FILE = os.path.join(base_dir, 'cache', 'weather.json')
+# seconds a block is served from the cache without asking the provider
+CACHE_TTL = {
+    'currently': int(os.environ.get('WEATHER_CURRENT_TTL') or 600),
+    'daily': int(os.environ.get('WEATHER_DAILY_TTL') or 3 * 3600),
+    'hourly': int(os.environ.get('WEATHER_HOURLY_TTL') or 3600)
+}
+# expired blocks younger than this are served right away while they are
+# refreshed in the background
+CACHE_MAX_STALE = int(os.environ.get('WEATHER_MAX_STALE') or 6 * 3600)
+
+provider = None
+cache_lock = threading.Lock()
+# location -> thread refreshing its blocks in the background
+refresh_threads = {}
+
+
+def weatherProvider():
+    # one provider (and HTTP session) for the life of the process
+    global provider
+    if provider is None:
+        provider = makeProvider()
+    return provider
+
+
+def cacheFile(location=None):
+    """ The cache file of `location` (latitude, longitude), CACHE_FILE for the configured one """
+    if location is None:
+        return CACHE_FILE
+    name = 'weather-{:.4f},{:.4f}.json'.format(*map(float, location))
+    return os.path.join(os.path.dirname(CACHE_FILE), name)
+
+
+def loadCache(location=None):
+    try:
+        with open(cacheFile(location), encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def refreshCache(blocks, location=None):
+    """ Fetch `blocks` of `location` from the provider and store them in its cache file """
+    source = weatherProvider()
+    start = time.perf_counter()
+    try:
+        fetched = source.fetch(blocks, location)
+    except Exception:
+        metrics.inc('upstream_errors_total', source=source.name)
+        raise
+    finally:
+        metrics.observe('upstream_seconds', time.perf_counter() - start, source=source.name)
+    now = time.time()
+    cache_file = cacheFile(location)
+    with cache_lock:
+        cache = loadCache(location)
+        for block, value in fetched.items():
+            cache[block] = {'fetched': now, 'data': toBlock(block, value)}
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = cache_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, cache_file)
+    return cache
+
+
+def backgroundRefresh(blocks, location=None):
+
+    def refresh():
+        try:
+            refreshCache(blocks, location)
+        except Exception as e:
+            print(e)
+
+    with cache_lock:
+        thread = refresh_threads.get(location)
+        if thread is None or not thread.is_alive():
+            thread = refresh_threads[location] = threading.Thread(target=refresh, daemon=True)
+            thread.start()
+
+
+def fetchWeather(location=None):
+    """
+    Current, DayForecasts and Hourly arrays of the weather at `location`
+    (latitude, longitude; the configured one if None), from the cache
+    while the blocks are within their TTL. Expired blocks not older than
+    CACHE_MAX_STALE are returned as they are and refreshed in the
+    background, older (or missing) ones are fetched before returning.
+    """
+    now = time.time()
+    cache = loadCache(location)
+    ages = dict(
+        (block, now - cache[block]['fetched'] if block in cache else None) for block in CACHE_TTL
+    )
+    expired = [block for block, age in ages.items() if age is None or age >= CACHE_TTL[block]]
+    if expired:
+        if 'currently' in expired:
+            # the current precipitation probability comes from the daily block
+            expired = list(CACHE_TTL)
+        if all(ages[block] is not None and ages[block] < CACHE_MAX_STALE for block in expired):
+            backgroundRefresh(expired, location)
+        else:
+            cache = refreshCache(expired, location)
+
+    return (
+        fromBlock('currently', cache['currently']['data']),
+        fromBlock('daily', cache['daily']['data']),
+        hourlyArrays(cache['hourly']['data'])
+    )
+
+
+if __name__ == '__main__':
+    from pprint import pprint
+
+    cur, daily, hourly = fetchWeather()
+    pprint(cur)
+    print('\n######################\n\n')
+    pprint(daily)
+    print('\n######################\n\n')
+    pprint(hourly)
@@ -0,0 +1,140 @@
+# coding: utf-8
+#
+# Weather station display for Raspberry and Waveshare 2.7" e-Paper display
+# (HTTP server of the rendered frames)
+#
+# Copyright by Antal Rutz
+#
+# Documentation and full source code:
+# https://github.com/arutz12/Raspberry-Weather-EPD
+#
+# Serves the frames of a FrameStore for panels that cannot render them
+# themselves (e.g. ESP boards) and for a look from the browser:
+#
+#   /frames             {"frame1": "<digest>", ...}
+#   /frames/frame1.bin  the packed 1 bit panel buffer, as sent over SPI
+#   /frames/frame1.png  the frame as PNG
+#
+# The ETag is the frame digest, so a client polling with If-None-Match gets
+# an empty 304 until the frame changes. Bodies come straight from the store:
+# the buffer as it is, the PNG encoded once per frame.
+#
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+# representation -> (content type, suffix of the ETag)
+FORMATS = {
+    'bin': ('application/octet-stream', ''),
+    'png': ('image/png', '.png')
+}
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def matches(if_none_match, etag):
+    """ Whether an If-None-Match header value names `etag` """
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or 'W/' + etag in tags
+
+
+class FrameServer:
+
+    def __init__(self, frames, host='127.0.0.1', port=8080):
+        self.frames = frames
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+        # 'requests': answered, 'not_modified': of those 304s, 'not_found': 404s
+        self.stats = {'requests': 0, 'not_modified': 0, 'not_found': 0}
+
+    def start(self):
+        """ Serve on a daemon thread; with port 0 the port picked is in self.port afterwards """
+        self.server = ThreadingHTTPServer((self.host, self.port), self.handler())
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='frameserver', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def lookup(self, path):
+        """ (body, content type, ETag) of `path`, None if there is no such frame """
+        path = path.split('?', 1)[0]
+        if path in ('/frames', '/frames/'):
+            names = self.frames.names()
+            index = dict((name, self.frames.get(name).digest) for name in names)
+            body = json.dumps(index).encode('utf-8')
+            return body, 'application/json', None
+        if not path.startswith('/frames/') or '.' not in path:
+            return None
+        name, kind = path[len('/frames/'):].rsplit('.', 1)
+        if kind not in FORMATS:
+            return None
+        if kind == 'png':
+            png = self.frames.png(name)
+            if png is None:
+                return None
+            body, digest = png
+        else:
+            frame = self.frames.get(name)
+            if frame is None:
+                return None
+            body, digest = frame.buffer, frame.digest
+        content_type, suffix = FORMATS[kind]
+        return body, content_type, '"' + digest + suffix + '"'
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, so a polling client keeps its connection
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self.respond(body=True)
+
+            def do_HEAD(self):
+                self.respond(body=False)
+
+            def respond(self, body):
+                server.stats['requests'] += 1
+                found = server.lookup(self.path)
+                if found is None:
+                    server.stats['not_found'] += 1
+                    self.send_error(404)
+                    return
+                data, content_type, etag = found
+                if etag is not None and matches(self.headers.get('If-None-Match'), etag):
+                    server.stats['not_modified'] += 1
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                # the frames change every few minutes: always ask, 304 is cheap
+                self.send_header('Cache-Control', 'no-cache')
+                if etag is not None:
+                    self.send_header('ETag', etag)
+                if content_type == FORMATS['bin'][0]:
+                    self.send_header('X-Panel-Size', '{}x{}'.format(server.frames.width, server.frames.height))
+                self.end_headers()
+                if body:
+                    self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
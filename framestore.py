@@ -0,0 +1,70 @@
+# coding: utf-8
+#
+# Weather station display for Raspberry and Waveshare 2.7" e-Paper display
+# (in-memory store of rendered frames)
+#
+# Copyright by Antal Rutz
+#
+# Documentation and full source code:
+# https://github.com/arutz12/Raspberry-Weather-EPD
+#
+
+import io
+import hashlib
+import threading
+from collections import namedtuple
+from waveshare_epd.packing import pack_image
+
+# image: the rendered PIL image, buffer: the packed panel buffer ready for SPI,
+# digest: hash of the buffer to tell whether two frames look the same
+Frame = namedtuple('Frame', ['image', 'buffer', 'digest'])
+
+
+class FrameStore:
+    """
+    Keeps every rendered frame packed for the panel, so showing a frame is a
+    lookup instead of reading a BMP back and repacking it. The PNG of a frame
+    is encoded on first request and kept until the frame changes.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.frames = {}
+        # name -> (PNG bytes, digest of the frame it was encoded from)
+        self.pngs = {}
+        self.lock = threading.Lock()
+
+    def put(self, name, image):
+        buf = bytes(pack_image(image, self.width, self.height))
+        frame = Frame(image, buf, hashlib.sha1(buf).hexdigest())
+        with self.lock:
+            self.frames[name] = frame
+        return frame
+
+    def get(self, name):
+        with self.lock:
+            return self.frames.get(name)
+
+    def buffer(self, name):
+        frame = self.get(name)
+        return frame.buffer if frame else None
+
+    def png(self, name):
+        """ (PNG bytes, digest) of frame `name`, None if it is not rendered """
+        frame = self.get(name)
+        if frame is None:
+            return None
+        with self.lock:
+            png = self.pngs.get(name)
+        if png is None or png[1] != frame.digest:
+            out = io.BytesIO()
+            frame.image.save(out, 'PNG')
+            png = (out.getvalue(), frame.digest)
+            with self.lock:
+                self.pngs[name] = png
+        return png
+
+    def names(self):
+        with self.lock:
+            return sorted(self.frames)
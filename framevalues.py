@@ -0,0 +1,100 @@
+# coding: utf-8
+#
+# Weather station display for Raspberry and Waveshare 2.7" e-Paper display
+# (values the frames are drawn from)
+#
+# Copyright by Antal Rutz
+#
+# Documentation and full source code:
+# https://github.com/arutz12/Raspberry-Weather-EPD
+#
+# The layout binds to the weather records plus the units, the date and the
+# labels computed here; weatherHash() tells whether any of it changed. Shared
+# by the refresh script and the fan-out service.
+#
+
+import time
+import bisect
+import hashlib
+from datetime import datetime
+from datetime import timedelta
+from records import packWeather
+
+UNIT_TYPES = {
+    'si' : {
+        'temp': 'C',
+        'speed': 'km/h'
+    },
+    'uk2' : {
+        'temp': 'C',
+        'speed': 'mi/h'
+    },
+    'us': {
+        'temp': 'F',
+        'speed': 'mi/h'
+    }
+}
+
+# hours of the hourly forecast frame (frame5)
+HOURLY_HOURS = 24
+
+
+def unitNames(unit_type, default=('C', 'km/h')):
+    """ (temperature, speed) unit names of a provider's unit type """
+    if unit_type in UNIT_TYPES:
+        return UNIT_TYPES[unit_type]['temp'], UNIT_TYPES[unit_type]['speed']
+    return default
+
+
+def hourlyValues(hourly):
+    """ The next HOURLY_HOURS of the hourly forecast as bar series, with the labels; empty if it is all past or missing """
+    # from the hour in progress
+    first = bisect.bisect_right(hourly.time, time.time() - 3600)
+    hours = slice(first, first + HOURLY_HOURS)
+    temps, precip = hourly.temperature[hours], hourly.precip_probability[hours]
+    # NaN is a missing value: no bar and not in the labels
+    present_temps = [value for value in temps if value == value]
+    present_precip = [value for value in precip if value == value]
+    if not present_temps:
+        return {}
+    values = {
+        'hourlyTemp': temps,
+        'hourlyPrecip': precip,
+        'hourlyTempMin': str(round(min(present_temps))),
+        'hourlyTempMax': str(round(max(present_temps))),
+        'hourlyPrecipMax': str(round(max(present_precip))) if present_precip else '--'
+    }
+    # every 6 hours under the bars
+    for i, hour in enumerate(range(0, HOURLY_HOURS, 6)):
+        t = hourly.time[first + hour] if first + hour < len(hourly.time) else None
+        values['hour' + str(i)] = time.strftime('%H:00', time.localtime(t)) if t is not None else ''
+    return values
+
+
+def weatherHash(weather, temp_unit, speed_unit):
+    """
+    Hash of everything visible on the frames except the clock: the packed
+    weather records, the units and the date and hour (for the weekday names
+    and the hours of the hourly forecast)
+    """
+    digest = hashlib.sha1(packWeather(weather))
+    digest.update((temp_unit + speed_unit + time.strftime("%Y-%m-%d %H")).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def frameValues(weather, temp_unit, speed_unit):
+    """ The weather records plus everything else the layout refers to """
+    values = {
+        'current': weather.current,
+        'days': weather.days,
+        'temperature': weather.temperature,
+        'battery': weather.battery
+    }
+    values['TEMP_UNIT'] = temp_unit
+    values['SPEED_UNIT'] = speed_unit
+    values['date'] = time.strftime("%Y-%m-%d")
+    values['time'] = time.strftime("%H:%M")
+    now = datetime.now()
+    for day in range(4):
+        values['day' + str(day)] = (now + timedelta(days=day)).strftime("%A")
+    return values
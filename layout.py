@@ -0,0 +1,315 @@
+# coding: utf-8
+#
+# Weather station display for Raspberry and Waveshare 2.7" e-Paper display
+# (declarative frame layouts)
+#
+# Copyright by Antal Rutz
+#
+# Documentation and full source code:
+# https://github.com/arutz12/Raspberry-Weather-EPD
+#
+# Frames are described in a JSON layout (see layouts/2in7.json). A layout is
+# compiled once into a flat list of draw ops per frame, which runOps() then
+# executes every cycle against the current weather values. Ops that do not
+# depend on the weather are drawn only once into a cached background.
+#
+
+import os
+import re
+import json
+from string import Formatter
+from textwrap import wrap
+from collections import OrderedDict
+from collections import namedtuple
+from PIL import Image
+from PIL import ImageChops
+from PIL import ImageFont
+from PIL import ImageDraw
+
+# op kinds
+TEXT = 'text'
+WRAP = 'wrap'
+ICON = 'icon'
+LINE = 'line'
+PLOT = 'plot'
+BARS = 'bars'
+
+# wind arrows are rotated in steps of this many degrees so they can be reused
+WIND_STEP = 5
+# rasterized strings kept per layout, a few cycles' worth of the frames' texts
+TEXT_CACHE_SIZE = 256
+
+
+def windRotation(bearing):
+    return int(round(float(bearing) / WIND_STEP) * WIND_STEP) % 360
+
+
+class AssetCache:
+    """
+    Icons loaded from `folder` once and kept resized (and rotated) as the
+    1-bit image plus alpha mask pair mask.paste() needs, keyed by
+    (name, size, rotation). Least recently used entries are dropped first.
+    """
+
+    def __init__(self, folder, maxsize=64):
+        self.folder = folder
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, size, rotation=0):
+        key = (name, size, rotation)
+        if key in self.items:
+            self.hits += 1
+            self.items.move_to_end(key)
+            return self.items[key]
+
+        self.misses += 1
+        icon = Image.open(os.path.join(self.folder, name + '.png')).resize(size)
+        if rotation:
+            icon = icon.rotate(rotation)
+        item = (icon.convert('1'), icon.getchannel('A'))
+        self.items[key] = item
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+        return item
+
+    def paste(self, mask, name, size, xy, rotation=0):
+        icon, alpha = self.get(name, size, rotation)
+        mask.paste(icon, xy, alpha)
+
+
+class TextCache:
+    """
+    Strings rasterized once per (font, text) and kept as the 1-bit mask
+    draw.text() would draw, with its offset from the text position, so a
+    string seen in an earlier cycle (units, weekdays, wind directions,
+    summaries) is pasted instead of going through FreeType again. Least
+    recently used entries are dropped first.
+    """
+
+    def __init__(self, maxsize=TEXT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, font, text):
+        key = (font, text)
+        if key in self.items:
+            self.hits += 1
+            self.items.move_to_end(key)
+            return self.items[key]
+
+        self.misses += 1
+        # the same bitmap draw.text() pastes at xy + offset, drawn at the origin
+        bitmap, offset = font.getmask2(text, '1')
+        glyphs = Image.new('1', bitmap.size, 0)
+        ImageDraw.Draw(glyphs).text((-offset[0], -offset[1]), text, font=font, fill=255)
+        item = (glyphs, offset)
+        self.items[key] = item
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+        return item
+
+    def draw(self, mask, xy, text, font):
+        if not text:
+            return
+        glyphs, offset = self.get(font, text)
+        mask.paste(0, (xy[0] + offset[0], xy[1] + offset[1]), glyphs)
+
+
+def fieldPath(field_name):
+    """ 'days[1].summary' -> ('days', 1, 'summary'): a value's key, then indexes (ints) and attributes """
+    key = re.match(r'[^.\[]*', field_name).group()
+    path = [key]
+    for attribute, index in re.findall(r'\.(\w+)|\[(\d+)\]', field_name[len(key):]):
+        path.append(attribute or int(index))
+    return tuple(path)
+
+
+def compileTemplate(template, constants=None):
+    """
+    Split a '{key}' / '{key!i}' template into (literal, path, spec, conversion)
+    parts once, so rendering is a plain join. '!i' truncates to an int, a key
+    may be followed by indexes and attributes, e.g. '{days[1].summary}'.
+    Keys found in `constants` are filled in right away.
+    """
+    constants = constants or {}
+    parts = []
+    for literal, key, spec, conversion in Formatter().parse(template):
+        if key is not None:
+            key = fieldPath(key)
+        if key is not None and key[0] in constants:
+            literal += renderTemplate((('', key, spec, conversion),), constants)
+            key = spec = conversion = None
+        if parts and parts[-1][1] is None:
+            literal = parts.pop()[0] + literal
+        parts.append((literal, key, spec, conversion))
+    return tuple(parts)
+
+
+def isConstant(parts):
+    return parts is None or all(key is None for literal, key, spec, conversion in parts)
+
+
+def renderTemplate(parts, values):
+    out = []
+    for literal, key, spec, conversion in parts:
+        out.append(literal)
+        if key is not None:
+            value = values[key[0]]
+            for step in key[1:]:
+                value = value[step] if step.__class__ is int else getattr(value, step)
+            out.append(str(int(float(value))) if conversion == 'i' else str(value))
+    return ''.join(out)
+
+
+def expand(value, index):
+    """ Substitute the repeat index: $i counts from 0, $n from 1 """
+    if isinstance(value, str):
+        return value.replace('$i', str(index)).replace('$n', str(index + 1))
+    return value
+
+
+# static: ops drawn once into the cached background, dynamic: ops drawn every cycle
+Frame = namedtuple('Frame', ['static', 'dynamic'])
+
+
+def isStatic(op):
+    kind = op[0]
+    if kind in (TEXT, WRAP):
+        return isConstant(op[3])
+    elif kind == ICON:
+        return isConstant(op[3]) and isConstant(op[4])
+    return kind == LINE
+
+
+class Layout:
+    """
+    A compiled layout: fonts loaded, blocks and repeats expanded and every
+    frame turned into lists of static and dynamic op tuples.
+
+    `flags` switches ops carrying a "when" key on or off (e.g. 'sensor'),
+    `constants` are values that stay the same for the life of the process
+    (e.g. the forecast title), ops using only those end up in the background.
+    The texts are drawn through `texts`, a TextCache of the layout's fonts
+    (None draws every string with draw.text()).
+    """
+
+    def __init__(self, spec, font_dir, flags=(), constants=None):
+        self.width, self.height = spec['size']
+        self.flags = set(flags)
+        self.constants = dict(constants or {})
+        self.blocks = spec.get('blocks', {})
+        self.fonts = dict(
+            (name, ImageFont.truetype(os.path.join(font_dir, font[0]), font[1]))
+            for name, font in spec['fonts'].items()
+        )
+        self.frames = OrderedDict()
+        for name, ops in spec['frames'].items():
+            ops = self.compile(ops)
+            self.frames[name] = Frame(
+                [op for op in ops if isStatic(op)],
+                [op for op in ops if not isStatic(op)]
+            )
+        self.backgrounds = {}
+        self.texts = TextCache()
+
+    def background(self, name, assets):
+        """ The static ops of frame `name`, drawn once and cached """
+        if name not in self.backgrounds:
+            mask = Image.new('1', (self.width, self.height), 255)
+            self.backgrounds[name] = runOps(self.frames[name].static, mask, self.constants, assets, self.texts)
+        return self.backgrounds[name]
+
+    def render(self, name, values, assets):
+        """
+        Draw the dynamic ops of frame `name` on a blank image and merge the
+        cached background into it (black is 0, so AND keeps both layers).
+        """
+        mask = Image.new('1', (self.width, self.height), 255)
+        runOps(self.frames[name].dynamic, mask, values, assets, self.texts)
+        return ImageChops.logical_and(self.background(name, assets), mask)
+
+    def compile(self, ops, dx=0, index=None):
+        compiled = []
+        for op in ops:
+            if 'when' in op and op['when'] not in self.flags:
+                continue
+            if index is not None:
+                op = dict((key, expand(value, index)) for key, value in op.items())
+
+            kind = op['op']
+            if kind == 'include':
+                compiled.extend(self.compile(self.blocks[op['block']], dx, index))
+            elif kind == 'repeat':
+                for i, offset in enumerate(op['dx']):
+                    compiled.extend(self.compile(op['ops'], dx + offset, i))
+            elif kind == TEXT:
+                x, y = op['xy']
+                compiled.append((TEXT, (x + dx, y), self.fonts[op['font']], compileTemplate(op['text'], self.constants)))
+            elif kind == WRAP:
+                # rows[n - 1] holds the positions used when the text wraps into n lines
+                rows = tuple(tuple((x + dx, y) for x, y in row) for row in op['rows'])
+                compiled.append((WRAP, rows, self.fonts[op['font']], compileTemplate(op['text'], self.constants), op['width']))
+            elif kind == ICON:
+                x, y = op['xy']
+                rotate = compileTemplate(op['rotate'], self.constants) if 'rotate' in op else None
+                compiled.append((ICON, (x + dx, y), tuple(op['size']), compileTemplate(op['icon'], self.constants), rotate))
+            elif kind == LINE:
+                x1, y1, x2, y2 = op['xy']
+                compiled.append((LINE, (x1 + dx, y1, x2 + dx, y2)))
+            elif kind == PLOT:
+                x1, y1, x2, y2 = op['xy']
+                compiled.append((PLOT, (x1 + dx, y1, x2 + dx, y2), op['series'], op.get('span', 1)))
+            elif kind == BARS:
+                x1, y1, x2, y2 = op['xy']
+                value_range = tuple(op['range']) if 'range' in op else None
+                compiled.append((BARS, (x1 + dx, y1, x2 + dx, y2), op['series'], op.get('slots'), op.get('span', 1), value_range))
+            else:
+                raise ValueError('Unknown layout op: ' + kind)
+        return compiled
+
+
+def loadLayout(path, font_dir, flags=(), constants=None):
+    with open(path, encoding='utf-8') as f:
+        return Layout(json.load(f), font_dir, flags, constants)
+
+
+def runOps(ops, mask, values, assets, texts=None):
+    """ Draw the compiled `ops` onto `mask` with the given values, the texts through the `texts` cache if given """
+    draw = ImageDraw.Draw(mask)
+    if texts is None:
+        def text(xy, string, font):
+            draw.text(xy, string, font=font, fill=0)
+    else:
+        def text(xy, string, font):
+            texts.draw(mask, xy, string, font)
+    for op in ops:
+        kind = op[0]
+        if kind == TEXT:
+            text(op[1], renderTemplate(op[3], values), op[2])
+        elif kind == WRAP:
+            rows = op[1]
+            lines = wrap(renderTemplate(op[3], values), op[4])[:len(rows)]
+            if lines:
+                for xy, line in zip(rows[len(lines) - 1], lines):
+                    text(xy, line, op[2])
+        elif kind == ICON:
+            rotation = windRotation(renderTemplate(op[4], values)) if op[4] else 0
+            assets.paste(mask, renderTemplate(op[3], values), op[2], op[1], rotation)
+        elif kind == LINE:
+            draw.line(op[1], fill=0)
+        elif kind == PLOT:
+            # numpy is only needed by layouts that plot
+            from trend import pastePlot
+
+            # the value is a (times, values, start, end) series
+            pastePlot(mask, op[1], *values[op[2]], span=op[3])
+        elif kind == BARS:
+            from trend import pasteBars
+
+            pasteBars(mask, op[1], values[op[2]], *op[3:])
+    return mask
@@ -0,0 +1,183 @@
+# coding: utf-8
+#
+# Weather station display for Raspberry and Waveshare 2.7" e-Paper display
+# (timing and counter metrics)
+#
+# Copyright by Antal Rutz
+#
+# Documentation and full source code:
+# https://github.com/arutz12/Raspberry-Weather-EPD
+#
+# Latency histograms and counters of every stage of a refresh (fetch, render,
+# pack, SPI transfer, busy wait). flush() writes them as a Prometheus textfile
+# for node_exporter's textfile collector (METRICS_TEXTFILE) and appends one
+# JSON line with what happened since the previous flush (METRICS_JSON, '-'
+# for stdout). With neither set every function here is a no-op.
+#
+
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+# .env
+dotenv_path = os.path.join(base_dir, '.env')
+load_dotenv(dotenv_path)
+
+METRICS_TEXTFILE = os.environ.get('METRICS_TEXTFILE')
+METRICS_JSON = os.environ.get('METRICS_JSON')
+
+PREFIX = 'weather_'
+# upper bounds in seconds, from a packed buffer to a full panel refresh
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+lock = threading.Lock()
+# (name, labels) -> [bucket counts..., sum, count]
+histograms = {}
+# (name, labels) -> value
+counters = {}
+# since the last flush: (name, labels) -> list of observed values / counter increment
+cycle_observations = {}
+cycle_counters = {}
+cycles = 0
+
+
+def key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def observe(name, value, **labels):
+    """ Add `value` (seconds) to histogram `name` """
+    k = key(name, labels)
+    with lock:
+        histogram = histograms.get(k)
+        if histogram is None:
+            histogram = histograms[k] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram[i] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+        cycle_observations.setdefault(k, []).append(round(value, 6))
+
+
+def inc(name, value=1, **labels):
+    """ Add `value` to counter `name` """
+    k = key(name, labels)
+    with lock:
+        counters[k] = counters.get(k, 0) + value
+        cycle_counters[k] = cycle_counters.get(k, 0) + value
+
+
+@contextmanager
+def timer(name, **labels):
+    """ Observe how long the with block took """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def labelText(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, v) for k, v in labels) + '}'
+
+
+def promText():
+    """ All histograms and counters in the Prometheus text format """
+    lines = []
+    typed = set()
+    with lock:
+        for (name, labels), histogram in sorted(histograms.items()):
+            metric = PREFIX + name
+            if metric not in typed:
+                lines.append('# TYPE {} histogram'.format(metric))
+                typed.add(metric)
+            for bound, count in zip(BUCKETS, histogram):
+                lines.append('{}_bucket{} {}'.format(metric, labelText(labels, [('le', bound)]), count))
+            lines.append('{}_bucket{} {}'.format(metric, labelText(labels, [('le', '+Inf')]), histogram[-1]))
+            lines.append('{}_sum{} {}'.format(metric, labelText(labels), histogram[-2]))
+            lines.append('{}_count{} {}'.format(metric, labelText(labels), histogram[-1]))
+        for (name, labels), value in sorted(counters.items()):
+            metric = PREFIX + name
+            if metric not in typed:
+                lines.append('# TYPE {} counter'.format(metric))
+                typed.add(metric)
+            lines.append('{}{} {}'.format(metric, labelText(labels), value))
+    return '\n'.join(lines) + '\n'
+
+
+def cycleRecord():
+    """ What was observed and counted since the previous call, as a dict """
+    global cycles
+    with lock:
+        cycles += 1
+        record = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'cycle': cycles,
+            'observed': dict((k[0] + labelText(k[1]), v) for k, v in sorted(cycle_observations.items())),
+            'counted': dict((k[0] + labelText(k[1]), v) for k, v in sorted(cycle_counters.items())),
+        }
+        cycle_observations.clear()
+        cycle_counters.clear()
+    return record
+
+
+def flush():
+    """ Write the textfile and the JSON line of this cycle """
+    record = cycleRecord()
+    if METRICS_JSON:
+        line = json.dumps(record, sort_keys=True)
+        if METRICS_JSON == '-':
+            sys.stdout.write(line + '\n')
+            sys.stdout.flush()
+        else:
+            with open(METRICS_JSON, 'a') as f:
+                f.write(line + '\n')
+    if METRICS_TEXTFILE:
+        # node_exporter must never see a half written file
+        tmp_file = METRICS_TEXTFILE + '.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(promText())
+        os.replace(tmp_file, METRICS_TEXTFILE)
+
+
+class NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+null_timer = NullTimer()
+
+
+def nullTimer(name, **labels):
+    return null_timer
+
+
+def noop(*args, **kwargs):
+    pass
+
+
+def disable():
+    """ Turn every function into a no-op """
+    global enabled, observe, inc, timer, flush
+    enabled = False
+    observe = inc = flush = noop
+    timer = nullTimer
+
+
+enabled = True
+if not (METRICS_TEXTFILE or METRICS_JSON):
+    disable()
@@ -0,0 +1,326 @@
+# coding: utf-8
+#
+# Weather station display for Raspberry and Waveshare 2.7" e-Paper display
+# (weather providers)
+#
+# Copyright by Antal Rutz
+#
+# Documentation and full source code:
+# https://github.com/arutz12/Raspberry-Weather-EPD
+#
+# A provider fetches the 'currently', 'daily' and/or 'hourly' blocks of the
+# forecast and returns them normalized to the records the frames are drawn
+# from (records.py), whatever the upstream API looks like. WEATHER_PROVIDER in .env selects
+# one, WEATHER_HEDGE optionally names a second one to race against it.
+#
+
+import os
+import math
+import time
+import threading
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import requests
+from dotenv import load_dotenv
+from records import Current, DayForecast, HOURLY_FIELDS, fromBlock
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+# .env
+dotenv_path = os.path.join(base_dir, '.env')
+load_dotenv(dotenv_path)
+
+WEATHER_PROVIDER = os.environ.get('WEATHER_PROVIDER') or 'darksky'
+WEATHER_HEDGE = os.environ.get('WEATHER_HEDGE')
+
+# the coordinates are shared by all providers
+LATITUDE = os.environ.get('DARKSKY_LATITUDE')
+LONGITUDE = os.environ.get('DARKSKY_LONGITUDE')
+
+OWM_API_KEY = os.environ.get('OWM_API_KEY')
+OWM_LANGUAGE = os.environ.get('OWM_LANGUAGE') or 'en'
+OWM_UNITS = os.environ.get('OWM_UNITS') or 'metric'  # 'metric' or 'imperial'
+# another API endpoint, e.g. a local stand-in for testing
+OWM_HOST = os.environ.get('OWM_HOST') or 'https://api.openweathermap.org/data/3.0/onecall'
+
+# URL of a JSON document holding the normalized blocks, see FixtureProvider
+FIXTURE_URL = os.environ.get('FIXTURE_URL')
+
+MAX_DAYS = 4
+# the next 24 hours are still covered by an hourly block served stale from the cache
+MAX_HOURS = 48
+
+# seconds to open the connection and to wait for the answer
+HTTP_TIMEOUT = (5, 15)
+
+
+def wind_direction(degrees):
+    """ Convert wind degrees to direction """
+    try:
+        degrees = int(degrees)
+    except ValueError:
+        return ''
+
+    if degrees < 23 or degrees >= 338:
+        return 'N'
+    elif degrees < 68:
+        return 'NE'
+    elif degrees < 113:
+        return 'E'
+    elif degrees < 158:
+        return 'SE'
+    elif degrees < 203:
+        return 'S'
+    elif degrees < 248:
+        return 'SW'
+    elif degrees < 293:
+        return 'W'
+    elif degrees < 338:
+        return 'NW'
+
+
+def hourlyColumns(hours):
+    """ HOURLY block from (time, temperature, precip_probability, wind_speed, wind_bearing) rows """
+    hours = list(hours)
+    return dict((field, [hour[i] for hour in hours]) for i, field in enumerate(HOURLY_FIELDS))
+
+
+class Provider:
+    """
+    fetch(blocks) returns a dict with the requested blocks: 'currently' as a
+    Current, 'daily' as a tuple of DayForecasts, today first, 'hourly' as
+    HOURLY columns. `location` is a (latitude, longitude) pair, the configured
+    coordinates if None. Errors are raised.
+    """
+
+    name = None
+
+    def fetch(self, blocks, location=None):
+        raise NotImplementedError
+
+
+class DarkSkyProvider(Provider):
+
+    name = 'darksky'
+
+    def fetch(self, blocks, location=None):
+        # the darksky package is only needed if this provider is used
+        from DSweather import requestDarkSkyWeather
+        return requestDarkSkyWeather(blocks, location)
+
+
+# OpenWeatherMap icon codes (without the d/n suffix unless it matters) to the
+# DarkSky icon names the frames know
+OWM_ICONS = {
+    '01d': 'clear-day',
+    '01n': 'clear-night',
+    '02d': 'partly-cloudy-day',
+    '02n': 'partly-cloudy-night',
+    '03': 'cloudy',
+    '04': 'cloudy',
+    '09': 'rain',
+    '10': 'rain',
+    '11': 'rain',
+    '13': 'snow',
+    '50': 'fog'
+}
+
+
+def owmIcon(condition):
+    if 600 < condition['id'] < 620:
+        return 'sleet'
+    code = condition['icon']
+    return OWM_ICONS.get(code) or OWM_ICONS.get(code[:2])
+
+
+def owmPrecipType(condition):
+    group = condition['id'] // 100
+    if group == 6:
+        return 'snow'
+    elif group in (2, 3, 5):
+        return 'rain'
+    return None
+
+
+class OpenWeatherMapProvider(Provider):
+    """ OpenWeatherMap One Call API """
+
+    name = 'openweathermap'
+
+    def __init__(self, api_key=OWM_API_KEY, url=OWM_HOST):
+        self.api_key = api_key
+        self.url = url
+        # metric: m/s like DarkSky 'si', imperial: mph like 'us'
+        self.units = 'us' if OWM_UNITS == 'imperial' else 'si'
+        self.session = requests.Session()
+
+    def fetch(self, blocks, location=None):
+        latitude, longitude = location or (LATITUDE, LONGITUDE)
+        exclude = ['minutely', 'alerts']
+        if 'currently' not in blocks:
+            exclude.append('current')
+        if 'hourly' not in blocks:
+            exclude.append('hourly')
+        r = self.session.get(self.url, timeout=HTTP_TIMEOUT, params={
+            'lat': latitude,
+            'lon': longitude,
+            'units': OWM_UNITS,
+            'lang': OWM_LANGUAGE,
+            'exclude': ','.join(exclude),
+            'appid': self.api_key
+        })
+        r.raise_for_status()
+        forecast = r.json()
+        offset = forecast.get('timezone_offset', 0)
+        daily = forecast['daily'][0:MAX_DAYS+1]
+
+        result = {'daily': self.normalizeDaily(daily, offset)}
+        if 'currently' in blocks:
+            result['currently'] = self.normalizeCurrent(forecast['current'], daily)
+        if 'hourly' in blocks:
+            result['hourly'] = self.normalizeHourly(forecast['hourly'][0:MAX_HOURS])
+        return result
+
+    def normalizeCurrent(self, cur, daily):
+        condition = cur['weather'][0]
+        return Current(
+            summary=condition['description'].capitalize(),
+            icon=owmIcon(condition),
+            precip_probability=round(int(daily[0].get('pop', 0) * 100), -1),
+            precip_type=owmPrecipType(condition),
+            temperature=round(cur['temp'], 1),
+            humidity=int(cur['humidity']),
+            wind_speed=cur['wind_speed'],
+            wind_bearing=cur['wind_deg'],
+            pressure=round(cur['pressure']),
+            wind_direction=wind_direction(cur['wind_deg']),
+            cloud_cover=int(cur['clouds']),
+            units=self.units
+        )
+
+    def normalizeHourly(self, hourly):
+        return hourlyColumns(
+            (h['dt'], h['temp'], int(round(h.get('pop', 0) * 100)), h['wind_speed'], h.get('wind_deg'))
+            for h in hourly
+        )
+
+    def normalizeDaily(self, daily, offset):
+        def local(timestamp):
+            return datetime.utcfromtimestamp(timestamp + offset)
+
+        DAILY = []
+        for d in daily:
+            condition = d['weather'][0]
+            DAILY.append(DayForecast(
+                date=str(local(d['dt']).date()),
+                summary=d.get('summary') or condition['description'].capitalize(),
+                icon=owmIcon(condition),
+                sunrise_time=local(d['sunrise']).strftime('%H:%M'),
+                sunset_time=local(d['sunset']).strftime('%H:%M'),
+                moon_phase=d['moon_phase'],
+                precip_intensity=d.get('rain', 0) + d.get('snow', 0),
+                precip_probability=round(int(d.get('pop', 0) * 100), -1),
+                precip_type=owmPrecipType(condition),
+                humidity=int(d['humidity']),
+                pressure=round(d['pressure']),
+                wind_speed=d['wind_speed'],
+                wind_bearing=d['wind_deg'],
+                wind_direction=wind_direction(d['wind_deg']),
+                cloud_cover=int(d['clouds']),
+                uv_index=d['uvi'],
+                temperature_min=round(d['temp']['min']),
+                temperature_max=round(d['temp']['max'])
+            ))
+        return tuple(DAILY)
+
+
+class FixtureProvider(Provider):
+    """
+    Serves the blocks of a JSON document already in the normalized shape,
+    {"currently": {...}, "daily": [...], "hourly": {...}}, from a (local) server. For testing
+    without an API key: every location gets the same document.
+    """
+
+    name = 'fixture'
+
+    def __init__(self, url=FIXTURE_URL):
+        self.url = url
+        self.session = requests.Session()
+
+    def fetch(self, blocks, location=None):
+        r = self.session.get(self.url, timeout=HTTP_TIMEOUT)
+        r.raise_for_status()
+        forecast = r.json()
+        return dict((block, fromBlock(block, forecast[block])) for block in blocks)
+
+
+class HedgedProvider(Provider):
+    """
+    Asks `primary` first. If it has not answered within its own p95 latency
+    (`initial_delay` seconds until `min_samples` answers were seen) or fails,
+    `secondary` is asked as well and the first good answer wins. Only the slow
+    tail of the primary's requests is doubled.
+    """
+
+    def __init__(self, primary, secondary, percentile=0.95, initial_delay=3.0, min_samples=10):
+        self.primary = primary
+        self.secondary = secondary
+        self.name = primary.name + '+' + secondary.name
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=50)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='hedge')
+        # 'requests': fetches, 'hedged': of those the secondary was asked too,
+        # 'secondary': the secondary's answer was used
+        self.stats = {'requests': 0, 'hedged': 0, 'secondary': 0}
+
+    def hedgeDelay(self):
+        with self.lock:
+            if len(self.latencies) < self.min_samples:
+                return self.initial_delay
+            latencies = sorted(self.latencies)
+        return latencies[int(math.ceil(self.percentile * len(latencies))) - 1]
+
+    def fetchPrimary(self, blocks, location):
+        start = time.perf_counter()
+        result = self.primary.fetch(blocks, location)
+        # late answers count as well, otherwise a slow primary would never raise its p95
+        with self.lock:
+            self.latencies.append(time.perf_counter() - start)
+        return result
+
+    def fetch(self, blocks, location=None):
+        self.stats['requests'] += 1
+        primary = self.executor.submit(self.fetchPrimary, blocks, location)
+        done, _ = wait([primary], timeout=self.hedgeDelay())
+        if done and primary.exception() is None:
+            return primary.result()
+
+        self.stats['hedged'] += 1
+        secondary = self.executor.submit(self.secondary.fetch, blocks, location)
+        pending = {primary, secondary}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is secondary:
+                        self.stats['secondary'] += 1
+                    return future.result()
+        raise primary.exception()
+
+
+PROVIDERS = {
+    DarkSkyProvider.name: DarkSkyProvider,
+    OpenWeatherMapProvider.name: OpenWeatherMapProvider,
+    FixtureProvider.name: FixtureProvider
+}
+
+
+def makeProvider(name=WEATHER_PROVIDER, hedge=WEATHER_HEDGE):
+    provider = PROVIDERS[name]()
+    if hedge:
+        provider = HedgedProvider(provider, PROVIDERS[hedge]())
+    return provider
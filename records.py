@@ -0,0 +1,282 @@
+# coding: utf-8
+#
+# Weather station display for Raspberry and Waveshare 2.7" e-Paper display
+# (weather records)
+#
+# Copyright by Antal Rutz
+#
+# Documentation and full source code:
+# https://github.com/arutz12/Raspberry-Weather-EPD
+#
+# The one schema of the weather data, from the providers and ThingSpeak to
+# the frames: Current, DayForecast and SensorReading are frozen records with
+# __slots__, Hourly holds the hourly forecast as array columns and Weather
+# ties one cycle's worth together. packWeather()/unpackWeather() turn a
+# Weather into compact bytes (struct) and back, e.g. for hashing it or
+# handing it to another process.
+#
+
+import math
+import struct
+from array import array
+from collections import namedtuple
+from operator import attrgetter
+from dataclasses import dataclass, fields, asdict
+
+
+# icons Open Source https://github.com/kickstandapps/WeatherIcons
+ICONS = {
+    'clear-day':            'Sun',
+    'clear-night':          'Moon',
+    'rain':                 'Rain',
+    'snow':                 'Snow',
+    'sleet':                'Hail',
+    'wind':                 'wind',
+    'fog':                  'Haze',
+    'cloudy':               'Cloud',
+    'partly-cloudy-day':    'PartlySunny',
+    'partly-cloudy-night':  'PartlyMoon'
+}
+
+
+def findIcon(cond):
+    """
+    clear-day, clear-night, rain, snow, sleet, wind, fog, cloudy, partly-cloudy-day, partly-cloudy-night
+    """
+    if cond in ICONS:
+        return ICONS[cond]
+    else:
+        print('No icon for ', cond)
+        return 'Tornado'
+
+
+@dataclass(frozen=True)
+class Current:
+    __slots__ = (
+        'summary', 'icon', 'precip_probability', 'precip_type', 'temperature', 'humidity', 'wind_speed',
+        'wind_bearing', 'pressure', 'wind_direction', 'cloud_cover', 'units', '_condition'
+    )
+    summary: str
+    icon: str
+    precip_probability: int
+    precip_type: str
+    temperature: float
+    humidity: int
+    wind_speed: float
+    wind_bearing: int
+    pressure: int
+    wind_direction: str
+    cloud_cover: int
+    units: str
+
+    def __post_init__(self):
+        # looked up once, not on every render; a slot but no field, so it is
+        # neither stored nor packed nor compared
+        object.__setattr__(self, '_condition', findIcon(self.icon))
+
+    @property
+    def condition(self):
+        """ Name of the icon file """
+        return self._condition
+
+
+@dataclass(frozen=True)
+class DayForecast:
+    __slots__ = (
+        'date', 'summary', 'icon', 'sunrise_time', 'sunset_time', 'moon_phase', 'precip_intensity',
+        'precip_probability', 'precip_type', 'humidity', 'pressure', 'wind_speed', 'wind_bearing',
+        'wind_direction', 'cloud_cover', 'uv_index', 'temperature_min', 'temperature_max', '_condition'
+    )
+    date: str
+    summary: str
+    icon: str
+    sunrise_time: str
+    sunset_time: str
+    moon_phase: float
+    precip_intensity: float
+    precip_probability: int
+    precip_type: str
+    humidity: int
+    pressure: int
+    wind_speed: float
+    wind_bearing: int
+    wind_direction: str
+    cloud_cover: int
+    uv_index: float
+    temperature_min: int
+    temperature_max: int
+
+    def __post_init__(self):
+        # looked up once, not on every render; a slot but no field, so it is
+        # neither stored nor packed nor compared
+        object.__setattr__(self, '_condition', findIcon(self.icon))
+
+    @property
+    def condition(self):
+        """ Name of the icon file """
+        return self._condition
+
+
+@dataclass(frozen=True)
+class SensorReading:
+    __slots__ = ('time', 'temp', 'volt')
+    # unix seconds of the ThingSpeak entry
+    time: int
+    temp: float
+    volt: float
+
+
+# HOURLY block: one column per field, the hours in order; the time as unix
+# seconds, the precipitation probability in percent. In memory each column is
+# an array (about 1.5 KB for 48 hours), missing values are NaN.
+HOURLY_FIELDS = ('time', 'temperature', 'precip_probability', 'wind_speed', 'wind_bearing')
+HOURLY_TYPECODES = ('q', 'f', 'B', 'f', 'f')
+Hourly = namedtuple('Hourly', HOURLY_FIELDS)
+
+
+def hourlyArrays(block):
+    """ Hourly from the HOURLY columns of a provider (lists) """
+    columns = []
+    for field, typecode in zip(HOURLY_FIELDS, HOURLY_TYPECODES):
+        values = block[field]
+        if typecode == 'f':
+            values = (math.nan if value is None else value for value in values)
+        columns.append(array(typecode, values))
+    return Hourly(*columns)
+
+
+@dataclass(frozen=True)
+class Weather:
+    """ Everything a cycle draws: days[0] is today, sensor and hourly may be None """
+    __slots__ = ('current', 'days', 'sensor', 'hourly')
+    current: Current
+    days: tuple
+    sensor: SensorReading
+    hourly: Hourly
+
+    @property
+    def temperature(self):
+        """ The sensor's temperature, the forecast's one without a reading """
+        return self.current.temperature if self.sensor is None else self.sensor.temp
+
+    @property
+    def battery(self):
+        return '--' if self.sensor is None else self.sensor.volt
+
+
+def fromBlock(name, data):
+    """ The record(s) of a normalized block as stored in JSON: 'currently', 'daily' or 'hourly' """
+    if name == 'currently':
+        return Current(**data)
+    elif name == 'daily':
+        return tuple(DayForecast(**day) for day in data)
+    return data
+
+
+def toBlock(name, value):
+    """ The JSON form of a block's record(s), see fromBlock() """
+    if name == 'currently':
+        return asdict(value)
+    elif name == 'daily':
+        return [asdict(day) for day in value]
+    return value
+
+
+# Binary form: every record is a struct of a bitmap of its None fields and
+# its numbers, followed by its strings (length + UTF-8). None numbers are
+# packed as 0, None strings as empty.
+class Codec:
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.names = [f.name for f in fields(cls)]
+        self.numbers = [f.name for f in fields(cls) if f.type in (int, float)]
+        self.strings = [f.name for f in fields(cls) if f.type is str]
+        self.struct = struct.Struct('<I' + ''.join('q' if f.type is int else 'd' for f in fields(cls)
+                                                   if f.type in (int, float)))
+        self.values = attrgetter(*self.names)
+        self.positions = [self.names.index(name) for name in self.numbers]
+        self.string_positions = [self.names.index(name) for name in self.strings]
+
+    def pack(self, record, out):
+        values = self.values(record)
+        nones = 0
+        for i, value in enumerate(values):
+            if value is None:
+                nones |= 1 << i
+        out.append(self.struct.pack(nones, *[values[i] or 0 for i in self.positions]))
+        for i in self.string_positions:
+            data = (values[i] or '').encode('utf-8')
+            out.append(STRING.pack(len(data)))
+            out.append(data)
+
+    def unpack(self, data, offset):
+        numbers = self.struct.unpack_from(data, offset)
+        offset += self.struct.size
+        values = dict(zip(self.numbers, numbers[1:]))
+        for name in self.strings:
+            length, = STRING.unpack_from(data, offset)
+            offset += STRING.size
+            values[name] = bytes(data[offset:offset + length]).decode('utf-8')
+            offset += length
+        for i, name in enumerate(self.names):
+            if numbers[0] & (1 << i):
+                values[name] = None
+        return self.cls(**values), offset
+
+
+STRING = struct.Struct('<H')
+COUNT = struct.Struct('<B')
+COLUMN = struct.Struct('<H')
+codecs = dict((cls, Codec(cls)) for cls in (Current, DayForecast, SensorReading))
+
+
+def packWeather(weather):
+    """ A Weather as bytes """
+    out = []
+    codecs[Current].pack(weather.current, out)
+    out.append(COUNT.pack(len(weather.days)))
+    for day in weather.days:
+        codecs[DayForecast].pack(day, out)
+    out.append(COUNT.pack(weather.sensor is not None))
+    if weather.sensor is not None:
+        codecs[SensorReading].pack(weather.sensor, out)
+    out.append(COUNT.pack(weather.hourly is not None))
+    if weather.hourly is not None:
+        hours = len(weather.hourly.time)
+        out.append(COLUMN.pack(hours))
+        for column in weather.hourly:
+            out.append(column.tobytes())
+    return b''.join(out)
+
+
+def unpackWeather(data):
+    """ The Weather packed by packWeather() """
+    data = memoryview(data)
+    current, offset = codecs[Current].unpack(data, 0)
+    count, = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    days = []
+    for _ in range(count):
+        day, offset = codecs[DayForecast].unpack(data, offset)
+        days.append(day)
+    sensor = None
+    has_sensor, = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    if has_sensor:
+        sensor, offset = codecs[SensorReading].unpack(data, offset)
+    hourly = None
+    has_hourly, = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    if has_hourly:
+        hours, = COLUMN.unpack_from(data, offset)
+        offset += COLUMN.size
+        columns = []
+        for typecode in HOURLY_TYPECODES:
+            column = array(typecode)
+            size = column.itemsize * hours
+            column.frombytes(data[offset:offset + size])
+            offset += size
+            columns.append(column)
+        hourly = Hourly(*columns)
+    return Weather(current, tuple(days), sensor, hourly)
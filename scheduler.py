@@ -0,0 +1,101 @@
+# coding: utf-8
+#
+# Weather station display for Raspberry and Waveshare 2.7" e-Paper display
+# (event loop of the refresh script)
+#
+# Copyright by Antal Rutz
+#
+# Documentation and full source code:
+# https://github.com/arutz12/Raspberry-Weather-EPD
+#
+# One asyncio loop owns the periodic refresh, forced refreshes (SIGHUP) and
+# shutdown (SIGTERM/SIGINT). The actual work (fetching, rendering) runs one
+# job at a time on a single worker thread; the panel itself is driven by the
+# display worker (display.py).
+#
+
+import math
+import time
+import signal
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+def nextBoundary(now, period, offset=0):
+    """ The first wall-clock time after `now` that is `offset` past a multiple of `period` """
+    return (math.floor((now - offset) / period) + 1) * period + offset
+
+
+class Scheduler:
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='worker')
+        self.periodic = []
+        self.stopping = None
+        # 'cycles': periodic runs, 'forced': of those started by SIGHUP,
+        # 'late': seconds the last one started after its boundary, 'jobs': all jobs run
+        self.stats = {'cycles': 0, 'forced': 0, 'late': None, 'jobs': 0}
+
+    def every(self, period, func, offset=0):
+        """
+        Run `func` at start and then on every wall-clock multiple of `period`
+        seconds (plus `offset`), e.g. at :00, :05, :10 for 300. The wait is
+        always computed to the next boundary, so the time the job takes does
+        not add up from cycle to cycle.
+        """
+        self.periodic.append((period, func, offset))
+
+    def submit(self, func, *args):
+        self.stats['jobs'] += 1
+        future = self.loop.run_in_executor(self.worker, func, *args)
+        future.add_done_callback(self.report)
+        return future
+
+    def report(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            print(future.exception())
+
+    async def runPeriodic(self, period, func, offset):
+        boundary = None
+        while not self.stopping.is_set():
+            self.stats['cycles'] += 1
+            if boundary is not None:
+                self.stats['late'] = time.time() - boundary
+            try:
+                await self.submit(func)
+            except Exception:
+                pass  # already reported, the next cycle tries again
+
+            boundary = nextBoundary(time.time(), period, offset)
+            waiters = [asyncio.ensure_future(self.stopping.wait()), asyncio.ensure_future(self.forced.wait())]
+            done, pending = await asyncio.wait(
+                waiters, timeout=boundary - time.time(), return_when=asyncio.FIRST_COMPLETED
+            )
+            for waiter in pending:
+                waiter.cancel()
+            if self.forced.is_set():
+                self.forced.clear()
+                self.stats['forced'] += 1
+                boundary = None
+
+    async def main(self, on_stop):
+        self.stopping = asyncio.Event()
+        self.forced = asyncio.Event()
+        self.loop.add_signal_handler(signal.SIGTERM, self.stopping.set)
+        self.loop.add_signal_handler(signal.SIGINT, self.stopping.set)
+        self.loop.add_signal_handler(signal.SIGHUP, self.forced.set)
+
+        await asyncio.gather(*[self.runPeriodic(*job) for job in self.periodic])
+        # after the job in progress and whatever was queued before it
+        if on_stop is not None:
+            await self.submit(on_stop)
+
+    def run(self, on_stop=None):
+        """ Run until SIGTERM/SIGINT, then call `on_stop` on the worker """
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.main(on_stop))
+        finally:
+            self.worker.shutdown(wait=True)
+            self.loop.close()
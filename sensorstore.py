@@ -0,0 +1,197 @@
+# coding: utf-8
+#
+# Weather station display for Raspberry and Waveshare 2.7" e-Paper display
+# (local store of the ThingSpeak sensor readings)
+#
+# Copyright by Antal Rutz
+#
+# Documentation and full source code:
+# https://github.com/arutz12/Raspberry-Weather-EPD
+#
+# Every reading of the channel is kept in an SQLite file, keyed by its
+# ThingSpeak entry_id, so a restart or a graph doesn't need the history from
+# the cloud again and TSfetch only asks for the entries after the last stored
+# one. Readings older than raw_days are folded into hourly averages (with the
+# min/max temperature), hourly rows older than hourly_days are dropped. The
+# newest entry and how far the readings were folded are kept apart from them,
+# so a sensor silent for longer than raw_days neither starts a backfill nor
+# gets entries folded a second time.
+# Range queries return columns as array.array, missing values as NaN.
+#
+
+import os
+import math
+import time
+import sqlite3
+import threading
+from array import array
+from datetime import datetime
+from collections import namedtuple
+
+# time: unix seconds ('q'), the rest floats ('d'); for raw readings temp_min
+# and temp_max are the temp column itself
+Series = namedtuple('Series', 'time temp volt temp_min temp_max')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    entry_id INTEGER PRIMARY KEY,
+    time INTEGER NOT NULL,
+    temp REAL,
+    volt REAL
+);
+CREATE INDEX IF NOT EXISTS readings_time ON readings (time);
+CREATE TABLE IF NOT EXISTS hourly (
+    hour INTEGER PRIMARY KEY,
+    temp REAL,
+    temp_min REAL,
+    temp_max REAL,
+    volt REAL,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entry_id INTEGER,
+    time INTEGER,
+    folded INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO sync (id) VALUES (0);
+"""
+
+# hours already in the table (readings that arrived late, after an outage)
+# are merged weighted by their reading count
+DOWNSAMPLE = """
+INSERT INTO hourly (hour, temp, temp_min, temp_max, volt, count)
+    SELECT time / 3600 * 3600, avg(temp), min(temp), max(temp), avg(volt), count(temp)
+    FROM readings WHERE time < ? GROUP BY time / 3600
+ON CONFLICT (hour) DO UPDATE SET
+    temp = (ifnull(temp, 0) * count + ifnull(excluded.temp, 0) * excluded.count) / nullif(count + excluded.count, 0),
+    temp_min = min(ifnull(temp_min, excluded.temp_min), ifnull(excluded.temp_min, temp_min)),
+    temp_max = max(ifnull(temp_max, excluded.temp_max), ifnull(excluded.temp_max, temp_max)),
+    volt = ifnull((ifnull(volt, 0) * count + ifnull(excluded.volt, 0) * excluded.count)
+                  / nullif(count + excluded.count, 0), ifnull(excluded.volt, volt)),
+    count = count + excluded.count
+"""
+
+# stored hours plus the raw readings grouped by hour
+HOURLY = """
+SELECT hour, sum(temp * count) / sum(count), min(temp_min), max(temp_max), avg(volt)
+FROM (
+    SELECT hour, temp, temp_min, temp_max, volt, count FROM hourly WHERE hour >= ? AND hour < ?
+    UNION ALL
+    SELECT time / 3600 * 3600, avg(temp), min(temp), max(temp), avg(volt), count(temp)
+    FROM readings WHERE time >= ? AND time < ? GROUP BY time / 3600
+)
+GROUP BY hour ORDER BY hour
+"""
+
+
+def parseTime(created_at):
+    """ ThingSpeak's created_at ('2020-04-01T10:00:00Z' or with an offset) as unix seconds """
+    return int(datetime.fromisoformat(created_at.replace('Z', '+00:00')).timestamp())
+
+
+def number(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+def column(typecode, values):
+    return array(typecode, (math.nan if v is None else v for v in values))
+
+
+class SensorStore:
+
+    def __init__(self, path, raw_days=7, hourly_days=365):
+        self.path = path
+        self.raw_days = raw_days
+        self.hourly_days = hourly_days
+        self.lock = threading.Lock()
+        self.pruned = 0
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # used from the fetch worker, the lock keeps it one thread at a time
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+
+    def last(self):
+        """ (entry_id, time) of the newest reading ever stored, even if folded since; None if none was """
+        with self.lock:
+            rows = [
+                self.db.execute('SELECT entry_id, time FROM readings ORDER BY entry_id DESC LIMIT 1').fetchone(),
+                self.db.execute('SELECT entry_id, time FROM sync WHERE entry_id IS NOT NULL').fetchone()
+            ]
+        rows = [row for row in rows if row is not None]
+        return max(rows) if rows else None
+
+    def latest(self):
+        """ The newest reading as (time, temp, volt), None if empty """
+        with self.lock:
+            return self.db.execute('SELECT time, temp, volt FROM readings ORDER BY time DESC LIMIT 1').fetchone()
+
+    def add(self, feeds):
+        """
+        Store ThingSpeak feed entries, the ones already stored (or folded into
+        the hourly rows) are skipped; returns the number added
+        """
+        rows = [
+            (feed['entry_id'], parseTime(feed['created_at']), number(feed.get('field1')), number(feed.get('field2')))
+            for feed in feeds
+        ]
+        with self.lock, self.db:
+            folded = self.db.execute('SELECT folded FROM sync').fetchone()[0]
+            rows = [row for row in rows if row[1] >= folded]
+            before = self.db.total_changes
+            self.db.executemany('INSERT OR IGNORE INTO readings VALUES (?, ?, ?, ?)', rows)
+            added = self.db.total_changes - before
+            if rows:
+                entry_id, t = max(rows)[:2]
+                self.db.execute('UPDATE sync SET entry_id = ?, time = ? WHERE ifnull(entry_id, -1) < ?',
+                                (entry_id, t, entry_id))
+            return added
+
+    def prune(self, now=None):
+        """
+        Fold readings older than raw_days into hourly rows and drop the hourly
+        rows older than hourly_days. Whole hours only, so an hour is never
+        split between the two tables.
+        """
+        now = time.time() if now is None else now
+        cutoff = int(now - self.raw_days * 86400) // 3600 * 3600
+        with self.lock, self.db:
+            self.db.execute(DOWNSAMPLE, (cutoff,))
+            self.db.execute('DELETE FROM readings WHERE time < ?', (cutoff,))
+            self.db.execute('UPDATE sync SET folded = max(folded, ?)', (cutoff,))
+            self.db.execute('DELETE FROM hourly WHERE hour < ?', (int(now - self.hourly_days * 86400),))
+        self.pruned = now
+
+    def maintain(self, now=None, interval=3600):
+        """ prune() at most once per `interval` seconds """
+        now = time.time() if now is None else now
+        if now - self.pruned >= interval:
+            self.prune(now)
+
+    def readings(self, start, end=None):
+        """ Raw readings with start <= time < end """
+        end = 2 ** 62 if end is None else end
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT time, temp, volt FROM readings WHERE time >= ? AND time < ? ORDER BY time', (start, end)
+            ).fetchall()
+        times, temps, volts = zip(*rows) if rows else ((), (), ())
+        temp = column('d', temps)
+        return Series(array('q', times), temp, column('d', volts), temp, temp)
+
+    def hourly(self, start, end=None):
+        """ Hourly averages (and temperature min/max) of the hours with start <= hour < end """
+        end = 2 ** 62 if end is None else end
+        with self.lock:
+            rows = self.db.execute(HOURLY, (start, end, start, end)).fetchall()
+        columns = list(zip(*rows)) if rows else [()] * 5
+        return Series(array('q', columns[0]), *(column('d', values) for values in columns[1:]))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
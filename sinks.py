@@ -0,0 +1,125 @@
+# coding: utf-8
+#
+# Weather station display for Raspberry and Waveshare 2.7" e-Paper display
+# (panel outputs of the fan-out service)
+#
+# Copyright by Antal Rutz
+#
+# Documentation and full source code:
+# https://github.com/arutz12/Raspberry-Weather-EPD
+#
+# A sink puts the packed buffer of a frame on a panel: the e-Paper HAT of
+# this Raspberry ('epd'), a file another program picks up ('file:<path>') or
+# a remote panel taking it over HTTP (an http:// or https:// URL).
+#
+
+import os
+import time
+import requests
+import metrics
+
+# seconds to open the connection and to wait for the answer
+HTTP_TIMEOUT = (5, 15)
+
+
+class Sink:
+    """ show(buffer) puts a packed panel buffer on the panel; errors are raised """
+
+    name = None
+
+    def show(self, buffer):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class EPDSink(Sink):
+    """
+    The panel on this Raspberry, initialized on first use and refreshed
+    partially like in the refresh script. The driver's pins are global, so
+    there is only one per process (or any number with EPD_BACKEND=fake).
+    """
+
+    name = 'epd'
+
+    def __init__(self, partial_threshold=None):
+        self.partial_threshold = partial_threshold
+        self.epd = None
+
+    def panel(self):
+        if self.epd is None:
+            import waveshare_epd.epd2in7
+
+            self.epd = waveshare_epd.epd2in7.EPD()
+            if self.partial_threshold is not None:
+                self.epd.partial_threshold = self.partial_threshold
+            self.epd.init()
+        return self.epd
+
+    def show(self, buffer):
+        from waveshare_epd.epd2in7 import BusyTimeout
+        epd = self.panel()
+        sent = epd.bytes_sent
+        try:
+            epd.display_partial(buffer)
+        except BusyTimeout:
+            metrics.inc('busy_timeouts_total')
+            epd.recover()
+            raise
+        metrics.inc('spi_bytes_total', epd.bytes_sent - sent)
+
+    def close(self):
+        # only if it was ever woken up
+        if self.epd is not None:
+            self.epd.sleep()
+
+
+class FileSink(Sink):
+    """ Writes the buffer to `path`, replaced at once so a reader never sees half a frame """
+
+    name = 'file'
+
+    def __init__(self, path):
+        self.path = path
+
+    def show(self, buffer):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_file = self.path + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(buffer)
+        os.replace(tmp_file, self.path)
+
+
+class HTTPSink(Sink):
+    """ PUTs the buffer to `url` as application/octet-stream, over one kept-alive session """
+
+    name = 'http'
+
+    def __init__(self, url):
+        self.url = url
+        self.session = requests.Session()
+
+    def show(self, buffer):
+        start = time.perf_counter()
+        try:
+            r = self.session.put(self.url, data=buffer, timeout=HTTP_TIMEOUT,
+                                 headers={'Content-Type': 'application/octet-stream'})
+            r.raise_for_status()
+        finally:
+            metrics.observe('sink_seconds', time.perf_counter() - start, sink=self.name)
+
+    def close(self):
+        self.session.close()
+
+
+def makeSink(spec):
+    """ The sink described by `spec`: 'epd', 'file:<path>' or an http(s):// URL """
+    if spec == 'epd':
+        partial_threshold = os.environ.get('PARTIAL_THRESHOLD')
+        return EPDSink(float(partial_threshold) if partial_threshold else None)
+    elif spec.startswith('file:'):
+        return FileSink(spec[len('file:'):])
+    elif spec.startswith(('http://', 'https://')):
+        return HTTPSink(spec)
+    raise ValueError('Unknown sink: ' + spec)
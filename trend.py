@@ -0,0 +1,122 @@
+# coding: utf-8
+#
+# Weather station display for Raspberry and Waveshare 2.7" e-Paper display
+# (sensor history plots, hourly forecast bars)
+#
+# Copyright by Antal Rutz
+#
+# Documentation and full source code:
+# https://github.com/arutz12/Raspberry-Weather-EPD
+#
+# A series of any length is reduced to the min and max of every pixel column
+# before it is drawn: the plot looks the same as with every point drawn
+# (spikes included), and all of it is a few numpy passes over the arrays, so
+# a week of readings is plotted in about a millisecond.
+#
+
+import numpy as np
+from PIL import Image
+
+
+def columnRanges(times, values, start, end, width):
+    """
+    Min and max of `values` in each of `width` equal time columns between
+    `start` and `end`; NaN for columns without a reading. `times` must be
+    sorted (as the sensor store returns them), missing values are NaN.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    edges = np.searchsorted(times, np.linspace(start, end, width + 1))
+    # the last column includes `end` itself
+    edges[-1] = np.searchsorted(times, end, side='right')
+    mins = np.full(width, np.nan)
+    maxs = np.full(width, np.nan)
+    filled = edges[1:] > edges[:-1]
+    if filled.any():
+        # reduceat reduces from each index to the next one: the filled
+        # columns are cut at their first reading, the last one ends at `end`
+        first = edges[:-1][filled]
+        mins[filled] = np.fmin.reduceat(values[:edges[-1]], first)
+        maxs[filled] = np.fmax.reduceat(values[:edges[-1]], first)
+    return mins, maxs
+
+
+def valueRange(mins, maxs, span):
+    """ (low, high) of the plotted values, at least `span` apart so a flat line sits mid-box """
+    if np.isnan(mins).all():
+        return None
+    low, high = float(np.nanmin(mins)), float(np.nanmax(maxs))
+    if high - low < span:
+        middle = (low + high) / 2
+        low, high = middle - span / 2, middle + span / 2
+    return low, high
+
+
+def plotMask(times, values, start, end, size, span=1):
+    """
+    The plot of a series as a 1-bit mask of `size` (True where black): one
+    vertical run per column from its min to its max, stretched to meet the
+    previous column so the line has no holes. Columns without readings stay
+    empty. Returns None if there is nothing to plot.
+    """
+    width, height = size
+    mins, maxs = columnRanges(times, values, start, end, width)
+    value_range = valueRange(mins, maxs, span)
+    if value_range is None:
+        return None
+    low, high = value_range
+    scale = (height - 1) / (high - low)
+    # pixel rows, 0 at the top
+    tops = np.rint((high - maxs) * scale)
+    bottoms = np.rint((high - mins) * scale)
+    # join each column to its left neighbour (a NaN neighbour leaves it as it
+    # is); an empty column is not joined to anything and stays empty
+    filled = ~np.isnan(tops[1:])
+    tops[1:], bottoms[1:] = (np.where(filled, np.fmin(tops[1:], bottoms[:-1]), np.nan),
+                             np.where(filled, np.fmax(bottoms[1:], tops[:-1]), np.nan))
+    rows = np.arange(height)[:, None]
+    # NaN compares false, empty columns stay white
+    return (rows >= tops) & (rows <= bottoms)
+
+
+def pastePlot(mask, box, times, values, start, end, span=1):
+    """ Draw the plot of a series into `box` (x1, y1, x2, y2, inclusive) of the 1-bit `mask` """
+    x1, y1, x2, y2 = box
+    plot = plotMask(times, values, start, end, (x2 - x1 + 1, y2 - y1 + 1), span)
+    if plot is not None:
+        mask.paste(0, (x1, y1), Image.fromarray(plot))
+
+
+def barMask(values, size, slots=None, span=1, value_range=None):
+    """
+    Bars of `values` as a 1-bit mask of `size` (True where black), one per
+    slot of the width, left to right, with a 1 pixel gap. The heights are
+    scaled between `value_range` (low, high), by default the min and max of
+    the values (at least `span` apart); the lowest value still gets 1 pixel.
+    NaN values get no bar. Returns None if there is nothing to draw.
+    """
+    width, height = size
+    values = np.asarray(values, dtype=np.float64)
+    slots = slots or len(values)
+    if value_range is None:
+        value_range = valueRange(values, values, span)
+    if value_range is None or not len(values):
+        return None
+    low, high = value_range
+    heights = np.clip(np.rint((values - low) / (high - low) * (height - 1)) + 1, 1, height)
+    heights = np.nan_to_num(heights, nan=0)
+    slot = width // slots
+    columns = np.arange(width)
+    bar = np.minimum(columns // slot, len(values) - 1)
+    in_bar = (columns % slot < slot - 1) & (columns // slot < len(values))
+    column_heights = np.where(in_bar, heights[bar], 0)
+    rows = np.arange(height)[:, None]
+    return rows >= height - column_heights
+
+
+def pasteBars(mask, box, values, slots=None, span=1, value_range=None):
+    """ Draw the bars of `values` into `box` (x1, y1, x2, y2, inclusive) of the 1-bit `mask` """
+    x1, y1, x2, y2 = box
+    bars = barMask(values, (x2 - x1 + 1, y2 - y1 + 1), slots, span, value_range)
+    if bars is not None:
+        mask.paste(0, (x1, y1), Image.fromarray(bars))
@@ -28,12 +28,19 @@
 #
 
 import logging
+import time
+from collections import deque
 from . import epdconfig
+from . import packing
 
 # Display resolution
 EPD_WIDTH       = 176
 EPD_HEIGHT      = 264
 
+class BusyTimeout(RuntimeError):
+    """ The panel kept BUSY asserted longer than EPD.busy_timeout """
+    pass
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -42,6 +49,25 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.white = bytes([0xFF]) * int(self.width * self.height / 8)
+        # seconds spent pushing the last frame over SPI (display/Clear)
+        self.transfer_time = 0.0
+        # what the panel shows now, the base for partial refreshes
+        self.last_buffer = None
+        # above this fraction of changed area display_partial does a full refresh
+        self.partial_threshold = 0.5
+        # full refresh after this many partial ones to clear ghosting
+        self.max_partials = 10
+        self.partials = 0
+        # give up on a panel that stays busy longer than this (seconds)
+        self.busy_timeout = 30
+        # observed busy durations in seconds, most recent last
+        self.busy_times = deque(maxlen=50)
+        # running totals since init: bytes sent over SPI, seconds spent busy
+        self.bytes_sent = 0
+        self.busy_total = 0.0
+        # refreshes given up on after BUSY stayed asserted, see recover()
+        self.busy_timeouts = 0
 
     lut_vcom_dc = [0x00, 0x00,
         0x00, 0x08, 0x00, 0x00, 0x00, 0x02,
@@ -88,6 +114,17 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
     ]
+
+    # register 0xF8 writes of the init sequence
+    power_optimization = [
+        [0x60, 0xA5],
+        [0x89, 0xA5],
+        [0x90, 0x00],
+        [0x93, 0x2A],
+        [0xA0, 0xA5],
+        [0xA1, 0x00],
+        [0x73, 0x41],
+    ]
     
     # Hardware reset
     def reset(self):
@@ -103,35 +140,59 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
+        self.bytes_sent += 1
 
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+        self.bytes_sent += 1
+
+    # send a whole block of data bytes under a single DC/CS setup
+    def send_data2(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+        self.bytes_sent += len(data)
         
     def ReadBusy(self):        
         logging.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 0):      #  0: idle, 1: busy
-            epdconfig.delay_ms(200)                
+        start = time.perf_counter()
+        deadline = start + self.busy_timeout
+        edge = hasattr(epdconfig, 'wait_for_edge')
+        poll_ms = 1
+        while(epdconfig.digital_read(self.busy_pin) == 0):      #  0: busy, 1: idle
+            remaining_ms = (deadline - time.perf_counter()) * 1000
+            if remaining_ms <= 0:
+                raise BusyTimeout("e-Paper busy for more than %g s" % self.busy_timeout)
+            if edge:
+                # short slices, so an edge lost between the read and the wait costs little
+                try:
+                    epdconfig.wait_for_edge(self.busy_pin, min(remaining_ms, 100))
+                except RuntimeError:
+                    logging.debug("e-Paper busy: no edge detection, polling")
+                    edge = False
+            else:
+                epdconfig.delay_ms(min(poll_ms, remaining_ms))
+                poll_ms = min(poll_ms * 2, 50)
+        busy = time.perf_counter() - start
+        self.busy_times.append(busy)
+        self.busy_total += busy
         logging.debug("e-Paper busy release")
 
     def set_lut(self):
         self.send_command(0x20) # vcom
-        for count in range(0, 44):
-            self.send_data(self.lut_vcom_dc[count])
+        self.send_data2(self.lut_vcom_dc[0:44])
         self.send_command(0x21) # ww --
-        for count in range(0, 42):
-            self.send_data(self.lut_ww[count])
+        self.send_data2(self.lut_ww[0:42])
         self.send_command(0x22) # bw r
-        for count in range(0, 42):
-            self.send_data(self.lut_bw[count])
+        self.send_data2(self.lut_bw[0:42])
         self.send_command(0x23) # wb w
-        for count in range(0, 42):
-            self.send_data(self.lut_bb[count])
+        self.send_data2(self.lut_bb[0:42])
         self.send_command(0x24) # bb b
-        for count in range(0, 42):
-            self.send_data(self.lut_wb[count])
+        self.send_data2(self.lut_wb[0:42])
             
     def init(self):
         if (epdconfig.module_init() != 0):
@@ -141,51 +202,21 @@ class EPD:
         self.reset()
         
         self.send_command(0x01) # POWER_SETTING
-        self.send_data(0x03) # VDS_EN, VDG_EN
-        self.send_data(0x00) # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
-        self.send_data(0x2b) # VDH
-        self.send_data(0x2b) # VDL
-        self.send_data(0x09) # VDHR
+        self.send_data2([
+            0x03, # VDS_EN, VDG_EN
+            0x00, # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
+            0x2b, # VDH
+            0x2b, # VDL
+            0x09, # VDHR
+        ])
         
         self.send_command(0x06) # BOOSTER_SOFT_START
-        self.send_data(0x07)
-        self.send_data(0x07)
-        self.send_data(0x17)
-        
-        # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0x60)
-        self.send_data(0xA5)
-        
-        # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0x89)
-        self.send_data(0xA5)
-        
-        # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0x90)
-        self.send_data(0x00)
-        
-        # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0x93)
-        self.send_data(0x2A)
-        
-        # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0xA0)
-        self.send_data(0xA5)
+        self.send_data2([0x07, 0x07, 0x17])
         
         # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0xA1)
-        self.send_data(0x00)
-        
-        # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0x73)
-        self.send_data(0x41)
+        for data in self.power_optimization:
+            self.send_command(0xF8)
+            self.send_data2(data)
         
         self.send_command(0x16) # PARTIAL_DISPLAY_REFRESH
         self.send_data(0x00)
@@ -204,48 +235,84 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # logging.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logging.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return packing.pack_image(image, self.width, self.height)
 
     def display(self, image):
+        start = time.perf_counter()
         self.send_command(0x10)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data2(self.white)
         self.send_command(0x13)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(image[i])
+        self.send_data2(image)
+        self.transfer_time = time.perf_counter() - start
         self.send_command(0x12) 
         self.ReadBusy()
+        self.last_buffer = bytes(image)
+        self.partials = 0
+
+    def display_partial(self, image):
+        """
+        Refresh only the windows of `image` that differ from the frame on the
+        panel. Falls back to display() when there is no previous frame, too
+        much of the panel changed or max_partials has been reached.
+        Returns the list of refreshed (x, y, w, l) windows.
+        """
+        full = [(0, 0, self.width, self.height)]
+        if self.last_buffer is None or self.partials >= self.max_partials:
+            self.display(image)
+            return full
+
+        regions = packing.dirty_regions(self.last_buffer, image, self.width)
+        changed = sum(w * l for x, y, w, l in regions)
+        if changed > self.partial_threshold * self.width * self.height:
+            self.display(image)
+            return full
+
+        self.transfer_time = 0.0
+        for x, y, w, l in regions:
+            start = time.perf_counter()
+            window = [x >> 8, x & 0xf8, y >> 8, y & 0xff, w >> 8, w & 0xf8, l >> 8, l & 0xff]
+            self.send_command(0x14) # PARTIAL_DATA_START_TRANSMISSION_1 (old)
+            self.send_data2(window)
+            self.send_data2(packing.crop(self.last_buffer, self.width, x, y, w, l))
+            self.send_command(0x15) # PARTIAL_DATA_START_TRANSMISSION_2 (new)
+            self.send_data2(window)
+            self.send_data2(packing.crop(image, self.width, x, y, w, l))
+            self.send_command(0x16) # PARTIAL_DISPLAY_REFRESH
+            self.send_data2(window)
+            self.transfer_time += time.perf_counter() - start
+            self.ReadBusy()
+        self.last_buffer = bytes(image)
+        if regions:
+            self.partials += 1
+        return regions
         
     def Clear(self, color):
+        start = time.perf_counter()
         self.send_command(0x10)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data2(self.white)
         self.send_command(0x13)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data2(self.white)
+        self.transfer_time = time.perf_counter() - start
         self.send_command(0x12) 
         self.ReadBusy()
+        self.last_buffer = self.white
+        self.partials = 0
+
+    def recover(self):
+        """
+        After a BusyTimeout: reset the panel, which usually unsticks it. It
+        may have taken some of the windows of the failed refresh, so what it
+        shows is unknown and the next refresh is a full one. Returns False if
+        the reset timed out too (the next refresh tries again).
+        """
+        self.busy_timeouts += 1
+        self.last_buffer = None
+        try:
+            self.init()
+        except BusyTimeout as e:
+            logging.warning('%s, reset failed', e)
+            return False
+        return True
 
     def sleep(self):
         self.send_command(0X50)
@@ -32,6 +32,18 @@ import logging
 import sys
 import time
 
+# spidev refuses transfers longer than its kernel buffer (4096 bytes unless
+# the module was loaded with a different bufsiz)
+SPIDEV_BUFSIZ_PATH = '/sys/module/spidev/parameters/bufsiz'
+
+
+def spidev_bufsiz(default=4096):
+    try:
+        with open(SPIDEV_BUFSIZ_PATH) as f:
+            return int(f.read())
+    except (IOError, ValueError):
+        return default
+
 
 class RaspberryPi:
     # Pin definition
@@ -48,6 +60,7 @@ class RaspberryPi:
 
         # SPI device, bus = 0, device = 0
         self.SPI = spidev.SpiDev(0, 0)
+        self.SPI_BUFSIZ = spidev_bufsiz()
 
     def digital_write(self, pin, value):
         self.GPIO.output(pin, value)
@@ -58,9 +71,19 @@ class RaspberryPi:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_for_edge(self, pin, timeout_ms):
+        # True on the rising edge, False if timeout_ms passed first
+        return self.GPIO.wait_for_edge(pin, self.GPIO.RISING, timeout=max(1, int(timeout_ms))) is not None
+
     def spi_writebyte(self, data):
         self.SPI.writebytes(data)
 
+    def spi_writebyte2(self, data):
+        # one ioctl per spidev buffer instead of one per byte
+        data = memoryview(bytes(data) if isinstance(data, list) else data)
+        for start in range(0, len(data), self.SPI_BUFSIZ):
+            self.SPI.writebytes2(data[start:start + self.SPI_BUFSIZ])
+
     def module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
@@ -118,9 +141,20 @@ class JetsonNano:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_for_edge(self, pin, timeout_ms):
+        # True on the rising edge, False if timeout_ms passed first
+        return self.GPIO.wait_for_edge(pin, self.GPIO.RISING, timeout=max(1, int(timeout_ms))) is not None
+
     def spi_writebyte(self, data):
         self.SPI.SYSFS_software_spi_transfer(data[0])
 
+    def spi_writebyte2(self, data):
+        # the bit-banged SPI only moves a byte per call, but the whole block
+        # goes out under a single CS/DC setup
+        transfer = self.SPI.SYSFS_software_spi_transfer
+        for byte in data:
+            transfer(byte)
+
     def module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
@@ -142,13 +176,83 @@ class JetsonNano:
         self.GPIO.cleanup()
 
 
-if os.path.exists('/sys/bus/platform/drivers/gpiomem-bcm2835'):
-    implementation = RaspberryPi()
-else:
-    implementation = JetsonNano()
+class Fake:
+    """
+    Panel-less backend: nothing is driven, every SPI transfer is recorded
+    together with the DC level it was sent under, and GPIO level changes and
+    delays are counted. Select it with EPD_BACKEND=fake (e.g. for benchmarks
+    on a PC) or use_implementation().
+    """
+    # Pin definition
+    RST_PIN         = 17
+    DC_PIN          = 25
+    CS_PIN          = 8
+    BUSY_PIN        = 24
+
+    def __init__(self):
+        self.pins = {}
+        self.transfers = []
+        self.toggles = 0
+        self.delayed_ms = 0
+
+    def digital_write(self, pin, value):
+        if self.pins.get(pin) != value:
+            self.toggles += 1
+        self.pins[pin] = value
+
+    def digital_read(self, pin):
+        return 1
+
+    def delay_ms(self, delaytime):
+        # counted, not slept: what the real panel would spend waiting
+        self.delayed_ms += delaytime
+
+    def spi_writebyte(self, data):
+        self.transfers.append((self.pins.get(self.DC_PIN, 0), bytes(data)))
+
+    def spi_writebyte2(self, data):
+        self.transfers.append((self.pins.get(self.DC_PIN, 0), bytes(data)))
+
+    def commands(self):
+        """ The recorded stream as a list of (command, data bytes) """
+        stream = []
+        for dc, data in self.transfers:
+            if dc:
+                command, payload = stream[-1]
+                stream[-1] = (command, payload + data)
+            else:
+                stream.extend((command, b'') for command in data)
+        return stream
+
+    def spi_bytes(self):
+        return sum(len(data) for dc, data in self.transfers)
+
+    def reset_stream(self):
+        self.transfers = []
+        self.toggles = 0
+        self.delayed_ms = 0
 
-for func in [x for x in dir(implementation) if not x.startswith('_')]:
-    setattr(sys.modules[__name__], func, getattr(implementation, func))
+    def module_init(self):
+        return 0
+
+    def module_exit(self):
+        pass
+
+
+def use_implementation(impl):
+    """ Route the module level functions to `impl` """
+    global implementation
+    implementation = impl
+    for func in [x for x in dir(implementation) if not x.startswith('_')]:
+        setattr(sys.modules[__name__], func, getattr(implementation, func))
+
+
+if os.environ.get('EPD_BACKEND') == 'fake':
+    use_implementation(Fake())
+elif os.path.exists('/sys/bus/platform/drivers/gpiomem-bcm2835'):
+    use_implementation(RaspberryPi())
+else:
+    use_implementation(JetsonNano())
 
 
 ### END OF FILE ###
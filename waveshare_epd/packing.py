@@ -0,0 +1,77 @@
+# *****************************************************************************
+# * | File        :   packing.py
+# * | Function    :   Frame buffer packing for the e-Paper drivers
+# * | Info        :
+# *----------------
+# * | Packs a whole PIL image into the 1bpp panel buffer in one go instead
+# * | of walking it pixel by pixel. Lives outside epd2in7 so frames can be
+# * | packed (and benchmarked) on hosts without spidev/RPi.GPIO.
+# ******************************************************************************
+
+import logging
+from PIL import Image
+
+
+def pack_image(image, width, height):
+    """
+    Pack `image` into a width x height 1bpp panel buffer (MSB first, 1 = white).
+
+    Portrait images (width x height) are packed as they are, landscape ones
+    (height x width) are rotated into panel orientation first. Any other size
+    gives an all-white buffer. `width` must be a multiple of 8.
+    """
+    image_monocolor = image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    if(imwidth == width and imheight == height):
+        logging.debug("Vertical")
+    elif(imwidth == height and imheight == width):
+        logging.debug("Horizontal")
+        # (x, y) -> (y, height - x - 1), i.e. a 90 degree counter-clockwise turn
+        image_monocolor = image_monocolor.transpose(Image.ROTATE_90)
+    else:
+        return bytearray([0xFF]) * (int(width / 8) * height)
+    return bytearray(image_monocolor.tobytes())
+
+
+def dirty_regions(old, new, width, merge_gap=8):
+    """
+    Compare two packed buffers and return the changed areas as a list of
+    byte-aligned (x, y, w, l) windows in panel coordinates.
+
+    Consecutive changed rows form one window spanning their widest changed
+    byte range; windows closer than `merge_gap` rows are merged, since each
+    partial refresh costs a waveform cycle of its own.
+    """
+    stride = int(width / 8)
+    bands = []
+    for y in range(int(len(new) / stride)):
+        start = y * stride
+        row_old = old[start:start + stride]
+        row_new = new[start:start + stride]
+        if row_old == row_new:
+            continue
+        first = 0
+        while row_old[first] == row_new[first]:
+            first += 1
+        last = stride - 1
+        while row_old[last] == row_new[last]:
+            last -= 1
+        if bands and y - bands[-1][3] - 1 <= merge_gap:
+            band = bands[-1]
+            bands[-1] = [min(band[0], first), band[1], max(band[2], last), y]
+        else:
+            bands.append([first, y, last, y])
+    return [(first * 8, top, (last - first + 1) * 8, bottom - top + 1)
+            for first, top, last, bottom in bands]
+
+
+def crop(buf, width, x, y, w, l):
+    """ Cut the byte-aligned window (x, y, w, l) out of a packed buffer """
+    stride = int(width / 8)
+    first = int(x / 8)
+    cols = int(w / 8)
+    window = bytearray()
+    for row in range(y, y + l):
+        start = row * stride + first
+        window += buf[start:start + cols]
+    return window
@@ -12,24 +12,30 @@
 # English version https://diyprojects.io/weather-station-epaper-displaydashboard-jeedom-raspberry-pi-via-json-rpc-api/
 #
 
+import time
+# start of the process as far as this script can tell, for the time to first frame
+started_at = time.perf_counter()
+
 import sys
 import os
-import time
 import locale
 from dotenv import load_dotenv
-from textwrap import wrap
 from datetime import datetime
-from datetime import timedelta
-from PIL import Image
-from PIL import ImageFont
-from PIL import ImageDraw
+from functools import partial
+from concurrent.futures import wait
+from framestore import FrameStore
+from display import DisplayWorker
+from records import Weather
+import framevalues
+from framevalues import unitNames, hourlyValues
+import metrics
+from layout import AssetCache, loadLayout
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
 dotenv_path = os.path.join(base_dir, '.env')
 load_dotenv(dotenv_path)
 
 LOCALE = os.environ.get('LOCALE')
-locale.setlocale(locale.LC_TIME, LOCALE)
 
 FORECAST_TITLE = os.environ.get('FORECAST_TITLE')
 RUN_ENV = os.environ.get('RUN_ENV')
@@ -38,22 +44,27 @@ SENSOR = False
 if os.environ.get('SENSOR') == '1':
     SENSOR = True
 
+# run the refresh loop without the e-Paper HAT (no panel, no buttons)
+NO_PANEL = os.environ.get('NO_PANEL') == '1'
+
+# serve the rendered frames over HTTP on this port (frameserver.py), off if empty
+FRAME_SERVER_PORT = int(os.environ.get('FRAME_SERVER_PORT') or 0)
+FRAME_SERVER_HOST = os.environ.get('FRAME_SERVER_HOST') or '127.0.0.1'
+
 # globals
 folder_img = os.path.join(base_dir, 'icons')
-cond_height = 100
-cond_width = 100
-big_height = 18
-icon_height = 25
-icon_width = 25
-border = 5
-column1 = 70
-column1_5 = 115
-column2_5 = 200
-column2 = 132
-column3 = 198
-bottom = 140
+LAYOUT = os.environ.get('LAYOUT') or '2in7'
 DEBUG = False
 SLEEPTIME = 300
+# refresh the panel after this many seconds even if nothing changed
+MAX_REFRESH_AGE = int(os.environ.get('MAX_REFRESH_AGE') or 3600)
+# seconds each data source may take before the cycle goes on without it
+WEATHER_DEADLINE = float(os.environ.get('WEATHER_DEADLINE') or 20)
+TS_DEADLINE = float(os.environ.get('TS_DEADLINE') or 10)
+# hours of sensor history on the trend frame (frame4)
+TREND_HOURS = 24
+# seconds key4 has to be held to clear the display when it also shows the trend frame
+KEY4_HOLD = 2
 
 test_mode = False
 
@@ -61,376 +72,371 @@ if RUN_ENV == 'test':
     test_mode = True
     DEBUG = True
 
+# keep BMP copies of the rendered frames (always on in test mode)
+SAVE_FRAMES = test_mode or os.environ.get('SAVE_FRAMES') == '1'
+
 if DEBUG:
     from pprint import pprint
 
-if test_mode:
-    EPD_WIDTH = 176
-    EPD_HEIGHT = 264
-else:
+# panel size (waveshare_epd.epd2in7.EPD_WIDTH/EPD_HEIGHT), known without importing the driver
+EPD_WIDTH = 176
+EPD_HEIGHT = 264
+
+if not test_mode:
     sys.path.insert(0, base_dir)
 
-    import waveshare_epd.epd2in7
-
-    epd = waveshare_epd.epd2in7.EPD()
-    epd.init()
-    EPD_WIDTH = waveshare_epd.epd2in7.EPD_WIDTH
-    EPD_HEIGHT = waveshare_epd.epd2in7.EPD_HEIGHT
-
-# Charge les fonts et les images - Load Images and fonts
-fontExtraSmall = ImageFont.truetype(os.path.join(folder_img, 'FreeMonoBold.ttf'), 10)
-fontSmall = ImageFont.truetype(os.path.join(folder_img, 'FreeMonoBold.ttf'), 12)
-fontMedium = ImageFont.truetype(os.path.join(folder_img, 'FreeMonoBold.ttf'), 14)
-fontBig = ImageFont.truetype(os.path.join(folder_img, 'FreeMonoBold.ttf'), big_height)
-fontExtraBig = ImageFont.truetype(os.path.join(folder_img, 'FreeMonoBold.ttf'), 32)
-
-temperature = Image.open(os.path.join(folder_img, 'temperature.png'))
-humidity = Image.open(os.path.join(folder_img, 'humidity.png'))
-pressure = Image.open(os.path.join(folder_img, 'pressure.png'))
-direction = Image.open(os.path.join(folder_img, 'direction.png'))
-sunrise = Image.open(os.path.join(folder_img, 'sunrise.png'))
-sunset = Image.open(os.path.join(folder_img, 'sunset.png'))
-precip = Image.open(os.path.join(folder_img, 'Rain.png'))
-
-# Resize pictures
-temperature = temperature.resize((icon_height, icon_width))
-humidity = humidity.resize((icon_height, icon_width))
-pressure = pressure.resize((icon_height, icon_width))
-direction = direction.resize((icon_height, icon_width))
-sunrise = sunrise.resize((icon_height, icon_width))
-sunset = sunset.resize((icon_height, icon_width))
-precip = precip.resize((icon_height+10, icon_width+10))
+# the panel, initialized on first use, see panel(); only touched from the display worker
+epd = None
+display = DisplayWorker()
+
+frames = FrameStore(EPD_WIDTH, EPD_HEIGHT)
+frame_server = None
+
+# change detection: hash of the last rendered weather, digest of the frame on
+# the panel and when it was last refreshed (time.monotonic())
+rendered_hash = None
+displayed_digest = None
+refreshed_at = None
+# name of the frame on the panel, for the keys that step through frames
+displayed_frame = None
+refresh_stats = {'rendered': 0, 'render_skipped': 0, 'refreshed': 0, 'refresh_skipped': 0, 'refresh_dropped': 0}
+
+# Layout of the frames, compiled on first use (fonts are loaded then), see frameLayout()
+layout = None
+assets = AssetCache(folder_img)
+
+# seconds from the start of the process: 'startup' until the refresh loop
+# starts, 'first_frame' until the first frame is rendered
+startup_stats = {'startup': None, 'first_frame': None}
 
 TEMP_UNIT = 'C'
 SPEED_UNIT = 'km/h'
 
-UNIT_TYPES = {
-    'si' : {
-        'temp': 'C',
-        'speed': 'km/h'
-    },
-    'uk2' : {
-        'temp': 'C',
-        'speed': 'mi/h'
-    },
-    'us': {
-        'temp': 'F',
-        'speed': 'mi/h'
-    }
-}
-
 def debug(val):
     if DEBUG:
         pprint(val)
 
 
-def findIcon(cond):
-    """
-    clear-day, clear-night, rain, snow, sleet, wind, fog, cloudy, partly-cloudy-day, partly-cloudy-night
-    """
-    # icons Open Source https://github.com/kickstandapps/WeatherIcons
-
-    icon_def = {
-        'clear-day':            'Sun',
-        'clear-night':          'Moon',
-        'rain':                 'Rain',
-        'snow':                 'Snow',
-        'sleet':                'Hail',
-        'wind':                 'wind',
-        'fog':                  'Haze',
-        'cloudy':               'Cloud',
-        'partly-cloudy-day':    'PartlySunny',
-        'partly-cloudy-night':  'PartlyMoon'
-    }
+def startup():
+    """ What the refresh loop needs before its first cycle; the rest is loaded on first use """
+    locale.setlocale(locale.LC_TIME, LOCALE)
+    startup_stats['startup'] = time.perf_counter() - started_at
+    debug('Startup: {:.3f}s'.format(startup_stats['startup']))
+
+
+def frameLayout():
+    global layout
+    if layout is None:
+        layout = loadLayout(
+            os.path.join(base_dir, 'layouts', LAYOUT + '.json'), folder_img,
+            flags=['sensor'] if SENSOR else [],
+            constants={'FORECAST_TITLE': FORECAST_TITLE}
+        )
+    return layout
 
-    if cond in icon_def:
-        return icon_def[cond]
-    else:
-        print('No icon for ', cond)
-        return 'Tornado'
+
+def panel():
+    """ The e-Paper panel, initialized on first use; None in test mode or with NO_PANEL """
+    global epd
+    if epd is None and not (test_mode or NO_PANEL):
+        import waveshare_epd.epd2in7
+
+        epd = waveshare_epd.epd2in7.EPD()
+        if os.environ.get('PARTIAL_THRESHOLD'):
+            epd.partial_threshold = float(os.environ.get('PARTIAL_THRESHOLD'))
+        epd.init()
+    return epd
 
 
 def getWeatherData():
     global TEMP_UNIT
     global SPEED_UNIT
-    global UNIT_TYPES
 
-    from DSweather import fetchDarkSkyWeather
+    from forecast import fetchWeather
+    from acquire import acquireAll, blocking
 
+    # all sources are fetched at the same time, each with its own deadline
+    sources = {'forecast': (blocking(fetchWeather), WEATHER_DEADLINE)}
     if SENSOR:
         from TSfetch import fetchThingSpeak
-        ts_data = fetchThingSpeak()
-        debug(ts_data)
-
-    current, daily = fetchDarkSkyWeather()
-
-    unit_type = current['units']
-    if unit_type in UNIT_TYPES:
-        TEMP_UNIT = UNIT_TYPES[unit_type]['temp']
-        SPEED_UNIT = UNIT_TYPES[unit_type]['speed']
-
-    weather = {
-        'conditiontxt': current['summary'],
-        'condition': findIcon(current['icon']),
-        'sunRise': daily[0]['sunrise_time'],
-        'sunSet': daily[0]['sunset_time'],
-        'pressure': current['pressure'],
-        'humidity': current['humidity'],
-        'precip': current['precip_probability'],
-        'tempMin': str(daily[0]['temperature_min']),
-        'tempMax': str(daily[0]['temperature_max']),
-        'windSpeed': current['wind_speed'],
-        'windDir': str(current['wind_bearing']),
-        'windDirTxt': str(current['wind_direction']),
-        'conditionDay1': findIcon(daily[0]['icon']),
-        'conditionDay2': findIcon(daily[1]['icon']),
-        'conditionDay3': findIcon(daily[2]['icon']),
-        'conditionDay4': findIcon(daily[3]['icon']),
-        'condDay1Txt': daily[0]['summary'],
-        'condDay2Txt': daily[1]['summary'],
-        'condDay3Txt': daily[2]['summary'],
-        'condDay4Txt': daily[3]['summary'],
-        'tempMinDay1': str(daily[0]['temperature_min']),
-        'tempMinDay2': str(daily[1]['temperature_min']),
-        'tempMinDay3': str(daily[2]['temperature_min']),
-        'tempMinDay4': str(daily[3]['temperature_min']),
-        'tempMaxDay1': str(daily[0]['temperature_max']),
-        'tempMaxDay2': str(daily[1]['temperature_max']),
-        'tempMaxDay3': str(daily[2]['temperature_max']),
-        'tempMaxDay4': str(daily[3]['temperature_max'])
-    }
-
+        sources['thingspeak'] = (blocking(fetchThingSpeak), TS_DEADLINE)
+
+    results = acquireAll(sources)
+    debug(dict((name, '{:.3f}s'.format(result.elapsed)) for name, result in results.items()))
+    for name, result in results.items():
+        metrics.observe('fetch_seconds', result.elapsed, source=name)
+        # ThingSpeak reports its errors by returning no reading rather than raising them
+        if result.error or result.value is None:
+            metrics.inc('fetch_errors_total', source=name)
+
+    if results['forecast'].error:
+        raise results['forecast'].error
+    current, daily, hourly = results['forecast'].value
+
+    # no sensor, or no reading this time: the forecast temperature is shown
+    sensor = None
     if SENSOR:
-        weather['currTemp'] = str(ts_data['TEMP'])
-        weather['battery'] = str(ts_data['VOLT'])
-    else:
-        weather['currTemp'] = current['temperature']
+        sensor = results['thingspeak'].value
+        if results['thingspeak'].error:
+            print('ThingSpeak: ' + str(results['thingspeak'].error))
+        debug(sensor)
 
-    weather['city'] = 'Budapest'
+    TEMP_UNIT, SPEED_UNIT = unitNames(current.units, (TEMP_UNIT, SPEED_UNIT))
+
+    weather = Weather(current, daily, sensor, hourly)
 
     debug('TIME: ' + str(datetime.now()))
     debug(weather)
-    debug(current)
-    # debug(daily)
     return weather
 
 
+def weatherHash(weather):
+    return framevalues.weatherHash(weather, TEMP_UNIT, SPEED_UNIT)
+
+
 def clearDisplay():
+    global displayed_digest
+    global displayed_frame
     debug('TIME: ' + str(datetime.now()))
     debug('Clear Display')
+    if panel() is None:
+        return
+    sent, busy = epd.bytes_sent, epd.busy_total
     epd.Clear(0xFF)
+    panelMetrics('clear', sent, busy)
+    displayed_digest = displayed_frame = None
 
 
-def displayFrame(frame_name):
+def displayFrame(frame_name, partial=False):
+    global displayed_digest
+    global displayed_frame
+    global refreshed_at
     # clearDisplay()
+    start = time.perf_counter()
     debug('TIME: ' + str(datetime.now()))
-    debug('Displaying ' + frame_name + '.bmp')
-    frame = Image.open(os.path.join(base_dir, frame_name + '.bmp'))
-    epd.display(epd.getbuffer(frame))
+    debug('Displaying ' + frame_name)
+    frame = frames.get(frame_name)
+    if frame is None:
+        debug(frame_name + ' not rendered yet')
+        return
+    debug('Frame ready in {:.1f}ms'.format((time.perf_counter() - start) * 1000))
+    if panel() is None:
+        return
+    from waveshare_epd.epd2in7 import BusyTimeout
+    sent, busy = epd.bytes_sent, epd.busy_total
+    kind = 'full'
+    try:
+        if partial:
+            regions = epd.display_partial(frame.buffer)
+            debug('Refreshed ' + str(regions))
+            if regions != [(0, 0, epd.width, epd.height)]:
+                kind = 'partial'
+        else:
+            epd.display(frame.buffer)
+    except BusyTimeout as e:
+        print(e)
+        metrics.inc('busy_timeouts_total')
+        displayed_digest = displayed_frame = None
+        epd.recover()
+        return
+    panelMetrics(kind, sent, busy)
+    displayed_digest = frame.digest
+    displayed_frame = frame_name
+    refreshed_at = time.monotonic()
+    debug('SPI transfer: {:.3f}s'.format(epd.transfer_time))
+    debug('Busy: ' + ', '.join('{:.3f}s'.format(t) for t in epd.busy_times))
+
+
+def displayNext(*frame_names):
+    """ The frame after the one on the panel out of `frame_names`, the first one otherwise """
+    if displayed_frame in frame_names:
+        following = frame_names[frame_names.index(displayed_frame) + 1:] + frame_names
+    else:
+        following = frame_names
+    # frames that are not rendered (e.g. no hourly forecast) are skipped
+    for frame_name in following:
+        if frames.get(frame_name) is not None:
+            return displayFrame(frame_name)
 
 
-def updateFrame1(weather):
+def panelMetrics(kind, sent, busy):
+    """ Record a panel refresh, `sent` and `busy` are the EPD totals before it """
+    metrics.inc('refreshes_total', kind=kind)
+    metrics.inc('spi_bytes_total', epd.bytes_sent - sent)
+    metrics.observe('spi_transfer_seconds', epd.transfer_time, kind=kind)
+    metrics.observe('busy_seconds', epd.busy_total - busy, kind=kind)
 
-    icon_width = 30
-    row_height = 16
 
-    mask = Image.new('1', (EPD_HEIGHT, EPD_WIDTH), 255)
+def storeFrame(frame_name, mask):
+    with metrics.timer('pack_seconds'):
+        frames.put(frame_name, mask)
+    if startup_stats['first_frame'] is None:
+        startup_stats['first_frame'] = time.perf_counter() - started_at
+        debug('First frame: {:.3f}s'.format(startup_stats['first_frame']))
+    if SAVE_FRAMES:
+        mask.save(os.path.join(base_dir, frame_name + '.bmp'), "bmp")
 
-    draw = ImageDraw.Draw(mask)
 
-    condition = Image.open(os.path.join(folder_img,  weather['condition'] + '.png'))
-    condition = condition.resize((cond_height, cond_width))
-    # draw.rectangle((0, 0, cond_width, cond_height), fill=0)
+def frameValues(weather):
+    """ The weather records plus everything else the layout refers to """
+    return framevalues.frameValues(weather, TEMP_UNIT, SPEED_UNIT)
 
-    mask.paste(condition, (0, 0), condition)
-    # draw.rectangle((cond_width, 0, EPD_HEIGHT, 50), fill=0)
-    # draw.text((cond_width + border * 2, 0), str(weather['currTemp']) + '°C', font=fontExtraBig, fill=1)
-    draw.text((cond_width + border * 2, 0), str(weather['currTemp']) + '°' + TEMP_UNIT, font=fontExtraBig, fill=0)
 
-    condRows = wrap(weather['conditiontxt'], width=14)[:2]
-    draw.text((cond_width + border*2, 47), condRows[0], font=fontBig, fill=0)
-    if len(condRows) == 2:
-        draw.text((cond_width + border*2, 72), condRows[1], font=fontBig, fill=0)
+def renderFrame(frame_name, weather, extra=None):
+    """ Render `frame_name` from the Weather, `extra` holds values only this frame uses """
+    with metrics.timer('render_seconds', frame=frame_name):
+        values = frameValues(weather)
+        if extra:
+            values.update(extra)
+        mask = frameLayout().render(frame_name, values, assets)
 
-    mask.paste(temperature, (border*3, 115), temperature)
-    draw.text((border + icon_width + border * 2, 7 * row_height - 4), str(weather['tempMinDay1']) + '°' + TEMP_UNIT, font=fontMedium, fill=0)
-    draw.text((border + icon_width + border * 2, 8 * row_height - 4), str(weather['tempMaxDay1']) + '°' + TEMP_UNIT, font=fontMedium, fill=0)
+    debug('Update ' + frame_name)
+    storeFrame(frame_name, mask)
 
-    mask.paste(precip, (column1_5, 115), precip)
-    draw.text((column1_5+35, 117), str(weather['precip']) + '%', font=fontMedium, fill=0)
 
-    wind_dir = direction.rotate(float(weather['windDir']))
-    mask.paste(wind_dir, (column2_5, 115), wind_dir)
-    draw.text((column2_5 + 35, 117), weather['windDirTxt'], font=fontMedium, fill=0)
-    draw.text((column2_5, bottom), str(int(weather['windSpeed'])) + SPEED_UNIT, font=fontMedium, fill=0)
+def updateFrame1(weather):
+    renderFrame('frame1', weather)
 
-    draw.line((cond_width, 50, EPD_HEIGHT, 50), fill=0)
-    draw.line((0, cond_height, EPD_HEIGHT, cond_height), fill=0)
-    draw.line((0, bottom + 20, EPD_HEIGHT, bottom + 20), fill=0)
-    draw.line((cond_width, 0, cond_width, cond_height), fill=0)
 
-    refresh_time = time.strftime("%H:%M")
-    refresh_date = time.strftime("%Y-%m-%d")
-    # refresh_date = time.strftime("%Y. %B %-d. %A")
-    draw.text((border, EPD_WIDTH - 18), refresh_date + ' ' + refresh_time, font=fontSmall, fill=0)
-    if SENSOR:
-        draw.text((column3 - border*2, EPD_WIDTH - 18), 'BAT: ' + weather['battery'] + 'V', font=fontSmall, fill=0)
+def updateFrame2(weather):
+    renderFrame('frame2', weather)
 
-    debug('Update frame1')
-    mask.save(os.path.join(base_dir, 'frame1.bmp'), "bmp")
 
+def updateFrame3(weather):
+    renderFrame('frame3', weather)
+    debug('Assets: {} hits, {} misses'.format(assets.hits, assets.misses))
 
-def updateFrame2(weather):
-    mask = Image.new('1', (EPD_HEIGHT, EPD_WIDTH), 255)
-
-    bottom = 138
-    draw = ImageDraw.Draw(mask)
-
-    condition = Image.open(os.path.join(folder_img, weather['condition'] + '.png'))
-    condition = condition.resize((cond_height, cond_width))
-    mask.paste(condition, (0, 0), condition)
-    date = time.strftime("%Y-%m-%d") + "  " + time.strftime("%H:%M")
-    draw.text((cond_width + border*2, 2), date, font=fontMedium, fill=0)
-
-    condRows = wrap(weather['conditiontxt'], width=14)[:2]
-    draw.text((cond_width + border*2, 20), condRows[0], font=fontBig, fill=0)
-    if len(condRows) == 2:
-        draw.text((cond_width + border*2, 40), condRows[1], font=fontBig, fill=0)
-
-    mask.paste(sunrise, (cond_width + border, 70), sunrise)
-    mask.paste(sunset, (cond_width + 90, 70), sunset)
-    draw.text((cond_width + 40, 80), weather['sunRise'], font=fontSmall, fill=0)
-    draw.text((cond_width + 120, 80), weather['sunSet'], font=fontSmall, fill=0)
-
-    wind_dir = direction.rotate(float(weather['windDir']))
-    mask.paste(temperature, (border, 110), temperature)
-    mask.paste(humidity, (column1, 110), humidity)
-    mask.paste(pressure, (column2, 110), pressure)
-    mask.paste(wind_dir, (column3, 110), wind_dir)
-    draw.text((border, bottom), str(weather['currTemp']) + '°' + TEMP_UNIT, font=fontMedium, fill=0)
-    draw.text((column1, bottom), str(weather['humidity']) + '%', font=fontMedium, fill=0)
-    draw.text((column2, bottom), str(weather['pressure']) + 'kPa', font=fontMedium, fill=0)
-    draw.text((column3 + 35, 110), weather['windDirTxt'], font=fontMedium, fill=0)
-    draw.text((column3, bottom), str(int(weather['windSpeed'])) + SPEED_UNIT, font=fontMedium, fill=0)
-
-    # Lines
-    draw.line((0, cond_height, EPD_HEIGHT, cond_height), fill=0)
-    draw.line((0, 140 + 20, EPD_HEIGHT, 140 + 20), fill=0)
-    draw.line((cond_width, 0, cond_width, cond_height), fill=0)
-
-    refresh_time = time.strftime("%H:%M")
-    refresh_date = time.strftime("%Y-%m-%d")
-    # refresh_date = time.strftime("%Y. %B %-d. %A")
-    draw.text((border, EPD_WIDTH - 18), refresh_date + ' ' + refresh_time, font=fontSmall, fill=0)
-    if SENSOR:
-        draw.text((column3 - border*2, EPD_WIDTH - 18), 'BAT: ' + weather['battery'] + 'V', font=fontSmall, fill=0)
 
-    # mask = mask.rotate(90)
+def trendValues():
+    """ The last TREND_HOURS of sensor readings as plot series, with their min/max for the labels """
+    from TSfetch import sensorStore
 
-    debug('Update frame2')
-    mask.save(os.path.join(base_dir, 'frame2.bmp'), "bmp")
+    end = time.time()
+    start = end - TREND_HOURS * 3600
+    readings = sensorStore().readings(start)
+    values = {
+        'tempTrend': (readings.time, readings.temp, start, end),
+        'voltTrend': (readings.time, readings.volt, start, end)
+    }
+    for name, column, spec in (('Temp', readings.temp, '{:.1f}'), ('Volt', readings.volt, '{:.2f}')):
+        present = [value for value in column if value == value]  # NaN is a missing value
+        values['trend' + name + 'Min'] = spec.format(min(present)) if present else '--'
+        values['trend' + name + 'Max'] = spec.format(max(present)) if present else '--'
+    return values
 
 
-def updateFrame3(weather):
-    row_height = 16
-
-    mask = Image.new('1', (EPD_HEIGHT, EPD_WIDTH), 255)
-    draw = ImageDraw.Draw(mask)
-
-    draw.text((border, 0), FORECAST_TITLE, font=fontBig, fill=0)
-    draw.line((0, 2 * border + big_height, EPD_HEIGHT, 2 * border + big_height), fill=0)
-    draw.line((column1, 2 * border + big_height, column1, EPD_WIDTH - 15), fill=0)
-    draw.line((column2, 2 * border + big_height, column2, EPD_WIDTH - 20), fill=0)
-    draw.line((column3, 2 * border + big_height, column3, EPD_WIDTH - 20), fill=0)
-    draw.line((0, EPD_WIDTH - 15, EPD_HEIGHT, EPD_WIDTH - 15), fill=0)
-
-    # Day0
-    date = datetime.now() + timedelta(days=0)
-    draw.text((border, 3 * border + big_height), date.strftime("%A"), font=fontSmall, fill=0)
-    c1 = Image.open(os.path.join(folder_img, weather['conditionDay1'] + '.png'))
-    c1 = c1.resize((icon_height * 2, icon_width * 2))
-    mask.paste(c1, (border, 5 * border + big_height), c1)
-    condTxt = wrap(weather['condDay1Txt'], 10)[:2]
-    prev1 = condTxt[0]
-    if len(condTxt) > 1:
-        prev2 = condTxt[1]
-        draw.text((border, 5 * row_height+3), prev1, font=fontExtraSmall, fill=0)
-        draw.text((border, 6 * row_height+2), prev2, font=fontExtraSmall, fill=0)
-    else:
-        draw.text((border, 6 * row_height+3), prev1, font=fontExtraSmall, fill=0)
-
-    draw.text((border, 7 * row_height+1), str(weather['tempMinDay1']) + '°' + TEMP_UNIT, font=fontMedium, fill=0)
-    draw.text((border, 8 * row_height+2), str(weather['tempMaxDay1']) + '°' + TEMP_UNIT, font=fontMedium, fill=0)
-
-    # Day1
-    date = datetime.now() + timedelta(days=1)
-    draw.text((border + column1, 3 * border + big_height), date.strftime("%A"), font=fontSmall, fill=0)
-    c1 = Image.open(os.path.join(folder_img, weather['conditionDay2'] + '.png'))
-    c1 = c1.resize((icon_height * 2, icon_width * 2))
-    mask.paste(c1, (border + column1, 5 * border + big_height), c1)
-    condTxt = wrap(weather['condDay2Txt'], 10)[:2]
-    prev1 = condTxt[0]
-    if len(condTxt) > 1:
-        prev2 = condTxt[1]
-        draw.text((border + column1, 5 * row_height+3), prev1, font=fontExtraSmall, fill=0)
-        draw.text((border + column1, 6 * row_height+2), prev2, font=fontExtraSmall, fill=0)
-    else:
-        draw.text((border + column1, 6 * row_height+3), prev1, font=fontExtraSmall, fill=0)
-
-    draw.text((border + column1, 7 * row_height+1), str(weather['tempMinDay2']) + '°' + TEMP_UNIT, font=fontMedium, fill=0)
-    draw.text((border + column1, 8 * row_height+2), str(weather['tempMaxDay2']) + '°' + TEMP_UNIT, font=fontMedium, fill=0)
-
-    # Day2
-    date = datetime.now() + timedelta(days=2)
-    draw.text((border + column2, 3 * border + big_height), date.strftime("%A"), font=fontSmall, fill=0)
-    c1 = Image.open(os.path.join(folder_img, weather['conditionDay3'] + '.png'))
-    c1 = c1.resize((icon_height * 2, icon_width * 2))
-    mask.paste(c1, (border + column2, 5 * border + big_height), c1)
-    condTxt = wrap(weather['condDay3Txt'], 10)[:2]
-    prev1 = condTxt[0]
-    if len(condTxt) > 1:
-        prev2 = condTxt[1]
-        draw.text((border + column2, 5 * row_height+3), prev1, font=fontExtraSmall, fill=0)
-        draw.text((border + column2, 6 * row_height+2), prev2, font=fontExtraSmall, fill=0)
+def updateFrame4(weather):
+    renderFrame('frame4', weather, trendValues())
+
+
+def updateFrame5(weather):
+    # not when the hourly forecast is missing or all in the past
+    values = hourlyValues(weather.hourly) if weather.hourly is not None else {}
+    if values:
+        renderFrame('frame5', weather, values)
+
+
+def countCycle(outcome):
+    refresh_stats[outcome] += 1
+    metrics.inc('cycle_outcomes_total', outcome=outcome)
+
+
+def refreshCycle():
+    """ Fetch, render the frames if the weather changed and show frame1 if it looks different """
+    global rendered_hash
+    start = time.perf_counter()
+    # past MAX_REFRESH_AGE everything is redone so the timestamp stays honest
+    expired = refreshed_at is None or time.monotonic() - refreshed_at >= MAX_REFRESH_AGE
+    try:
+        w = getWeatherData()
+    except Exception as e:
+        print(e)
     else:
-        draw.text((border + column2, 6 * row_height+3), prev1, font=fontExtraSmall, fill=0)
-
-    draw.text((border + column2, 7 * row_height+1), str(weather['tempMinDay3']) + '°' + TEMP_UNIT, font=fontMedium, fill=0)
-    draw.text((border + column2, 8 * row_height+2), str(weather['tempMaxDay3']) + '°' + TEMP_UNIT, font=fontMedium, fill=0)
-
-    # Day3
-    date = datetime.now() + timedelta(days=3)
-    draw.text((border + column3, 3 * border + big_height), date.strftime("%A"), font=fontSmall, fill=0)
-    c1 = Image.open(os.path.join(folder_img, weather['conditionDay4'] + '.png'))
-    c1 = c1.resize((icon_height * 2, icon_width * 2))
-    mask.paste(c1, (border + column3, 5 * border + big_height), c1)
-    condTxt = wrap(weather['condDay4Txt'], 10)[:2]
-    prev1 = condTxt[0]
-    if len(condTxt) > 1:
-        prev2 = condTxt[1]
-        draw.text((border + column3, 5 * row_height+3), prev1, font=fontExtraSmall, fill=0)
-        draw.text((border + column3, 6 * row_height+2), prev2, font=fontExtraSmall, fill=0)
+        weather_hash = weatherHash(w)
+        if weather_hash != rendered_hash or expired:
+            updateFrame1(w)
+            updateFrame2(w)
+            updateFrame3(w)
+            if SENSOR:
+                updateFrame4(w)
+            updateFrame5(w)
+            rendered_hash = weather_hash
+            countCycle('rendered')
+        else:
+            countCycle('render_skipped')
+    metrics.observe('cycle_seconds', time.perf_counter() - start)
+    if test_mode or NO_PANEL:
+        metrics.flush()
+        return
+
+    frame = frames.get('frame1')
+    if frame is not None and (frame.digest != displayed_digest or expired):
+        # it gives way to a button press waiting; the metrics line of the
+        # cycle is written once it ran or was dropped
+        job = display.request(cycleDisplay, periodic=True)
+        if job is not None:
+            wait([job])
+            countCycle('refresh_dropped' if job.cancelled() else 'refreshed')
     else:
-        draw.text((border + column3, 6 * row_height+3), prev1, font=fontExtraSmall, fill=0)
+        countCycle('refresh_skipped')
+    metrics.flush()
+    debug(refresh_stats)
+    debug(display.stats)
 
-    draw.text((border + column3, 7 * row_height+1), str(weather['tempMinDay4']) + '°' + TEMP_UNIT, font=fontMedium, fill=0)
-    draw.text((border + column3, 8 * row_height+2), str(weather['tempMaxDay4']) + '°' + TEMP_UNIT, font=fontMedium, fill=0)
 
-    refresh_time = time.strftime("%H:%M")
-    refresh_date = time.strftime("%Y-%m-%d")
-    # refresh_date = time.strftime("%Y. %B %-d. %A")
-    draw.text((border, EPD_WIDTH - 18), refresh_date + ' ' + refresh_time, font=fontSmall, fill=0)
-    if SENSOR:
-        draw.text((column3 - border*2, EPD_WIDTH - 18), 'BAT: ' + weather['battery'] + 'V', font=fontSmall, fill=0)
+def cycleDisplay():
+    displayFrame('frame1', partial=True)
+
+
+def sleepPanel():
+    # only if it was ever woken up
+    if epd is not None:
+        epd.sleep()
 
-    debug('Update frame3')
-    mask.save(os.path.join(base_dir, 'frame3.bmp'), "bmp")
+
+def shutdown():
+    """ Let the panel refresh in progress finish, then put the panel to sleep """
+    debug('Shutting down')
+    if frame_server is not None:
+        frame_server.stop()
+    display.stop(last=sleepPanel)
+
+
+key4_held = False
+
+
+def key4Held():
+    global key4_held
+    key4_held = True
+    display.request(clearDisplay)
+
+
+def key4Released():
+    # a short press shows the trend frame, a hold has already cleared the display
+    global key4_held
+    if not key4_held:
+        display.request(displayFrame, 'frame4')
+    key4_held = False
 
 
 if __name__ == "__main__":
-    if not test_mode:
+    startup()
+
+    if test_mode:
+        refreshCycle()
+        sys.exit(0)
+
+    from scheduler import Scheduler
+
+    if FRAME_SERVER_PORT:
+        from frameserver import FrameServer
+
+        frame_server = FrameServer(frames, FRAME_SERVER_HOST, FRAME_SERVER_PORT)
+        frame_server.start()
+
+    scheduler = Scheduler()
+    if not NO_PANEL:
         from gpiozero import Button
-        from functools import partial
 
         key1 = 5
         key2 = 6
@@ -442,24 +448,20 @@ if __name__ == "__main__":
         for key in keys:
             buttons.append(Button(key))
 
-        for b in range(3):
-            buttons[b].when_pressed = partial(displayFrame, 'frame' + str(b + 1))
-        buttons[3].when_pressed = clearDisplay
-
-    while True:
-        try:
-            w = getWeatherData()
-        # updateFrame1(w)
-        # time.sleep(5)
-        except Exception as e:
-            print(e)
-        else:
-            updateFrame1(w)
-            updateFrame2(w)
-            updateFrame3(w)
-        if test_mode:
-            break
+        # the callbacks run on gpiozero threads, the panel work is queued on
+        # the display worker where a newer press replaces a waiting one
+        for b in range(2):
+            buttons[b].when_pressed = partial(display.request, displayFrame, 'frame' + str(b + 1))
+        # key3: the 4-day forecast, pressed again the next 24 hours
+        buttons[2].when_pressed = partial(display.request, displayNext, 'frame3', 'frame5')
+        if SENSOR:
+            # key4: the sensor trend, held for KEY4_HOLD seconds it clears the display
+            buttons[3].hold_time = KEY4_HOLD
+            buttons[3].when_held = key4Held
+            buttons[3].when_released = key4Released
         else:
-            displayFrame('frame1')
+            buttons[3].when_pressed = partial(display.request, clearDisplay)
 
-        time.sleep(SLEEPTIME)
+    # every SLEEPTIME seconds on the clock, SIGHUP (systemctl reload) refreshes right away
+    scheduler.every(SLEEPTIME, refreshCycle)
+    scheduler.run(on_stop=shutdown)